@@ -18,6 +18,12 @@ import dj_database_url
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# prometheus_client keeps the metrics in files in PROMETHEUS_MULTIPROC_DIR whenever the variable is set, and every
+# request would fail to write them if the directory doesn't exist.  The settings are loaded before timecard/metrics.py
+# imports prometheus_client, so a missing directory falls back to the per process metrics here (gunicorn.conf.py
+# creates it when it starts).
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR') and not os.path.isdir(os.environ['PROMETHEUS_MULTIPROC_DIR']):
+    del os.environ['PROMETHEUS_MULTIPROC_DIR']
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
@@ -49,13 +55,25 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'timecard.metrics.MetricsMiddleware',      # Prometheus metrics for /metrics, see timecard/metrics.py
+    'timecard.sessions.CoalescingSessionMiddleware',  # Writes a session only when it changes, see timecard/sessions.py
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'timecard.routers.ReplicaRoutingMiddleware',   # Read-only pages on the read replicas, see timecard/routers.py
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+# Opt-in per request timing: a Server-Timing header and a JSON log line with the query count and the database,
+# template and view times.  After WhiteNoise, so the static files aren't timed.  See timecard/middleware.py
+if os.environ.get('DJANGO_SERVER_TIMING', '') == 'True':
+    MIDDLEWARE.insert(MIDDLEWARE.index('whitenoise.middleware.WhiteNoiseMiddleware') + 1, 'timecard.middleware.ServerTimingMiddleware')
+# Async read views (timecard/async_views.py) for the ASGI (uvicorn) workers, set by gunicorn.conf.py with
+# GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker.  WhiteNoise is replaced by a subclass that runs without
+# leaving the event loop, see timecard/middleware.py
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', '') == 'True'
+if ASYNC_VIEWS:
+    MIDDLEWARE[MIDDLEWARE.index('whitenoise.middleware.WhiteNoiseMiddleware')] = 'timecard.middleware.AsyncWhiteNoiseMiddleware'
 
 ROOT_URLCONF = 'ccg_hours_project.urls'
 
@@ -74,6 +92,9 @@ TEMPLATES = [
         },
     },
 ]
+if 'timecard.middleware.ServerTimingMiddleware' in MIDDLEWARE:
+    # Adds the template render times to the Server-Timing, see timecard/backends/django_templates.py
+    TEMPLATES[0]['BACKEND'] = 'timecard.backends.django_templates.DjangoTemplates'
 
 WSGI_APPLICATION = 'ccg_hours_project.wsgi.application'
 
@@ -93,6 +114,27 @@ if 'DATABASE_URL' in os.environ:
         conn_max_age=500,
         conn_health_checks=True,
     )
+# SQLite profile: BEGIN IMMEDIATE for the write views and the PRAGMAs set on every connection, see
+# timecard/sqlite_tuning.py.  DJANGO_SQLITE_TUNING=False leaves out the PRAGMAs.
+# The WAL journal is a setting of the database file itself, so it's set once: python manage.py sqlite_journal wal
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['ENGINE'] = 'timecard.backends.sqlite3'
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': 10000,          # Milliseconds a writer waits for the lock at month end
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32000,           # KiB of page cache per connection
+    'temp_store': 'MEMORY',
+} if os.environ.get('DJANGO_SQLITE_TUNING', '') != 'False' else {}
+# Read replicas for the read-only pages, a comma separated list of database URLs, eg:
+#   DATABASE_REPLICA_URLS=postgres://timecard@replica1/timecard,postgres://timecard@replica2/timecard
+# The primary serves a browser for REPLICA_PIN_SECONDS after it writes.  See timecard/routers.py
+for number, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = dj_database_url.parse(url, conn_max_age=500, conn_health_checks=True)
+    DATABASES[f'replica{number}']['TEST'] = {'MIRROR': 'default'}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['timecard.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = 10
 
 
 
@@ -150,9 +192,39 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_REDIRECT_URL = 'login-success'
 LOGOUT_REDIRECT_URL = 'adminview'   # Ok to go here if logged out
 #LOGIN_URL = reverse_lazy('login')
+# Cache used by the sessions and the Period calendar version (timecard/period_calendar.py)
+# The default local memory cache is per process; with several gunicorn workers set a shared cache, eg:
+#   DJANGO_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache DJANGO_CACHE_LOCATION=/var/tmp/ccg_hours_cache
+# See: https://docs.djangoproject.com/en/4.2/topics/cache/
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', ''),
+    }
+}
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
-SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
-SESSION_SAVE_EVERY_REQUEST = True
+# The sessions are small (the login and num_visits), so they can also be kept in the cookie itself:
+#   DJANGO_SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies
+SESSION_ENGINE = os.environ.get('DJANGO_SESSION_ENGINE', 'django.contrib.sessions.backends.cache')
+# Instead of SESSION_SAVE_EVERY_REQUEST, an unchanged session is written once an hour to extend its expiry
+# (timecard.sessions.CoalescingSessionMiddleware), compare with: python manage.py bench_sessions
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_INTERVAL = 60 * 60
+
+# Bearer token the Prometheus scraper sends to /metrics (staff can always see it), see timecard/metrics.py
+METRICS_TOKEN = os.environ.get('DJANGO_METRICS_TOKEN', '')
+
+# Log the timecard app (the timing lines from timecard/middleware.py) to the console, where gunicorn collects it
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'timecard': {'handlers': ['console'], 'level': os.environ.get('DJANGO_TIMECARD_LOG_LEVEL', 'INFO')},
+    },
+}
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'    # Remove when real website with email support is there
 
@@ -19,9 +19,11 @@ from django.urls import include, path
 from django.views.generic import RedirectView, TemplateView
 from django.conf import settings
 from django.conf.urls.static import static
+from timecard.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('timecard/', include('timecard.urls')),
     path('timecard/', include('django.contrib.auth.urls')),
     path('', RedirectView.as_view(url='timecard/', permanent=True)),
@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+
+# gunicorn settings, read from the working directory when gunicorn starts (the Dockerfile's CMD)
+# See: https://docs.gunicorn.org/en/stable/settings.html
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# The sessions, the Period calendar version and the cached fragment versions (timecard/versions.py) must be seen by
+# every worker, and Django's default local memory cache is per process: default to a file based cache shared by the
+# workers.  Set DJANGO_CACHE_BACKEND/DJANGO_CACHE_LOCATION for memcached or redis instead, see when_ready()
+os.environ.setdefault('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache')
+os.environ.setdefault('DJANGO_CACHE_LOCATION', '/tmp/ccg_hours_cache')
+# sync, or uvicorn.workers.UvicornWorker to serve the ASGI application with the async read views
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+if worker_class.startswith('uvicorn.'):
+    wsgi_app = 'ccg_hours_project.asgi:application'
+    os.environ.setdefault('DJANGO_ASYNC_VIEWS', 'True')     # See timecard/async_views.py
+else:
+    wsgi_app = 'ccg_hours_project.wsgi:application'
+
+# Sized from the container's CPUs: 2 workers per CPU + 1, each with a few threads for the requests waiting on the
+# database (the sync worker class becomes gthread with threads > 1, the uvicorn workers ignore threads)
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', '2'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+keepalive = 5
+
+# Restart a worker after about 1000 requests to bound its memory, the jitter keeps the workers from restarting together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+# Load Django once in the master and fork the workers from it, so every worker (including the ones restarted by
+# max_requests) starts with the settings, models, URLconf and templates loaded, see when_ready()
+preload_app = True
+
+accesslog = '-'
+
+_started = time.perf_counter()
+
+# The preloaded application imports timecard/metrics.py before on_starting() runs, and it only goes multiprocess
+# if the directory exists by then
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+def on_starting(server):
+    """Start the Prometheus multiprocess directory empty, the files of the previous run would be added in"""
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+def when_ready(server):
+    """Warm up the preloaded application in the master, before the workers are forked, see timecard/warmup.py"""
+    from django.conf import settings
+    from django.db import connections
+    if server.cfg.workers > 1 and settings.CACHES['default']['BACKEND'].endswith('.LocMemCache'):
+        # Each worker would have its own sessions and cache versions: users logged out, stale cached pages
+        raise RuntimeError('A local memory cache (DJANGO_CACHE_BACKEND) is per worker, use a shared cache with more than one worker')
+    from timecard.warmup import warm_up
+    timings = warm_up(connect=False)
+    connections.close_all()     # Loading the period calendar connected, and a connection can't be shared across a fork
+    server.log.info('Started in %.1f ms, warm up %s', (time.perf_counter() - _started) * 1000, timings)
+
+def post_worker_init(worker):
+    """Connect to the databases before the worker accepts requests"""
+    from timecard.warmup import open_connections
+    started = time.perf_counter()
+    pool = getattr(worker, 'tpool', None)
+    if pool is None:
+        open_connections()
+    else:
+        # gthread serves the requests from its thread pool, and each thread has its own connections: the barrier
+        # holds every task until all of them run, so each one connects a different thread
+        barrier = threading.Barrier(worker.cfg.threads)
+
+        def connect_thread():
+            barrier.wait(timeout=10)
+            open_connections()
+
+        for future in [pool.submit(connect_thread) for _ in range(worker.cfg.threads)]:
+            future.result()
+    worker.log.info('Worker %s connected in %.1f ms', worker.pid, (time.perf_counter() - started) * 1000)
+
+def child_exit(server, worker):
+    """Drop the live gauges of a worker that exited, see timecard/metrics.py"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
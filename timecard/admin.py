@@ -1,10 +1,13 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
 from django import forms
 from django.utils import timezone
 from django.contrib.auth.admin import UserAdmin
 #from django.contrib.auth.models import User
-from .models import ActiveUser, Period, PayrollHours
-from .forms import ActiveUserChangeForm, ActiveUserCreationForm
+from django.db import transaction
+from .models import ActiveUser, Period, PayrollHours, PayrollHoursArchive, PeriodTotals, VacationLedger
+from .forms import ActiveUserChangeForm, ActiveUserCreationForm, PayrollHoursAdminForm
+from .period_generator import calendar_year_months, generate_periods
 
 class ActiveUserAdmin(UserAdmin):
     model = ActiveUser
@@ -50,5 +53,73 @@ class HoursInline(admin.TabularInline):
 #    inlines = [HoursInline]
     
 #admin.site.register(ActiveUsers)   # ActiveUsers was registered using the @admin.register(ActiveUsers) sequence above
-admin.site.register(Period)
-admin.site.register(PayrollHours)
+@admin.register(Period)
+class PeriodAdmin(admin.ModelAdmin):
+    list_display = ('starting_date', 'fiscal_year', 'reporting_date', 'submission_date', 'pay_date', 'archived')
+    list_filter = ('calendar_year', 'fiscal_year', 'archived')
+    actions = ['generate_next_year']
+
+    @admin.action(description='Generate the periods of the year after the selected periods')
+    def generate_next_year(self, request, queryset):
+        """Create the 12 periods of the calendar year following the latest selected period, see period_generator.py"""
+        year = max(period.calendar_year for period in queryset) + 1
+        try:
+            created = generate_periods(calendar_year_months(year))
+        except ValidationError as error:
+            self.message_user(request, '; '.join(error.messages), messages.ERROR)
+            return
+        self.message_user(request, f'Created {len(created)} periods for {year}', messages.SUCCESS)
+
+@admin.register(PayrollHours)
+class PayrollHoursAdmin(admin.ModelAdmin):
+    form = PayrollHoursAdminForm
+
+    def delete_queryset(self, request, queryset):
+        """The bulk delete action skips PayrollHours.delete(), so refresh the period totals and vacation ledgers here"""
+        with transaction.atomic():
+            keys = set(queryset.values_list('user', 'period'))
+            super().delete_queryset(request, queryset)
+            for user_id, period_id in keys:
+                PeriodTotals.refresh(user_id, period_id)
+            VacationLedger.refresh_keys(keys)
+
+@admin.register(PayrollHoursArchive)
+class PayrollHoursArchiveAdmin(admin.ModelAdmin):
+    list_display = ('user', 'date_worked', 'starting_time', 'ending_time', 'minutes', 'vacation_hours', 'employee_submitted')
+    list_filter = ('fiscal_year',)
+    list_select_related = ('user',)
+
+    # Entries are moved in and out by the archive_hours command (see archive.py)
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(PeriodTotals)
+class PeriodTotalsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'period', 'worked_minutes', 'vacation_minutes', 'adjustment_mins', 'entries', 'submitted')
+    list_select_related = ('user', 'period')
+
+    # Totals are maintained by PayrollHours.save()/delete() and the rebuild_period_totals command
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(VacationLedger)
+class VacationLedgerAdmin(admin.ModelAdmin):
+    list_display = ('user', 'fiscal_year', 'allotment_minutes', 'used_minutes', 'remaining_minutes')
+    list_filter = ('fiscal_year',)
+    list_select_related = ('user',)
+
+    # Ledgers are maintained by PayrollHours.save()/delete() and the ActiveUser allotment signal
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class TimecardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'timecard'
+
+    def ready(self):
+        from . import signals  # noqa: F401  Connect the signal receivers
+        from . import sqlite_tuning  # noqa: F401  The SQLite PRAGMAs on connection_created
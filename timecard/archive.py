@@ -0,0 +1,91 @@
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import period_calendar
+from .models import PayrollHours, PayrollHoursArchive, Period
+from .period_generator import fiscal_year_for, fiscal_year_months
+from .sqlite_tuning import immediate_atomic
+
+#
+# Move the PayrollHours entries of closed fiscal years to PayrollHoursArchive and back, so the hot table only holds
+# the current fiscal year.  Used by the archive_hours command.
+#
+# The fiscal year's Periods are flagged archived first, which stops new entries (see PayrollHours.copy_period()).
+# The entries are then moved one period at a time in batches, each batch inserted into one table and deleted from
+# the other in a single transaction, so an entry is always in exactly one of the tables.  An archived period is
+# read from both tables (see queries.period_hours()), so its timecard is complete while a move is running, and a
+# restore clears the flag only after every entry is back in PayrollHours.
+# PeriodTotals and VacationLedger are left alone: the entries are only moved, so their totals don't change.
+#
+
+BATCH_SIZE = 1000
+
+# Every column of PayrollHours, the archive keeps the ids
+ARCHIVE_FIELDS = [
+    'id', 'period_id', 'user_id', 'date_worked', 'starting_time', 'ending_time', 'minutes', 'vacation_hours',
+    'adjustment_mins', 'adjustment_approved', 'employee_submitted', 'fiscal_year', 'period_start',
+]
+
+def current_fiscal_year(today=None):
+    """Returns the fiscal year (FYyy) of today"""
+    today = today or date.today()
+    return fiscal_year_for(today.year, today.month)
+
+def closed_fiscal_years(today=None):
+    """Returns the fiscal years before the current one, in order"""
+    return sorted(set(
+        Period.objects.filter(fiscal_year__lt=current_fiscal_year(today)).values_list('fiscal_year', flat=True)
+    ))
+
+def set_archived(fiscal_year, archived):
+    """Flag or unflag the Periods of a fiscal year, returns them"""
+    with transaction.atomic():
+        Period.objects.filter(fiscal_year=fiscal_year).update(archived=archived)
+        # update() doesn't send post_save, so invalidate the calendar here (see signals.py)
+        period_calendar.invalidate()
+        transaction.on_commit(period_calendar.invalidate)
+    return list(Period.objects.filter(fiscal_year=fiscal_year))
+
+def move_entries(source, target, period, batch_size=BATCH_SIZE, progress=None):
+    """Move a period's entries from the source to the target model in batches, returns the number moved"""
+    moved = 0
+    while True:
+        with immediate_atomic():
+            # The period's foreign key index, ordered by id, finds each batch without scanning the other periods
+            rows = list(source.objects.filter(period=period).order_by('id').values(*ARCHIVE_FIELDS)[:batch_size])
+            if not rows:
+                return moved
+            target.objects.bulk_create([target(**row) for row in rows])
+            # Neither model has dependent rows or delete signals, so this is one DELETE
+            source.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+        if progress:
+            progress(period, moved)
+
+def check_fiscal_year(fiscal_year):
+    """Raises ValidationError if the fiscal year isn't FYyy or has no Periods"""
+    fiscal_year_months(fiscal_year)
+    if not Period.objects.filter(fiscal_year=fiscal_year).exists():
+        raise ValidationError(f'Fiscal year {fiscal_year} has no periods')
+
+def archive_fiscal_year(fiscal_year, batch_size=BATCH_SIZE, today=None, progress=None):
+    """
+    Move the entries of a closed fiscal year to PayrollHoursArchive and return the number moved.
+    Rerunning it finishes an interrupted archive.  Raises ValidationError for the current or a later fiscal year.
+    """
+    check_fiscal_year(fiscal_year)
+    current = current_fiscal_year(today)
+    if fiscal_year >= current:
+        raise ValidationError(f'Fiscal year {fiscal_year} is not closed, only the years before {current} can be archived')
+    periods = set_archived(fiscal_year, True)
+    return sum(move_entries(PayrollHours, PayrollHoursArchive, period, batch_size, progress) for period in periods)
+
+def restore_fiscal_year(fiscal_year, batch_size=BATCH_SIZE, progress=None):
+    """Move the entries of an archived fiscal year back to PayrollHours and return the number moved"""
+    check_fiscal_year(fiscal_year)
+    periods = Period.objects.filter(fiscal_year=fiscal_year)
+    moved = sum(move_entries(PayrollHoursArchive, PayrollHours, period, batch_size, progress) for period in periods)
+    set_archived(fiscal_year, False)
+    return moved
@@ -0,0 +1,115 @@
+import asyncio
+from datetime import date
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count, Max, Sum
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+from django.shortcuts import render
+
+from . import versions
+from .forms import year_month
+from .models import ActiveUser, PeriodTotals
+from .period_calendar import get_calendar
+from .queries import aperiod_totals, period_hours
+from .views import (
+    TIMECARD_ENTRY_FIELDS, activeuser_home_context, conditional_validators, period_list_context, period_list_year,
+    set_validators, timecard_etag, timecard_json,
+)
+
+#
+# Async versions of the read paths, used instead of the views.py ones when DJANGO_ASYNC_VIEWS=True (set by
+# gunicorn.conf.py for the uvicorn workers, see urls.py).  They build the same context with the same helpers, with
+# the independent reads (the user, the totals row, the vacation ledger row, the cached version token) gathered with
+# asyncio.gather.  That doesn't make them concurrent: Django 4.2 runs a request's async ORM and cache calls in one
+# thread (thread sensitive sync_to_async), so they still reach the database one at a time.  The gain is that a
+# request waiting on the database or a slow client doesn't hold a worker thread, so a worker serves many requests at once.  The template is rendered in that thread too, as the hours
+# table fragment (activeuser_detail.html) reads PayrollHours when it's not cached.
+# See: https://docs.djangoproject.com/en/4.2/topics/async/
+#
+
+def async_login_required(view):
+    """login_required for async views, Django 4.2's decorators only wrap sync views"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # request.user is loaded lazily from the session and the database, outside the event loop
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+def async_require_safe(view):
+    """require_safe for async views"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+async def alist(queryset):
+    return [row async for row in queryset]
+
+@async_login_required
+async def Period_list(request, year=None):
+    """Async Period List for a given year"""
+    display_year = period_list_year(year)
+    calendar, period_list_version = await asyncio.gather(
+        sync_to_async(get_calendar)(),      # Reloads the Periods when their version changed, see period_calendar.py
+        versions.aget_version('periods', display_year),
+    )
+    context = period_list_context(calendar, display_year, period_list_version)
+    return await sync_to_async(render)(request, 'timecard/period_list.html', context=context)
+
+@async_login_required
+async def ActiveUser_home(request, pk=None, year=None, month=None):
+    """Async Active User Main Home Screen"""
+    curr_year, curr_month, create_update_ok = year_month(year, month)
+    calendar = await sync_to_async(get_calendar)()
+    curr_period = calendar.period_for_start(date(curr_year, curr_month, 1))
+    if not curr_period:
+        raise Http404("Period doesn't exist, have the manager update the Period list")
+
+    activeuser, totals, hours_version = await asyncio.gather(
+        ActiveUser.objects.aget(pk=pk),
+        aperiod_totals(pk, curr_period),
+        versions.aget_version('hours', pk, curr_period.pk),
+    )
+    context = activeuser_home_context(activeuser, calendar, curr_year, curr_month, curr_period, create_update_ok, totals, hours_version)
+    return await sync_to_async(render)(request, 'timecard/activeuser_detail.html', context=context)
+
+@async_require_safe
+@async_login_required
+async def api_timecard(request, pk=None, year=None, month=None):
+    """Async JSON timecard, see views.api_timecard()"""
+    if request.user.pk == pk:
+        activeuser = request.user
+    elif request.user.is_staff or request.user.is_superuser:
+        try:
+            activeuser = await ActiveUser.objects.aget(pk=pk)
+        except ActiveUser.DoesNotExist:
+            raise Http404('No ActiveUser matches the given query.')
+    else:
+        raise PermissionDenied
+
+    curr_year, curr_month, create_update_ok = year_month(year, month)
+    calendar = await sync_to_async(get_calendar)()
+    curr_period = calendar.period_for_start(date(curr_year, curr_month, 1))
+    if not curr_period:
+        raise Http404("Period doesn't exist")
+
+    marker = await PeriodTotals.objects.filter(user=activeuser, period__fiscal_year=curr_period.fiscal_year).aaggregate(
+        rows=Count('id'), versions=Sum('version'), modified=Max('modified'),
+    )
+    etag, timestamp, response = conditional_validators(
+        request, timecard_etag(activeuser, curr_period, create_update_ok, marker, calendar), marker['modified'],
+    )
+    if response is None:
+        totals, entries = await asyncio.gather(
+            aperiod_totals(activeuser, curr_period),
+            alist(period_hours(activeuser, curr_period, *TIMECARD_ENTRY_FIELDS)),
+        )
+        response = JsonResponse(timecard_json(activeuser, curr_period, create_update_ok, totals, entries))
+    return set_validators(response, etag, timestamp)
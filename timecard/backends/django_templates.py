@@ -0,0 +1,24 @@
+from django.template.backends import django
+
+from timecard.middleware import timed_render
+
+#
+# Django template backend that adds the render time of each template to the request's Server-Timing, see
+# timecard/middleware.py.  settings.py uses it in place of django.template.backends.django.DjangoTemplates with
+# DJANGO_SERVER_TIMING=True.  Only the top level templates are timed, {% include %} renders inside them.
+#
+
+class Template(django.Template):
+    """django.template.backends.django.Template timed while a request is being timed"""
+
+    def render(self, context=None, request=None):
+        return timed_render(super().render, context, request)
+
+class DjangoTemplates(django.DjangoTemplates):
+    """django.template.backends.django.DjangoTemplates returning the timed Template"""
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
@@ -0,0 +1,13 @@
+from django.db.backends.sqlite3 import base
+
+#
+# SQLite backend that can start a transaction with BEGIN IMMEDIATE, see timecard/sqlite_tuning.py immediate_atomic().
+# settings.py uses it in place of django.db.backends.sqlite3.  (Django 5.1 has this as the transaction_mode option.)
+#
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """django.db.backends.sqlite3 with BEGIN IMMEDIATE while begin_immediate is set"""
+    begin_immediate = False
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.begin_immediate else 'BEGIN')
@@ -0,0 +1,92 @@
+import csv
+
+from .models import PayrollHours, PayrollHoursArchive
+from .period_calendar import get_calendar
+
+#
+# Payroll register export: every user's entries for a period (or a fiscal year), followed by a totals row per user.
+# The rows are generated one at a time from QuerySet.iterator(), so memory stays flat however many rows there are.
+# See: https://docs.djangoproject.com/en/4.2/howto/outputting-csv/#streaming-large-csv-files
+#
+
+HEADER = ['Period', 'Fiscal Year', 'Username', 'First Name', 'Last Name', 'Date Worked', 'Starting Time', 'Ending Time',
+          'Minutes', 'Vacation', 'Adjustment Mins', 'Adjustment Approved', 'Submitted']
+
+CHUNK_SIZE = 2000
+
+class Echo:
+    """An object that implements just the write method of the file-like interface"""
+
+    def write(self, value):
+        """Write the value by returning it, instead of storing in a buffer"""
+        return value
+
+def register_entries(period=None, fiscal_year=None):
+    """Returns the PayrollHours for a period or a fiscal year in register order (period, user, date, time)"""
+    # An archived fiscal year is read from the archive, once the archive_hours command has finished with it
+    archived = any(calendar_period.archived for calendar_period in get_calendar().periods
+                   if calendar_period == period or calendar_period.fiscal_year == fiscal_year)
+    query = (PayrollHoursArchive if archived else PayrollHours).objects.select_related('user', 'period')
+    if period is not None:
+        query = query.filter(period=period)
+    if fiscal_year is not None:
+        query = query.filter(fiscal_year=fiscal_year)
+    return query.order_by('period_start', 'user__last_name', 'user__first_name', 'user', 'date_worked', 'starting_time')
+
+def register_rows(entries):
+    """Generate the CSV rows for the entries with a totals row after each user's entries in a period"""
+    yield HEADER
+    totals_key = None
+    totals = None
+    for entry in entries.iterator(chunk_size=CHUNK_SIZE):
+        key = (entry.period_id, entry.user_id)
+        if key != totals_key:
+            if totals:
+                yield totals_row(*totals)
+            totals_key = key
+            totals = [entry, 0, 0, 0]
+        minutes = entry.minutes
+        totals[1] += minutes
+        totals[2] += (minutes if entry.vacation_hours else 0)
+        totals[3] += entry.adjustment_mins
+        yield [
+            entry.period.starting_date.strftime('%Y-%m'),
+            entry.period.fiscal_year,
+            entry.user.username,
+            entry.user.first_name,
+            entry.user.last_name,
+            entry.date_worked.isoformat(),
+            entry.starting_time.strftime('%H:%M'),
+            entry.ending_time.strftime('%H:%M'),
+            minutes,
+            entry.vacation_hours,
+            entry.adjustment_mins,
+            entry.adjustment_approved,
+            entry.employee_submitted,
+        ]
+    if totals:
+        yield totals_row(*totals)
+
+def totals_row(entry, worked_minutes, vacation_minutes, adjustment_mins):
+    """Returns the totals row for a user's period"""
+    return [
+        entry.period.starting_date.strftime('%Y-%m'),
+        entry.period.fiscal_year,
+        entry.user.username,
+        entry.user.first_name,
+        entry.user.last_name,
+        'Total',
+        '',
+        '',
+        worked_minutes,
+        vacation_minutes,
+        adjustment_mins,
+        '',
+        '',
+    ]
+
+def stream_register(period=None, fiscal_year=None):
+    """Generate the payroll register CSV one line at a time"""
+    writer = csv.writer(Echo())
+    for row in register_rows(register_entries(period, fiscal_year)):
+        yield writer.writerow(row)
@@ -2,15 +2,18 @@ import datetime
 from datetime import date, datetime, timedelta
 
 from django import forms
-from django.forms import ModelForm
+from django.forms import ModelForm, BaseModelFormSet, modelformset_factory
 from django.forms.widgets import DateInput, TimeInput, HiddenInput
 
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
-from django.db.models import Q, F, ExpressionWrapper, BigIntegerField, Sum
+from django.db.models import Q
 
-from .models import PayrollHours, ActiveUser, Period
+from .models import PayrollHours, ActiveUser, Period, VacationLedger, clock_minutes
+from .queries import period_time_entries
+from .intervals import TimeEntry, find_violations, overlapping_refs, ENDS_BEFORE_START, OVERLAP
+from .period_calendar import get_calendar
 
 class ActiveUserCreationForm(UserCreationForm):
     
@@ -126,6 +129,13 @@ class PayrollHoursModelForm(ModelForm):
         data = self.cleaned_data['employee_submitted']
         return data
 
+    def saved_entries(self, ph_entry_user, period):
+        """Returns the user's saved entries in the period as TimeEntry's; loaded once per form or per formset"""
+        key = (ph_entry_user.pk, period.pk)
+        if key not in self.hours_cache:
+            self.hours_cache[key] = period_time_entries(ph_entry_user, period)
+        return self.hours_cache[key]
+
     def clean(self):
         """
         clean() form method.  Called after all the field clean-ups are done
@@ -150,11 +160,8 @@ class PayrollHoursModelForm(ModelForm):
             curr_year, curr_month, create_update_ok = year_month(0, 0)
 
             # %%% This doesn't work if the date isn't in the current period
-            query = Period.objects.filter(
-                        starting_date = date(curr_year, curr_month, 1)
-            )
-            if query:
-                period = query.get()
+            period = get_calendar().period_for_start(date(curr_year, curr_month, 1))
+            if period:
                 self.cleaned_data['period'] = period
                 # See: https://stackoverflow.com/questions/25047615/how-to-fill-a-hidden-field-in-a-django-form
                 del self.errors['period']   # This is the error because no period was entered.
@@ -169,40 +176,19 @@ class PayrollHoursModelForm(ModelForm):
         starting_time = cleaned_data.get('starting_time')
         ending_time = cleaned_data.get('ending_time')
         adjustment_mins = cleaned_data.get('adjustment_mins')
-        # Check the entry date vs. the period date
-        try:
-            # Try was added before the if (self.errors) code above.  May no longer be needed as all the fields are valid now
-            if (self.instance.pk):
-                # If modifying an existing entry, leave off the current entry in the query
-                query = PayrollHours.objects.filter(    # Check if time overlaps
-                    ~Q(id = self.instance.pk),  # See: https://docs.djangoproject.com/en/3.2/topics/db/queries/#complex-lookups-with-q-objects
-                    user = ph_entry_user.pk,
-                    period = period,            
-                    date_worked = date_worked,
-                    ending_time__gte = starting_time,
-                    starting_time__lte = ending_time,
-                )
-            else:
-                # If creating a new entry
-                query = PayrollHours.objects.filter(    # Check if time overlaps
-                    user = ph_entry_user.pk,
-                    period = period,            
-                    date_worked = date_worked,
-                    ending_time__gte = starting_time,
-                    starting_time__lte = ending_time,
-                )
-        except:
-            raise ValidationError(_('Query failed; invalid Starting time or Ending time = None'), code='invalid time')
-            
-        if query:
-            # If the query found an overlap
+        # Check the entry against the user's other entries in the period, see intervals.py
+        entry = TimeEntry(ph_entry_user.pk, date_worked, starting_time, ending_time, adjustment_mins, self)
+        saved_entries = [saved for saved in self.saved_entries(ph_entry_user, period) if saved.ref != self.instance.pk]
+        violations = find_violations(saved_entries + [entry])
+        if self in overlapping_refs(violations):
+            # If the entry overlaps other entries
             self.add_error('starting_time', ValidationError(_('Invalid time - time overlaps with other entries'), code='invalid time'))
             self.add_error('ending_time', ValidationError(_('Invalid time - time overlaps with other entries'), code='invalid time'))
             return
 
         if (not adjustment_mins or (adjustment_mins == 0)):
             # Only check if both fields are valid so far
-            if (ending_time <= starting_time):
+            if any(violation.code == ENDS_BEFORE_START and violation.entry.ref is self for violation in violations):
                 ve = ValidationError(_('Invalid time - ending time must be after the starting time'), code='invalid time')
                 self.add_error('ending_time', ve)
                 self.add_error('starting_time', ve)
@@ -218,39 +204,13 @@ class PayrollHoursModelForm(ModelForm):
         
         # Check that the vacation hours don't exceed the alotment
         if (cleaned_data.get('vacation_hours')):
-            if (self.instance.pk):
-                # If modifying an existing entry, leave off the current entry in the query
-                vac_hours_query = PayrollHours.objects.filter(    # Get total FY vacation hours less this entry
-                    ~Q(id = self.instance.pk),  # See: https://docs.djangoproject.com/en/3.2/topics/db/queries/#complex-lookups-with-q-objects
-                    user = ph_entry_user.pk,
-                    period__fiscal_year = period.fiscal_year,
-                    vacation_hours=True,
-                )
-            else:
-                # If creating a new entry, can't query self.instance
-                vac_hours_query = PayrollHours.objects.filter(    # Get total FY vacation hours less this entry
-                    user = ph_entry_user.pk,
-                    period__fiscal_year = period.fiscal_year,
-                    vacation_hours=True,
-                )
-
-            dur_int = vac_hours_query.aggregate(dur=Sum(ExpressionWrapper(F('minutes'), output_field=BigIntegerField())))
-            dur_bigint = (dur_int.get('dur') if dur_int.get('dur') else 0)
-            vac_secs_new = timedelta(hours=ending_time.hour, minutes=ending_time.minute) -\
-                            timedelta(hours=starting_time.hour, minutes=starting_time.minute)
-            vac_new_secs_total = int(vac_secs_new.seconds) + (dur_bigint / 10e5)    # ms -> seconds
-            # Get the active user entry so will have the allocated vacation hours
-            if ( (float(vac_new_secs_total) / (60*60)) > float(ph_entry_user.vacation_hours)):
+            # One row read of the fiscal year balance, see models.VacationLedger
+            try:
+                VacationLedger.check_entry(ph_entry_user, period.fiscal_year,
+                                           clock_minutes(ending_time) - clock_minutes(starting_time), entry=self.instance)
+            except ValidationError as error:
                 # If exceeded allotment for the year
-                vac_hours_new = int(vac_new_secs_total / (60*60))
-                vac_minutes_new = int((vac_new_secs_total / (60)) - (vac_hours_new * 60))
-                self.add_error('vacation_hours', \
-                               ValidationError( \
-                                    _('Total vacation hours (%(vac_hr)s:%(vac_min)s) exceed alotment of %(allotted_hr)s hours'), \
-                                    code='invalid vacation', \
-                                    params = {"vac_hr": str(vac_hours_new), "vac_min": str(vac_minutes_new).zfill(2), "allotted_hr": str(ph_entry_user.vacation_hours)}\
-                               )
-                )
+                self.add_error('vacation_hours', error)
 
     class Meta:
         model = PayrollHours
@@ -263,6 +223,8 @@ class PayrollHoursModelForm(ModelForm):
 #%%%        initial = ['period'] = %%%%
                 
         #see: https://stackoverflow.com/questions/7299973/django-how-to-access-current-request-user-in-modelform        
+        # The saved entries can be shared by the forms of a formset, see BasePayrollHoursFormSet
+        self.hours_cache = kwargs.pop('hours_cache', {})
         if kwargs:
             self.user = kwargs.pop('user')
         
@@ -281,6 +243,100 @@ class PayrollHoursModelForm(ModelForm):
                     #%%% Wrong user if superuser is the one.
                     del self.fields['vacation_hours']
         
+class BasePayrollHoursFormSet(BaseModelFormSet):
+    """
+    Formset for entering a week or period of Payroll Hours at once.
+    Each form is validated by PayrollHoursModelForm.clean() against the saved entries, which the forms
+    share through hours_cache so they are loaded once; clean() below checks the new entries against each other.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hours_cache = {}
+        self.form_kwargs = {**self.form_kwargs, 'hours_cache': self.hours_cache}
+
+    def clean(self):
+        super().clean()
+        if any(self.errors):
+            return      # Only check the entries together once each one is valid by itself
+
+        entries = [form for form in self.forms if form.has_changed() and form.cleaned_data]
+
+        # Check the new entries against each other and the saved entries in one sweep, see intervals.py
+        time_entries = []
+        for key in {(form.cleaned_data['user'].pk, form.cleaned_data['period'].pk) for form in entries}:
+            time_entries += self.hours_cache.get(key, [])
+        for form in entries:
+            time_entries.append(TimeEntry(
+                form.cleaned_data['user'].pk, form.cleaned_data['date_worked'], form.cleaned_data['starting_time'],
+                form.cleaned_data['ending_time'], form.cleaned_data['adjustment_mins'], form,
+            ))
+        overlaps = overlapping_refs(find_violations(time_entries))
+        for form in entries:
+            if form in overlaps:
+                form.add_error('starting_time', ValidationError(_('Invalid time - time overlaps with other entries'), code='invalid time'))
+
+        # Check the new vacation hours together don't exceed the allotment, see models.VacationLedger
+        vac_minutes = {}
+        allotments = {}
+        for form in entries:
+            if not form.cleaned_data.get('vacation_hours'):
+                continue
+            ph_entry_user = form.cleaned_data['user']
+            period = form.cleaned_data['period']
+            key = (ph_entry_user.pk, period.fiscal_year)
+            if key not in vac_minutes:
+                allotments[key], vac_minutes[key] = VacationLedger.balance(ph_entry_user, period.fiscal_year)
+            minutes = clock_minutes(form.cleaned_data['ending_time']) - clock_minutes(form.cleaned_data['starting_time'])
+            try:
+                VacationLedger.add_minutes(allotments[key], vac_minutes[key], minutes)
+            except ValidationError as error:
+                form.add_error('vacation_hours', error)
+            vac_minutes[key] += minutes
+
+class PayrollHoursAdminForm(ModelForm):
+    """Admin change form for Payroll Hours; checks the times against the user's other entries, see intervals.py"""
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if (self.errors):
+            return cleaned_data
+
+        ph_entry_user = cleaned_data['user']
+        entry = TimeEntry(ph_entry_user.pk, cleaned_data['date_worked'], cleaned_data['starting_time'],
+                          cleaned_data['ending_time'], cleaned_data['adjustment_mins'], self)
+        saved_entries = [saved for saved in period_time_entries(ph_entry_user, cleaned_data['period']) if saved.ref != self.instance.pk]
+        for violation in find_violations(saved_entries + [entry]):
+            if violation.code == ENDS_BEFORE_START and violation.entry.ref is self:
+                self.add_error('ending_time', ValidationError(_('Invalid time - ending time must be after the starting time'), code='invalid time'))
+            elif violation.code == OVERLAP and self in (violation.entry.ref, violation.other.ref):
+                self.add_error('starting_time', ValidationError(_('Invalid time - time overlaps with other entries'), code='invalid time'))
+                break
+
+        # The admin saves in the transaction it validates in (ModelAdmin.changeform_view), so the ledger locked here
+        # stays as checked until PayrollHours.save() refreshes it, see models.VacationLedger
+        if cleaned_data['vacation_hours']:
+            minutes = clock_minutes(cleaned_data['ending_time']) - clock_minutes(cleaned_data['starting_time'])
+            try:
+                VacationLedger.check_entry(ph_entry_user, cleaned_data['period'].fiscal_year, minutes, entry=self.instance, lock=True)
+            except ValidationError as error:
+                self.add_error('vacation_hours', error)
+        return cleaned_data
+
+    class Meta:
+        model = PayrollHours
+        exclude = ['minutes']     # Calculated by PayrollHours.save()
+
+# See: https://docs.djangoproject.com/en/4.2/topics/forms/modelforms/#model-formsets
+PayrollHoursFormSet = modelformset_factory(
+    PayrollHours,
+    form=PayrollHoursModelForm,
+    formset=BasePayrollHoursFormSet,
+    extra=7,
+    max_num=62,
+    validate_max=True,
+)
+
 class PeriodModelForm(ModelForm):
     """Make a new or update a Period entry"""
 
@@ -0,0 +1,64 @@
+from collections import namedtuple
+from itertools import groupby
+from operator import attrgetter
+
+#
+# Sweep line checks for Payroll Hours time entries.
+# The entries are sorted by (user, date_worked, starting_time) once, then each day is swept keeping the entry
+# with the latest ending time seen so far, so a whole period is checked in O(n log n) without a query per entry.
+# The overlap rule is the same as the original query in PayrollHoursModelForm.clean():
+#   other.ending_time >= starting_time and other.starting_time <= ending_time   (touching entries overlap)
+#
+
+TimeEntry = namedtuple('TimeEntry', ['user_id', 'date_worked', 'starting_time', 'ending_time', 'adjustment_mins', 'ref'])
+TimeEntry.__doc__ = """A time entry to check; ref is returned in the violations (a form, a PayrollHours pk, a row number, ...)"""
+
+Violation = namedtuple('Violation', ['code', 'entry', 'other'])
+Violation.__doc__ = """A problem with entry; other is the entry it overlaps with (None for an ENDS_BEFORE_START)"""
+
+OVERLAP = 'overlap'
+ENDS_BEFORE_START = 'ends before start'
+
+def time_entry(hours, ref=None):
+    """Returns the TimeEntry for a PayrollHours instance (saved or not)"""
+    return TimeEntry(
+        hours.user_id,
+        hours.date_worked,
+        hours.starting_time,
+        hours.ending_time,
+        hours.adjustment_mins,
+        hours.pk if ref is None else ref,
+    )
+
+_day_key = attrgetter('user_id', 'date_worked')
+_sort_key = attrgetter('user_id', 'date_worked', 'starting_time', 'ending_time')
+
+def find_violations(entries):
+    """
+    Returns the list of Violations in entries:
+      - ENDS_BEFORE_START for an entry (without adjustment minutes) whose ending time is not after the starting time
+      - OVERLAP for each entry that starts before the latest ending entry of the same user and day has ended
+    Every entry that overlaps another one is either the entry or the other of at least one OVERLAP.
+    """
+    violations = []
+    for entry in entries:
+        if not entry.adjustment_mins and entry.ending_time <= entry.starting_time:
+            violations.append(Violation(ENDS_BEFORE_START, entry, None))
+
+    for _, day_entries in groupby(sorted(entries, key=_sort_key), key=_day_key):
+        latest = None   # The entry with the latest ending time so far today
+        for entry in day_entries:
+            if latest is not None and entry.starting_time <= latest.ending_time:
+                violations.append(Violation(OVERLAP, entry, latest))
+            if latest is None or entry.ending_time > latest.ending_time:
+                latest = entry
+    return violations
+
+def overlapping_refs(violations):
+    """Returns the set of refs of the entries involved in an OVERLAP"""
+    refs = set()
+    for violation in violations:
+        if violation.code == OVERLAP:
+            refs.add(violation.entry.ref)
+            refs.add(violation.other.ref)
+    return refs
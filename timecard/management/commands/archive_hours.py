@@ -0,0 +1,46 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from timecard.archive import BATCH_SIZE, archive_fiscal_year, closed_fiscal_years, restore_fiscal_year
+
+#
+# Move the PayrollHours of closed fiscal years to PayrollHoursArchive, or back with --restore, see archive.py
+# Run it from a yearly cron job after the last period of a fiscal year is paid, so PayrollHours only holds the
+# current fiscal year.  An interrupted run is finished by running it again.
+#
+# Usage:
+#   python manage.py archive_hours                      # Archive every fiscal year before the current one
+#   python manage.py archive_hours FY24 --batch-size 500
+#   python manage.py archive_hours --restore FY24       # Move FY24 back to PayrollHours
+#
+
+class Command(BaseCommand):
+    help = 'Move the Payroll Hours of closed fiscal years to the archive table in batched transactions, or restore them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fiscal_year', nargs='*', help='Fiscal years as FYyy (default: every fiscal year before the current one)')
+        parser.add_argument('--restore', action='store_true', help='Move the fiscal years back from the archive to PayrollHours')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Entries moved per transaction')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        fiscal_years = options['fiscal_year']
+        if options['restore'] and not fiscal_years:
+            raise CommandError('Give the fiscal years to restore')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        for fiscal_year in fiscal_years or closed_fiscal_years():
+            try:
+                if options['restore']:
+                    moved = restore_fiscal_year(fiscal_year, options['batch_size'], self.progress)
+                else:
+                    moved = archive_fiscal_year(fiscal_year, options['batch_size'], progress=self.progress)
+            except ValidationError as error:
+                raise CommandError('\n'.join(error.messages))
+            action = 'Restored' if options['restore'] else 'Archived'
+            self.stdout.write(self.style.SUCCESS(f'{action} {moved} entries of {fiscal_year}'))
+
+    def progress(self, period, moved):
+        if self.verbosity > 1:
+            self.stdout.write(f'{period.starting_date:%Y-%m}: {moved} entries moved')
@@ -0,0 +1,91 @@
+import random
+import time as timer
+from datetime import date, time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+
+from timecard.intervals import find_violations, overlapping_refs
+from timecard.models import ActiveUser, Period, PayrollHours
+from timecard.queries import period_time_entries
+
+#
+# Micro-benchmark of the overlap check: one range query per entry (the original PayrollHoursModelForm.clean())
+# against loading the period once and sweeping it (intervals.py).
+# The benchmark data is created in a transaction that is rolled back, so the database is left unchanged.
+#
+# Usage:
+#   python manage.py bench_overlaps --entries 2000
+#
+
+class Command(BaseCommand):
+    help = 'Compare the per-entry overlap query with the sweep line overlap check'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=1000, help='Number of entries in the benchmark period')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the generated entries')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user, period, entries = self.make_entries(options['entries'], options['seed'])
+
+            # Per-entry query, as in the original PayrollHoursModelForm.clean()
+            with CaptureQueriesContext(connection) as queries:
+                started = timer.perf_counter()
+                query_overlaps = {
+                    entry.pk for entry in entries
+                    if PayrollHours.objects.filter(
+                        ~Q(id=entry.pk),
+                        user=user.pk,
+                        period=period,
+                        date_worked=entry.date_worked,
+                        ending_time__gte=entry.starting_time,
+                        starting_time__lte=entry.ending_time,
+                    ).exists()
+                }
+                query_secs = timer.perf_counter() - started
+            query_count = len(queries)
+
+            # Load the period once and sweep it
+            with CaptureQueriesContext(connection) as queries:
+                started = timer.perf_counter()
+                sweep_overlaps = overlapping_refs(find_violations(period_time_entries(user, period)))
+                sweep_secs = timer.perf_counter() - started
+            sweep_count = len(queries)
+
+            transaction.set_rollback(True)
+
+        if query_overlaps != sweep_overlaps:
+            self.stderr.write(self.style.ERROR(f'Results differ: query {len(query_overlaps)} overlaps, sweep {len(sweep_overlaps)}'))
+        self.stdout.write(f'Entries: {len(entries)}  Overlapping entries: {len(sweep_overlaps)}')
+        self.stdout.write(f'Per-entry query: {query_secs * 1000:9.1f} ms {query_count:6d} queries')
+        self.stdout.write(f'Sweep line:      {sweep_secs * 1000:9.1f} ms {sweep_count:6d} queries')
+        if sweep_secs:
+            self.stdout.write(self.style.SUCCESS(f'Speed up: {query_secs / sweep_secs:.1f}x'))
+
+    def make_entries(self, count, seed):
+        """Create a user with count random entries in a benchmark period"""
+        rng = random.Random(seed)
+        user = ActiveUser.objects.create_user(
+            start_date=date(2000, 1, 1), end_date=None, phone_number='000-000-0000',
+            password=None, username='bench_overlaps_user',
+        )
+        starting_date = date(2099, 1, 1)
+        period = Period.objects.create(
+            period_no=1, calendar_year=2099, fiscal_year='FY99', starting_date=starting_date,
+            reporting_date=date(2099, 1, 31), submission_date=date(2099, 2, 2), pay_date=date(2099, 2, 7),
+        )
+        entries = []
+        for _ in range(count):
+            start = rng.randrange(0, 22 * 12) * 5       # 5 minute steps up to 22:00
+            length = rng.randrange(1, 24) * 5
+            entries.append(PayrollHours(
+                user=user, period=period,
+                date_worked=starting_date + timedelta(days=rng.randrange(31)),
+                starting_time=time(start // 60, start % 60),
+                ending_time=time(min(start + length, 23 * 60 + 55) // 60, min(start + length, 23 * 60 + 55) % 60),
+            ))
+        PayrollHours.bulk_add(entries)
+        return user, period, list(PayrollHours.objects.filter(user=user, period=period))
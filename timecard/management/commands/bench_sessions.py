@@ -0,0 +1,135 @@
+import random
+import time as timer
+from datetime import date
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from timecard.management.commands.benchmark import BENCHMARK_STORAGES
+from timecard.models import ActiveUser
+from timecard.period_calendar import get_calendar
+from timecard.period_generator import calendar_year_months, generate_periods
+
+#
+# Count the session store writes of a request mix with each session set up: Django's SESSION_SAVE_EVERY_REQUEST
+# (the previous settings), CoalescingSessionMiddleware with the cache sessions and with the signed cookie sessions
+# (see timecard/sessions.py).  The same seeded mix of page views is replayed for each one.
+# The benchmark data is created in a transaction that is rolled back, so the database is left unchanged.
+#
+# Usage:
+#   python manage.py bench_sessions --users 20 --requests 2000
+#   python manage.py bench_sessions --refresh-interval 1      # Also shows the refresh writes of unchanged sessions
+#
+
+CACHE_ENGINE = 'django.contrib.sessions.backends.cache'
+SIGNED_COOKIES_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+DJANGO_MIDDLEWARE = 'django.contrib.sessions.middleware.SessionMiddleware'
+COALESCING_MIDDLEWARE = 'timecard.sessions.CoalescingSessionMiddleware'
+
+SETUPS = {
+    'save_every_request': (DJANGO_MIDDLEWARE, CACHE_ENGINE, True),
+    'coalescing_cache': (COALESCING_MIDDLEWARE, CACHE_ENGINE, False),
+    'coalescing_signed_cookies': (COALESCING_MIDDLEWARE, SIGNED_COOKIES_ENGINE, False),
+}
+
+# Page views of an employee, by weight; 1 in ADMIN_EVERY requests is the admin's adminview (which counts visits)
+EMPLOYEE_MIX = [('activeuser-home', 6), ('period-list', 2), ('api-timecard', 2)]
+ADMIN_EVERY = 20
+
+def session_middleware(middleware_path):
+    """Returns settings.MIDDLEWARE with the session middleware replaced"""
+    return [
+        middleware_path if path in (DJANGO_MIDDLEWARE, COALESCING_MIDDLEWARE) else path
+        for path in settings.MIDDLEWARE
+    ]
+
+class Command(BaseCommand):
+    help = 'Compare the session store writes of SESSION_SAVE_EVERY_REQUEST and the coalescing session middleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Logged in employees (default 20)')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per set up (default 1000)')
+        parser.add_argument('--refresh-interval', type=int, help='SESSION_REFRESH_INTERVAL in seconds for the run')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the request mix')
+
+    def handle(self, *args, **options):
+        overrides = {'STORAGES': BENCHMARK_STORAGES, 'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+        if options['refresh_interval']:
+            overrides['SESSION_REFRESH_INTERVAL'] = options['refresh_interval']
+
+        with override_settings(**overrides), transaction.atomic():
+            admin, employees, period = self.seed(options['users'])
+            self.stdout.write(f'{options["requests"]} requests, {options["users"]} employees and an admin')
+            self.stdout.write(f'{"Set up":28s} {"Store writes":>12s} {"Set-Cookie":>10s} {"Time":>10s}')
+            for name, setup in SETUPS.items():
+                writes, cookies, secs = self.run_mix(setup, admin, employees, period, options['requests'], options['seed'])
+                self.stdout.write(f'{name:28s} {writes:12d} {cookies:10d} {secs * 1000:8.0f}ms')
+            transaction.set_rollback(True)
+
+    def seed(self, users):
+        """Create the periods of this year, an admin and the employees"""
+        today = date.today()
+        generate_periods(calendar_year_months(today.year))     # Skips the months that already have a period
+        period = get_calendar().period_for_start(date(today.year, today.month, 1))
+        admin = ActiveUser.objects.create(
+            username='bench_sessions_admin', start_date=date(2000, 1, 1), phone_number='+1 000-000-0000',
+            is_staff=True, is_superuser=True,
+        )
+        employees = ActiveUser.objects.bulk_create([
+            ActiveUser(username=f'bench_sessions_{number:05d}', start_date=date(2000, 1, 1), phone_number=f'+1 000-001-{number:04d}')
+            for number in range(users)
+        ])
+        return admin, employees, period
+
+    def run_mix(self, setup, admin, employees, period, requests, seed):
+        """Replay the request mix with a session set up, returns (session store writes, session cookies set, seconds)"""
+        middleware_path, engine_path, save_every_request = setup
+        rng = random.Random(seed)
+        store = import_module(engine_path).SessionStore
+        writes = 0
+        cookies = 0
+
+        with override_settings(MIDDLEWARE=session_middleware(middleware_path), SESSION_ENGINE=engine_path,
+                               SESSION_SAVE_EVERY_REQUEST=save_every_request):
+            # Log everyone in before counting, the login writes are the same for every set up
+            clients = {}
+            for user in [admin, *employees]:
+                clients[user.pk] = Client()
+                clients[user.pk].force_login(user)
+
+            store_save = store.save
+
+            def counted_save(session, *args, **kwargs):
+                nonlocal writes
+                writes += 1
+                return store_save(session, *args, **kwargs)
+
+            store.save = counted_save
+            started = timer.perf_counter()
+            try:
+                names, weights = zip(*EMPLOYEE_MIX)
+                for number in range(requests):
+                    if number % ADMIN_EVERY == 0:
+                        response = clients[admin.pk].get(reverse('adminview'))
+                    else:
+                        employee = rng.choice(employees)
+                        url_name = rng.choices(names, weights)[0]
+                        args = {
+                            'activeuser-home': [employee.pk, period.calendar_year, period.period_no],
+                            'period-list': [period.calendar_year],
+                            'api-timecard': [employee.pk, period.calendar_year, period.period_no],
+                        }[url_name]
+                        response = clients[employee.pk].get(reverse(url_name, args=args))
+                    if response.status_code != 200:
+                        raise CommandError(f'{response.request["PATH_INFO"]} returned {response.status_code}')
+                    if settings.SESSION_COOKIE_NAME in response.cookies:
+                        cookies += 1
+            finally:
+                store.save = store_save
+            secs = timer.perf_counter() - started
+        return writes, cookies, secs
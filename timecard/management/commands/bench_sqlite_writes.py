@@ -0,0 +1,144 @@
+import os
+import statistics
+import threading
+import time as timer
+from datetime import date, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.test.utils import override_settings
+
+from timecard.models import ActiveUser, PayrollHours
+from timecard.period_generator import calendar_year_months, generate_periods
+from timecard.queries import period_totals
+from timecard.sqlite_tuning import immediate_atomic
+
+#
+# Month end on SQLite: --writers threads each save --writes entries the way PayrollHoursCreate does (read the
+# totals, then save) while --readers threads read the totals, first with SQLite's defaults (rollback journal,
+# deferred transactions) and then with the WAL journal, the profile in settings.SQLITE_PRAGMAS and BEGIN IMMEDIATE.
+# Runs on a throw away database file next to db.sqlite3, which is deleted afterwards.
+#
+# Usage:
+#   python manage.py bench_sqlite_writes --writers 8 --writes 50
+#
+
+DEFAULT_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+class Command(BaseCommand):
+    help = 'Compare concurrent SQLite write throughput and lock errors with and without the SQLite profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Threads saving entries (default 8)')
+        parser.add_argument('--writes', type=int, default=50, help='Entries saved by each writer (default 50)')
+        parser.add_argument('--readers', type=int, default=2, help='Threads reading the totals meanwhile (default 2)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The default database is not SQLite')
+        if not settings.SQLITE_PRAGMAS:
+            raise CommandError('settings.SQLITE_PRAGMAS is empty (DJANGO_SQLITE_TUNING=False)')
+
+        connection.settings_dict['TEST']['NAME'] = str(settings.BASE_DIR / 'bench_sqlite_writes.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        test_name = connection.settings_dict['NAME']
+        try:
+            today = date.today()
+            self.period = next(period for period in generate_periods(calendar_year_months(today.year), skip_existing=False)
+                               if period.period_no == today.month)
+            profiles = [
+                ('SQLite defaults', DEFAULT_PRAGMAS, transaction.atomic),
+                ('SQLite profile', {'journal_mode': 'WAL', **settings.SQLITE_PRAGMAS}, immediate_atomic),
+            ]
+            self.stdout.write(f'{options["writers"]} writers x {options["writes"]} entries, {options["readers"]} readers')
+            self.stdout.write(f'{"":16s} {"saved":>6s} {"locked":>7s} {"writes/s":>9s} {"p50 ms":>8s} {"p95 ms":>8s} {"reads/s":>8s} {"locked":>7s}')
+            for number, (name, pragmas, begin) in enumerate(profiles):
+                result = self.run_profile(number, pragmas, begin, options['writers'], options['writes'], options['readers'])
+                self.stdout.write(f'{name:16s} {result["saved"]:6d} {result["locked"]:7d} {result["writes_per_sec"]:9.1f} '
+                                  f'{result["p50_ms"]:8.1f} {result["p95_ms"]:8.1f} {result["reads_per_sec"]:8.1f} {result["reads_locked"]:7d}')
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(test_name + suffix):
+                    os.remove(test_name + suffix)
+
+    def run_profile(self, number, pragmas, begin, writers, writes, readers):
+        """Run the writers and readers with the PRAGMAs and transaction start, returns the counts and timings"""
+        users = ActiveUser.objects.bulk_create([
+            ActiveUser(username=f'bench_sqlite_{number}_{index}', start_date=date(2000, 1, 1),
+                       phone_number=f'+1 000-{number:03d}-{index:04d}')
+            for index in range(writers)
+        ])
+        latencies = []
+        counts = {'locked': 0, 'reads': 0, 'reads_locked': 0}
+        lock = threading.Lock()
+        writing = threading.Event()
+
+        def write(user):
+            try:
+                for index in range(writes):
+                    day = self.period.starting_date + timedelta(days=index // 20 % 28)
+                    minute = index % 20 * 30 + 6 * 60
+                    entry = PayrollHours(
+                        user=user, period=self.period, date_worked=day,
+                        starting_time=time(minute // 60, minute % 60), ending_time=time(minute // 60, minute % 60 + 20),
+                    )
+                    started = timer.perf_counter()
+                    try:
+                        with begin():
+                            period_totals(user, self.period)    # The form's checks read before the entry is saved
+                            entry.save()
+                        with lock:
+                            latencies.append((timer.perf_counter() - started) * 1000)
+                    except OperationalError as e:
+                        if 'locked' not in str(e):
+                            raise
+                        with lock:
+                            counts['locked'] += 1
+            finally:
+                connection.close()
+
+        def read():
+            try:
+                while writing.is_set():
+                    try:
+                        period_totals(users[0], self.period)
+                        key = 'reads'
+                    except OperationalError as e:
+                        if 'locked' not in str(e):
+                            raise
+                        key = 'reads_locked'
+                    with lock:
+                        counts[key] += 1
+            finally:
+                connection.close()
+
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            connection.close()      # The threads' new connections get the PRAGMAs
+            writing.set()
+            threads = [threading.Thread(target=read) for _ in range(readers)]
+            for thread in threads:
+                thread.start()
+            started = timer.perf_counter()
+            write_threads = [threading.Thread(target=write, args=[user]) for user in users]
+            for thread in write_threads:
+                thread.start()
+            for thread in write_threads:
+                thread.join()
+            secs = timer.perf_counter() - started
+            writing.clear()
+            for thread in threads:
+                thread.join()
+            connection.close()
+
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else [0.0] * 99
+        return {
+            'saved': len(latencies),
+            'locked': counts['locked'],
+            'writes_per_sec': len(latencies) / secs,
+            'p50_ms': cuts[49],
+            'p95_ms': cuts[94],
+            'reads_per_sec': counts['reads'] / secs,
+            'reads_locked': counts['reads_locked'],
+        }
@@ -0,0 +1,43 @@
+import sys
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from timecard.exports import stream_register
+from timecard.period_calendar import get_calendar
+
+#
+# Export the payroll register as CSV, see exports.py
+#
+# Usage:
+#   python manage.py export_hours --period 2024-01 > payroll_2024_01.csv
+#   python manage.py export_hours --fiscal-year FY24 --output payroll_FY24.csv
+#
+
+class Command(BaseCommand):
+    help = 'Export the payroll register for a period or a fiscal year as CSV'
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument('--period', help='Period starting month as YYYY-MM')
+        group.add_argument('--fiscal-year', help='Fiscal year as FYyy')
+        parser.add_argument('--output', help='CSV file to write (default: stdout)')
+
+    def handle(self, *args, **options):
+        period = None
+        if options['period']:
+            try:
+                starting_date = datetime.strptime(options['period'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--period must be YYYY-MM')
+            period = get_calendar().period_for_start(starting_date)
+            if not period:
+                raise CommandError(f'No period starts on {starting_date}')
+
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for line in stream_register(period=period, fiscal_year=options['fiscal_year']):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
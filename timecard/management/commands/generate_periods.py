@@ -0,0 +1,71 @@
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from timecard.period_generator import (
+    DEFAULT_RULES, PeriodRules, calendar_year_months, default_holidays, fiscal_year_months, generate_periods,
+)
+
+#
+# Generate the Periods for calendar or fiscal years, see period_generator.py
+# Run --ahead from a monthly cron job so the next years always exist before the month rolls over.
+#
+# Usage:
+#   python manage.py generate_periods --year 2027
+#   python manage.py generate_periods --fiscal-year FY28 --pay-offset 4 --holiday 2027-12-31
+#   python manage.py generate_periods --ahead 2      # This calendar year and the next 2
+#
+
+def parse_time(value):
+    return datetime.strptime(value, '%H:%M').time()
+
+class Command(BaseCommand):
+    help = 'Generate the 12 Periods of calendar or fiscal years with one bulk insert, skipping the existing ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, action='append', default=[], help='Calendar year to generate (repeatable)')
+        parser.add_argument('--fiscal-year', action='append', default=[], help='Fiscal year as FYyy to generate (repeatable)')
+        parser.add_argument('--ahead', type=int, help='Generate this calendar year and the given number of years ahead')
+        parser.add_argument('--reporting-offset', type=int, default=DEFAULT_RULES.reporting_offset,
+                            help='Business days after the month end for the reporting date')
+        parser.add_argument('--submission-offset', type=int, default=DEFAULT_RULES.submission_offset,
+                            help='Business days after the month end for the submission date')
+        parser.add_argument('--submission-time', type=parse_time, default=DEFAULT_RULES.submission_time, help='Submission time as HH:MM')
+        parser.add_argument('--pay-offset', type=int, default=DEFAULT_RULES.pay_offset,
+                            help='Business days after the month end for the pay date')
+        parser.add_argument('--pay-time', type=parse_time, default=DEFAULT_RULES.pay_time, help='Pay time as HH:MM')
+        parser.add_argument('--holiday', type=date.fromisoformat, action='append', default=[],
+                            help='Non business day as YYYY-MM-DD, added to settings.TIMECARD_HOLIDAYS (repeatable)')
+
+    def handle(self, *args, **options):
+        years = list(options['year'])
+        if options['ahead'] is not None:
+            this_year = date.today().year
+            years += range(this_year, this_year + options['ahead'] + 1)
+        if not years and not options['fiscal_year']:
+            raise CommandError('Give --year, --fiscal-year or --ahead')
+
+        rules = PeriodRules(
+            reporting_offset=options['reporting_offset'],
+            submission_offset=options['submission_offset'],
+            submission_time=options['submission_time'],
+            pay_offset=options['pay_offset'],
+            pay_time=options['pay_time'],
+        )
+        try:
+            months = []
+            for year in years:
+                months += calendar_year_months(year)
+            for fiscal_year in options['fiscal_year']:
+                months += fiscal_year_months(fiscal_year)
+            # A month can be in both a calendar and a fiscal year
+            months = sorted(set(months))
+            created = generate_periods(months, rules, default_holidays() | set(options['holiday']))
+        except ValidationError as error:
+            raise CommandError('\n'.join(error.messages))
+
+        for period in created:
+            self.stdout.write(f'{period.starting_date:%Y-%m} {period.fiscal_year}  reporting {period.reporting_date}  '
+                              f'submission {period.submission_date} {period.submission_time:%H:%M}  pay {period.pay_date} {period.pay_time:%H:%M}')
+        self.stdout.write(self.style.SUCCESS(f'Created {len(created)} periods, {len(months) - len(created)} already existed'))
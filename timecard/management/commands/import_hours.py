@@ -0,0 +1,246 @@
+import csv
+import json
+import os
+import time as timer
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from timecard.forms import PayrollHoursModelForm
+from timecard.intervals import TimeEntry, find_violations, OVERLAP
+from timecard.models import ActiveUser, PayrollHours
+from timecard.period_calendar import get_calendar
+
+#
+# Bulk import of historical Payroll Hours from CSV.
+# The file is read one row at a time, users and periods are resolved from maps loaded once, and each row is
+# validated by PayrollHoursModelForm like an entry made in the browser (the date within the period, times in
+# multiples of 5 minutes, zero times on adjustment rows, ...).  The forms share the saved entries of the batch's
+# users and periods, loaded with one query, so a row costs the form's Period lookup (and the vacation balance read
+# of a vacation row).  The batch is then checked with the sweep line engine (intervals.py) against itself and
+# written with PayrollHours.bulk_add() in one transaction.
+# After every committed batch the checkpoint file records the last row, so a failed import is resumed by running
+# the same command again.  If the command dies between a commit and the checkpoint write, the rows of that batch
+# are rejected as overlaps of the saved entries on the rerun, so nothing is imported twice.
+#
+# The columns are the ones written by export_hours (extra columns and the Total rows are ignored):
+#   Username, Date Worked, Starting Time, Ending Time       - required
+#   Period (YYYY-MM, default: the period of Date Worked), Vacation, Adjustment Mins, Adjustment Approved, Submitted
+#
+# Usage:
+#   python manage.py import_hours timecards_2019.csv
+#   python manage.py import_hours timecards_2019.csv --batch-size 5000 --strict
+#   python manage.py import_hours timecards_2019.csv --restart      # Ignore the checkpoint and start from the top
+#
+
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y')
+TIME_FORMATS = ('%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p')
+TRUE_VALUES = {'true', 't', 'yes', 'y', '1', 'x'}
+
+def parse_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f'Invalid date {value!r}')
+
+def parse_time(value):
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format).time()
+        except ValueError:
+            pass
+    raise ValueError(f'Invalid time {value!r}')
+
+def parse_bool(value):
+    return (value or '').strip().lower() in TRUE_VALUES
+
+class Command(BaseCommand):
+    help = 'Import Payroll Hours from a CSV file in batches, resuming from a checkpoint after a failure'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='CSV file to import')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per transaction (default 1000)')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <csv_file>.checkpoint)')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and import from the first row')
+        parser.add_argument('--strict', action='store_true', help='Stop at the first batch with an invalid row')
+
+    def handle(self, *args, **options):
+        self.csv_file = options['csv_file']
+        self.checkpoint_file = options['checkpoint'] or f'{self.csv_file}.checkpoint'
+        self.strict = options['strict']
+        self.verbosity = options['verbosity']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        start_row = 0 if options['restart'] else self.read_checkpoint()
+        if start_row:
+            self.stdout.write(f'Resuming after row {start_row} (see {self.checkpoint_file})')
+
+        self.users = {user.username: user for user in ActiveUser.objects.all()}
+        self.calendar = get_calendar()
+        self.imported = 0
+        self.rejected = 0
+
+        started = timer.perf_counter()
+        row_number = 0
+        try:
+            with open(self.csv_file, newline='', encoding='utf-8-sig') as csv_file:
+                reader = csv.DictReader(csv_file)
+                missing = {'Username', 'Date Worked', 'Starting Time', 'Ending Time'} - set(reader.fieldnames or [])
+                if missing:
+                    raise CommandError(f'Missing columns: {", ".join(sorted(missing))}')
+
+                batch = []
+                for row_number, row in enumerate(reader, start=1):
+                    if row_number <= start_row:
+                        continue
+                    batch.append((row_number, reader.line_num, row))
+                    if len(batch) >= batch_size:
+                        self.import_batch(batch)
+                        batch = []
+                if batch:
+                    self.import_batch(batch)
+        except OSError as error:
+            raise CommandError(f'Cannot read {self.csv_file}: {error}')
+
+        if os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+
+        elapsed = timer.perf_counter() - started
+        rows = max(row_number - start_row, 0)
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {self.imported} entries, rejected {self.rejected} rows, {rows} rows in {elapsed:.1f}s ({rate:.0f} rows/sec)'
+        ))
+
+    def read_checkpoint(self):
+        """Returns the last row committed by a previous run, 0 if there is no checkpoint"""
+        try:
+            with open(self.checkpoint_file) as checkpoint:
+                state = json.load(checkpoint)
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            raise CommandError(f'{self.checkpoint_file} is not a valid checkpoint, remove it or use --restart')
+        if state.get('csv_file') != os.path.abspath(self.csv_file):
+            raise CommandError(f'{self.checkpoint_file} belongs to {state.get("csv_file")}, remove it or use --restart')
+        return state['row']
+
+    def write_checkpoint(self, row_number):
+        """Record the last committed row, replacing the file atomically"""
+        temp_file = f'{self.checkpoint_file}.tmp'
+        with open(temp_file, 'w') as checkpoint:
+            json.dump({'csv_file': os.path.abspath(self.csv_file), 'row': row_number}, checkpoint)
+        os.replace(temp_file, self.checkpoint_file)
+
+    def build_entry(self, row):
+        """Returns the unsaved PayrollHours for a CSV row, raising ValueError if the row is invalid"""
+        user = self.users.get((row['Username'] or '').strip())
+        if user is None:
+            raise ValueError(f'Unknown user {row["Username"]!r}')
+        date_worked = parse_date(row['Date Worked'].strip())
+        if row.get('Period'):
+            period = self.calendar.period_for_start(datetime.strptime(row['Period'].strip() + '-01', '%Y-%m-%d').date())
+        else:
+            period = self.calendar.period_for_date(date_worked)
+        if period is None:
+            raise ValueError(f'No period for {row.get("Period") or date_worked}')
+        return PayrollHours(
+            user=user,
+            period=period,
+            date_worked=date_worked,
+            starting_time=parse_time(row['Starting Time'].strip()),
+            ending_time=parse_time(row['Ending Time'].strip()),
+            vacation_hours=parse_bool(row.get('Vacation')),
+            adjustment_mins=int(row.get('Adjustment Mins') or 0),
+            adjustment_approved=parse_bool(row.get('Adjustment Approved')),
+            employee_submitted=parse_bool(row.get('Submitted')),
+        )
+
+    def form_errors(self, entry, hours_cache):
+        """Returns the errors of PayrollHoursModelForm for an entry, as the entry's user would see them"""
+        form = PayrollHoursModelForm(
+            {
+                'user': entry.user_id,
+                'period': entry.period_id,
+                'date_worked': entry.date_worked,
+                'starting_time': entry.starting_time,
+                'ending_time': entry.ending_time,
+                'vacation_hours': entry.vacation_hours,
+                'adjustment_mins': entry.adjustment_mins,
+                'adjustment_approved': entry.adjustment_approved,
+                'employee_submitted': entry.employee_submitted,
+            },
+            initial={'period': entry.period_id},    # The period field is disabled for an employee
+            user=entry.user,
+            hours_cache=hours_cache,
+        )
+        if form.is_valid():
+            return None
+        # The form puts some errors on both times, each message is reported once
+        return '; '.join(dict.fromkeys(message for messages in form.errors.values() for message in messages))
+
+    def import_batch(self, batch):
+        """Validate a batch of (row number, line number, row) and bulk insert the valid entries"""
+        errors = {}
+        entries = {}
+        for row_number, line_number, row in batch:
+            if (row.get('Date Worked') or '').strip() == 'Total':
+                continue
+            try:
+                entries[line_number] = self.build_entry(row)
+            except (ValueError, KeyError, AttributeError) as error:
+                errors[line_number] = str(error)
+
+        # The saved entries of the same users and periods, shared by the forms (see PayrollHoursModelForm.saved_entries())
+        keys = {(entry.user_id, entry.period_id) for entry in entries.values()}
+        saved = PayrollHours.objects.filter(
+            user__in={user_id for user_id, _ in keys}, period__in={period_id for _, period_id in keys},
+        ).order_by().values_list('user_id', 'period_id', 'date_worked', 'starting_time', 'ending_time', 'adjustment_mins', 'pk')
+        hours_cache = {key: [] for key in keys}
+        for user_id, period_id, date_worked, starting_time, ending_time, adjustment_mins, pk in saved:
+            if (user_id, period_id) in keys:
+                hours_cache[user_id, period_id].append(TimeEntry(user_id, date_worked, starting_time, ending_time, adjustment_mins, pk))
+
+        for line_number, entry in entries.items():
+            error = self.form_errors(entry, hours_cache)
+            if error:
+                errors[line_number] = error
+
+        # Sweep the rows the forms passed together with the saved entries, for the overlaps within the batch
+        time_entries = [saved_entry._replace(ref=('saved', saved_entry.ref)) for key in keys for saved_entry in hours_cache[key]]
+        time_entries += [
+            TimeEntry(entry.user_id, entry.date_worked, entry.starting_time, entry.ending_time, entry.adjustment_mins, line_number)
+            for line_number, entry in entries.items() if line_number not in errors
+        ]
+        for violation in find_violations(time_entries):
+            for entry, other in ((violation.entry, violation.other), (violation.other, violation.entry)):
+                if entry is None or not isinstance(entry.ref, int) or entry.ref in errors:
+                    continue
+                if violation.code != OVERLAP:
+                    errors[entry.ref] = 'Ending Time must be after Starting Time'
+                elif isinstance(other.ref, tuple):
+                    errors[entry.ref] = f'Overlaps saved entry {other.ref[1]}'
+                else:
+                    errors[entry.ref] = f'Overlaps line {other.ref}'
+
+        for line_number in sorted(errors):
+            self.stderr.write(f'Line {line_number}: {errors[line_number]}')
+        if errors and self.strict:
+            raise CommandError(f'{len(errors)} invalid rows, fix them and run the command again to resume')
+
+        valid = [entry for line_number, entry in entries.items() if line_number not in errors]
+        try:
+            PayrollHours.bulk_add(valid)
+        except ValidationError as error:
+            # The batch took a vacation ledger past the allotment, see models.VacationLedger
+            raise CommandError(f'Rows {batch[0][0]}-{batch[-1][0]}: {"; ".join(error.messages)}')
+        self.write_checkpoint(batch[-1][0])
+        self.imported += len(valid)
+        self.rejected += len(errors)
+        if self.verbosity > 1:
+            self.stdout.write(f'Row {batch[-1][0]}: {self.imported} imported, {self.rejected} rejected')
@@ -0,0 +1,123 @@
+import json
+import re
+import statistics
+import threading
+import time as timer
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urlsplit
+from urllib.request import HTTPCookieProcessor, Request, build_opener, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+#
+# Load test a running server: log in once, then send --requests GETs over the read paths from --concurrency threads
+# and report the throughput, latency percentiles and errors.  Run it against the sync workers and the ASGI workers
+# with the same options to compare them, eg:
+#   GUNICORN_WORKERS=4 gunicorn
+#   python manage.py loadtest http://127.0.0.1:8000 --username emp --password secret --concurrency 200 --output sync.json
+#   GUNICORN_WORKERS=4 GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn
+#   python manage.py loadtest http://127.0.0.1:8000 --username emp --password secret --concurrency 200 --output asgi.json
+# With several workers the session must be visible to all of them: use a shared cache (DJANGO_CACHE_BACKEND) or
+# DJANGO_SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies for both servers.
+# The default paths are the employee's home page, the period list and the JSON timecard of the current period.
+#
+
+HOME_PATH = re.compile(r'/timecard/activeuser/(\d+)/')
+
+def login(base_url, username, password):
+    """Log in through the login form, returns (Cookie header, path the login redirected to)"""
+    jar = CookieJar()
+    opener = build_opener(HTTPCookieProcessor(jar))
+    login_url = base_url + '/accounts/login/'
+    opener.open(login_url).read()
+    csrftoken = next((cookie.value for cookie in jar if cookie.name == 'csrftoken'), '')
+    data = urlencode({'username': username, 'password': password, 'csrfmiddlewaretoken': csrftoken, 'next': '/timecard/'})
+    response = opener.open(Request(login_url, data.encode(), headers={'Referer': login_url}))
+    response.read()
+    landed = urlsplit(response.geturl()).path
+    if landed.startswith('/accounts/login/'):
+        raise CommandError(f'Could not log in as {username}')
+    return '; '.join(f'{cookie.name}={cookie.value}' for cookie in jar), landed
+
+def summary(latencies, errors, secs):
+    """Returns the request count, throughput and latency percentiles (ms)"""
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'requests_per_sec': round(len(latencies) / secs, 1) if secs else None,
+        'p50_ms': round(cuts[49], 2) if cuts else None,
+        'p95_ms': round(cuts[94], 2) if cuts else None,
+        'p99_ms': round(cuts[98], 2) if cuts else None,
+        'max_ms': round(max(latencies), 2) if latencies else None,
+    }
+
+class Command(BaseCommand):
+    help = 'Load test the read paths of a running server and report the throughput and latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', help='Server to test, eg http://127.0.0.1:8000')
+        parser.add_argument('--username', required=True, help='Employee to log in as')
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--path', action='append', default=[], help='Path to request (repeatable, default the read paths)')
+        parser.add_argument('--concurrency', type=int, default=100, help='Requests in flight (default 100)')
+        parser.add_argument('--requests', type=int, default=2000, help='Total requests (default 2000)')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds before a request counts as an error')
+        parser.add_argument('--output', help='JSON file for the results')
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        cookie, landed = login(base_url, options['username'], options['password'])
+        paths = options['path'] or self.default_paths(landed)
+
+        results = {path: ([], [0]) for path in paths}     # path: (latencies, [errors])
+        lock = threading.Lock()
+
+        def fetch(number):
+            path = paths[number % len(paths)]
+            request = Request(base_url + path, headers={'Cookie': cookie})
+            started = timer.perf_counter()
+            try:
+                with urlopen(request, timeout=options['timeout']) as response:
+                    response.read()
+                ok = True
+            except (HTTPError, URLError, OSError):
+                ok = False
+            elapsed = (timer.perf_counter() - started) * 1000
+            with lock:
+                if ok:
+                    results[path][0].append(elapsed)
+                else:
+                    results[path][1][0] += 1
+
+        started = timer.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(fetch, range(options['requests'])))
+        secs = timer.perf_counter() - started
+
+        all_latencies = [latency for latencies, _ in results.values() for latency in latencies]
+        report = {
+            'base_url': base_url,
+            'concurrency': options['concurrency'],
+            'seconds': round(secs, 2),
+            'total': summary(all_latencies, sum(errors[0] for _, errors in results.values()), secs),
+            'paths': {path: summary(latencies, errors[0], secs) for path, (latencies, errors) in results.items()},
+        }
+        for name, result in [('total', report['total']), *report['paths'].items()]:
+            self.stdout.write(f'{name:48s} {result["requests"]:6d} req {result["errors"]:5d} errors '
+                              f'{result["requests_per_sec"] or 0:8.1f} req/s  p50 {result["p50_ms"] or 0:8.1f} ms  '
+                              f'p95 {result["p95_ms"] or 0:8.1f} ms  p99 {result["p99_ms"] or 0:8.1f} ms')
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(json.dumps(report, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
+
+    def default_paths(self, landed):
+        """The home page the employee landed on after logging in, the period list and the JSON timecard"""
+        match = HOME_PATH.match(landed)
+        if not match:
+            raise CommandError(f'Logged in user landed on {landed}, not an employee home page; give --path')
+        pk = match.group(1)
+        return [f'/timecard/activeuser/{pk}/0/0', f'/timecard/period/0', f'/timecard/api/timecard/{pk}/0/0']
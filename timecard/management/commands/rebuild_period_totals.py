@@ -0,0 +1,102 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from timecard.models import ActiveUser, PayrollHours, PayrollHoursArchive, PeriodTotals, VacationLedger, minutes_sum
+
+#
+# See: https://docs.djangoproject.com/en/4.2/howto/custom-management-commands/
+#
+# Usage:
+#   python manage.py rebuild_period_totals            # Rebuild all of the PeriodTotals and VacationLedger rows from PayrollHours
+#   python manage.py rebuild_period_totals --verify   # Only report the rows that don't match PayrollHours
+#
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify the PeriodTotals and VacationLedger tables from the PayrollHours entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Compare the stored totals with PayrollHours without changing them')
+
+    def expected_totals(self):
+        """Returns {(user_id, period_id): totals} calculated from PayrollHours and the archive with a GROUP BY query each"""
+        expected = {}
+        # A period's entries are in both tables while archive_hours is moving them, so the rows are added up
+        for model in (PayrollHours, PayrollHoursArchive):
+            for row in PeriodTotals.aggregate_hours(model.objects.all()):
+                totals = PeriodTotals.totals_from_row(row)
+                previous = expected.get((row['user'], row['period']), dict.fromkeys(totals, 0))
+                expected[row['user'], row['period']] = {field: previous[field] + value for field, value in totals.items()}
+        return expected
+
+    def expected_ledgers(self):
+        """Returns {(user_id, fiscal_year): vacation minutes used} calculated from PayrollHours and the archive"""
+        used = {}
+        for model in (PayrollHours, PayrollHoursArchive):
+            for row in model.objects.order_by().values('user', 'fiscal_year').annotate(used=minutes_sum(Q(vacation_hours=True))):
+                used[row['user'], row['fiscal_year']] = used.get((row['user'], row['fiscal_year']), 0) + row['used']
+        return used
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            self.verify()
+        else:
+            self.rebuild()
+
+    def rebuild(self):
+        with transaction.atomic():
+            expected = self.expected_totals()
+            # Carry the versions forward so the API ETags (see views.py) never repeat
+            versions = {(row['user'], row['period']): row['version'] for row in PeriodTotals.objects.values('user', 'period', 'version')}
+            PeriodTotals.objects.all().delete()
+            PeriodTotals.objects.bulk_create([
+                PeriodTotals(user_id=user_id, period_id=period_id, version=versions.get((user_id, period_id), 0) + 1, **totals)
+                for (user_id, period_id), totals in expected.items()
+            ], batch_size=1000)
+
+            # The ledgers keep their allotments, only the minutes used are recalculated
+            used = self.expected_ledgers()
+            ledgers = {(ledger.user_id, ledger.fiscal_year): ledger for ledger in VacationLedger.objects.all()}
+            allotments = dict(ActiveUser.objects.values_list('pk', 'vacation_hours'))
+            new_ledgers = []
+            for key in used.keys() - ledgers.keys():
+                ledgers[key] = VacationLedger(user_id=key[0], fiscal_year=key[1], allotment_minutes=allotments[key[0]] * 60)
+                new_ledgers.append(ledgers[key])
+            for key, ledger in ledgers.items():
+                ledger.used_minutes = used.get(key, 0)
+                ledger.remaining_minutes = ledger.allotment_minutes - ledger.used_minutes
+            VacationLedger.objects.bulk_update([ledger for ledger in ledgers.values() if ledger.pk],
+                                               ['used_minutes', 'remaining_minutes'], batch_size=1000)
+            VacationLedger.objects.bulk_create(new_ledgers, batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(expected)} period totals and {len(ledgers)} vacation ledgers'))
+
+    def verify(self):
+        expected = self.expected_totals()
+        fields = ['worked_minutes', 'vacation_minutes', 'adjustment_mins', 'entries', 'submitted']
+        stored = {
+            (row['user'], row['period']): {field: row[field] for field in fields}
+            for row in PeriodTotals.objects.values('user', 'period', *fields)
+        }
+
+        empty = dict.fromkeys(fields, 0)
+        mismatches = 0
+        for key in sorted(expected.keys() | stored.keys()):
+            # A stored row of zeros is ok when all the entries were deleted
+            if expected.get(key, empty) != stored.get(key, empty):
+                mismatches += 1
+                self.stdout.write(f'User {key[0]} Period {key[1]}: stored {stored.get(key)} expected {expected.get(key)}')
+
+        used = self.expected_ledgers()
+        ledgers = {
+            (row[0], row[1]): row[2:]
+            for row in VacationLedger.objects.values_list('user', 'fiscal_year', 'allotment_minutes', 'used_minutes', 'remaining_minutes')
+        }
+        for key in sorted(used.keys() | ledgers.keys()):
+            allotment, used_minutes, remaining = ledgers.get(key, (None, 0, None))
+            if used.get(key, 0) != used_minutes or (allotment is not None and remaining != allotment - used_minutes):
+                mismatches += 1
+                self.stdout.write(f'User {key[0]} {key[1]}: ledger used {used_minutes} remaining {remaining} expected used {used.get(key, 0)}')
+
+        if mismatches:
+            raise CommandError(f'{mismatches} period totals or vacation ledgers do not match PayrollHours; run rebuild_period_totals to fix')
+        self.stdout.write(self.style.SUCCESS(f'Verified {len(expected)} period totals and {len(ledgers)} vacation ledgers'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from timecard.sqlite_tuning import set_journal_mode
+
+#
+# Set the journal mode of the SQLite database file, see sqlite_tuning.py
+# The mode is kept in the file, so this is a one time setup step (the Dockerfile runs it on the image's database).
+#
+# Usage:
+#   python manage.py sqlite_journal             # Show the journal mode
+#   python manage.py sqlite_journal wal         # Readers don't wait for the writer
+#   python manage.py sqlite_journal delete      # Back to SQLite's default rollback journal
+#
+
+class Command(BaseCommand):
+    help = 'Show or set the journal mode of the SQLite database file (kept in the file)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('mode', nargs='?', choices=['wal', 'delete'], help='Journal mode to switch to')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias (default "default")')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            self.stdout.write(f'The {options["database"]} database is {connection.vendor}, not SQLite; nothing to do')
+            return
+        if options['mode'] is None:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.stdout.write(f'Journal mode: {cursor.fetchone()[0]}')
+            return
+        mode = set_journal_mode(options['mode'], options['database'])
+        if mode != options['mode']:
+            raise CommandError(f'SQLite kept the {mode} journal mode')
+        self.stdout.write(self.style.SUCCESS(f'Journal mode: {mode}'))
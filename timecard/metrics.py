@@ -0,0 +1,150 @@
+import os
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess, REGISTRY
+from prometheus_client import CONTENT_TYPE_LATEST
+
+#
+# Prometheus metrics for every view, labelled with the resolved URL name (admin views as admin:...) and method.
+# With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR to an empty directory shared by the workers: each
+# process writes its values to mmap files there and /metrics adds them up (see gunicorn.conf.py for the cleanup).
+# Without the variable the values are kept in the process and /metrics serves the default REGISTRY; settings.py
+# unsets it when the directory doesn't exist (eg manage.py runserver or a shell with the Docker environment), as
+# prometheus_client picks the multiprocess values when it's imported if the variable is set at all.
+# See: https://prometheus.github.io/client_python/multiprocess/
+#
+# Month end alert on the 95th percentile, eg:
+#   histogram_quantile(0.95, sum by (le, url_name) (rate(timecard_request_duration_seconds_bucket{url_name=~"activeuser-home|submit-hours"}[5m]))) > 1
+#
+# The middleware works with both the sync (WSGI) and the async (ASGI) request handling.  The queries are counted by
+# an execute_wrapper installed once on every database connection, adding to the counter of the request in
+# _request_queries; the context variable follows the request into the threads the async ORM calls run in.
+#
+
+UNRESOLVED = '<unresolved>'     # 404s and the static files, kept as one label value
+
+def multiprocess_dir():
+    """Returns PROMETHEUS_MULTIPROC_DIR if it names an existing directory, otherwise None"""
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    return directory if directory and os.path.isdir(directory) else None
+
+MULTIPROCESS_DIR = multiprocess_dir()
+
+REQUEST_LATENCY = Histogram(
+    'timecard_request_duration_seconds', 'Request latency', ['url_name', 'method'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'timecard_requests_in_flight', 'Requests being handled', ['url_name', 'method'], multiprocess_mode='livesum',
+)
+DB_QUERIES = Counter('timecard_db_queries', 'Database queries', ['url_name', 'method'])
+REQUEST_ERRORS = Counter('timecard_request_errors', 'Responses with an error status', ['url_name', 'method', 'status'])
+
+_request_queries = ContextVar('timecard_request_queries', default=None)
+
+def count_query(execute, sql, params, many, context):
+    """execute_wrapper counting the queries of the current request"""
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+    return execute(sql, params, many, context)
+
+def install_query_counter(connection):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    install_query_counter(connection)
+
+def url_name(request):
+    """Returns the resolved URL name including the namespace, or UNRESOLVED"""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else UNRESOLVED
+
+class MetricsMiddleware:
+    """Record the latency, in flight requests, query count and errors of every request"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+            self.process_view = self.aprocess_view  # Otherwise Django calls process_view() through a thread
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Connections opened before this module was loaded didn't get the wrapper from connection_created
+        for connection in connections.all(initialized_only=True):
+            install_query_counter(connection)
+        queries, token, started = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.finish(request, token)
+        return self.record(request, response, queries[0], started)
+
+    async def __acall__(self, request):
+        queries, token, started = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.finish(request, token)
+        return self.record(request, response, queries[0], started)
+
+    def start(self, request):
+        """Returns the request's query counter, its context token and the start time"""
+        request._metrics_in_flight = None
+        queries = [0]
+        return queries, _request_queries.set(queries), time.perf_counter()
+
+    def finish(self, request, token):
+        _request_queries.reset(token)
+        # The URL name is only known once the URL is resolved, see process_view()
+        if request._metrics_in_flight is not None:
+            request._metrics_in_flight.dec()
+
+    def record(self, request, response, queries, started):
+        labels = (url_name(request), request.method)
+        REQUEST_LATENCY.labels(*labels).observe(time.perf_counter() - started)
+        if queries:
+            DB_QUERIES.labels(*labels).inc(queries)
+        if response.status_code >= 400:
+            REQUEST_ERRORS.labels(*labels, str(response.status_code)).inc()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_in_flight = REQUESTS_IN_FLIGHT.labels(url_name(request), request.method)
+        request._metrics_in_flight.inc()
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        MetricsMiddleware.process_view(self, request, view_func, view_args, view_kwargs)
+
+def metrics_allowed(request):
+    """Staff, or a scraper sending 'Authorization: Bearer <METRICS_TOKEN>'"""
+    if request.user.is_authenticated and (request.user.is_staff or request.user.is_superuser):
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    return bool(token) and constant_time_compare(authorization, f'Bearer {token}')
+
+def metrics_view(request):
+    """The metrics in the Prometheus text format, added up over the worker processes"""
+    if not metrics_allowed(request):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=MULTIPROCESS_DIR)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,133 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+#
+# Per-request timing, turned on with DJANGO_SERVER_TIMING=True (see settings.py).
+# Every query goes through the connections' execute_wrapper and every template render through the template backend
+# of timecard/backends/django_templates.py, adding to the RequestTiming of the request being served (found through a
+# context variable, so nothing outside a timed request is touched).  The totals are sent back as a
+# Server-Timing header (shown in the browser dev tools) and logged as one JSON line tagged with the URL name.
+# The cost is two perf_counter() calls per query and per template, so it can stay on in production.
+# It only runs in the sync request handling; with the ASGI workers it would put every request through one thread.
+# See: https://docs.djangoproject.com/en/4.2/topics/db/instrumentation/
+#      https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Server-Timing
+#
+
+logger = logging.getLogger('timecard.timing')
+
+_current_timing = ContextVar('timecard_request_timing', default=None)
+
+class RequestTiming:
+    """Query count and time spent in the database, templates and view of one request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_secs = 0.0
+        self.template_secs = 0.0
+        self.view_started = None
+        self.view_secs = 0.0
+
+    def execute(self, execute, sql, params, many, context):
+        """execute_wrapper for the database connections"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_secs += time.perf_counter() - started
+            self.queries += 1
+
+def timed_render(render, context=None, request=None):
+    """Calls a template's render(), adding the render time to the timing of the request being served (if any)"""
+    timing = _current_timing.get()
+    if timing is None:
+        return render(context, request)
+    started = time.perf_counter()
+    try:
+        return render(context, request)
+    finally:
+        timing.template_secs += time.perf_counter() - started
+
+def url_name(request):
+    """Returns the resolved URL name including the namespace (admin:timecard_period_changelist), or None"""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else None
+
+class ServerTimingMiddleware:
+    """Add a Server-Timing header and a timing log line to every response"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = _current_timing.set(timing)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing.execute))
+                response = self.get_response(request)
+        finally:
+            _current_timing.reset(token)
+        total_secs = time.perf_counter() - started
+        if timing.view_started is not None:
+            # The view time includes the database and the template render of a TemplateResponse
+            timing.view_secs = time.perf_counter() - timing.view_started
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timing.db_secs * 1000:.1f};desc="{timing.queries} queries"',
+            f'tpl;dur={timing.template_secs * 1000:.1f}',
+            f'view;dur={timing.view_secs * 1000:.1f}',
+            f'total;dur={total_secs * 1000:.1f}',
+        ])
+        logger.info(json.dumps({
+            'url_name': url_name(request),
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timing.queries,
+            'db_ms': round(timing.db_secs * 1000, 2),
+            'template_ms': round(timing.template_secs * 1000, 2),
+            'view_ms': round(timing.view_secs * 1000, 2),
+            'total_ms': round(total_secs * 1000, 2),
+        }))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _current_timing.get().view_started = time.perf_counter()
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that also runs in the async request handling (settings.py uses it with DJANGO_ASYNC_VIEWS).
+    WhiteNoise 6 is sync only, and Django runs a sync only middleware (and everything below it) in one thread per
+    process, which would serialize the requests of an ASGI worker.  Static files are served from a thread of the
+    default executor, everything else is passed on without leaving the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_period_totals(apps, schema_editor):
+    """Build the PeriodTotals rows for the existing PayrollHours entries"""
+    PayrollHours = apps.get_model('timecard', 'PayrollHours')
+    PeriodTotals = apps.get_model('timecard', 'PeriodTotals')
+    rows = PayrollHours.objects.order_by().values('user', 'period').annotate(
+        worked=models.Sum('minutes'),
+        vacation=models.Sum('minutes', filter=models.Q(vacation_hours=True)),
+        adjustment=models.Sum('adjustment_mins'),
+        entry_count=models.Count('id'),
+        submitted_count=models.Count('id', filter=models.Q(employee_submitted=True)),
+    )
+    PeriodTotals.objects.bulk_create([
+        PeriodTotals(
+            user_id=row['user'],
+            period_id=row['period'],
+            worked_minutes=int(row['worked'].total_seconds() // 60) if row['worked'] else 0,
+            vacation_minutes=int(row['vacation'].total_seconds() // 60) if row['vacation'] else 0,
+            adjustment_mins=row['adjustment'] or 0,
+            entries=row['entry_count'],
+            submitted=row['submitted_count'],
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timecard', '0010_remove_payrollhours_adjustment_hours_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payrollhours',
+            name='date_worked',
+            field=models.DateField(default='10/18/2026'),
+        ),
+        migrations.CreateModel(
+            name='PeriodTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('worked_minutes', models.IntegerField(default=0, help_text='Minutes worked in the period')),
+                ('vacation_minutes', models.IntegerField(default=0, help_text='Vacation minutes taken in the period')),
+                ('adjustment_mins', models.IntegerField(default=0, help_text='Adjustment minutes in the period')),
+                ('entries', models.IntegerField(default=0, help_text='Number of Payroll Hours entries in the period')),
+                ('submitted', models.IntegerField(default=0, help_text='Number of entries the employee has submitted')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='timecard.period')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'period totals',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='periodtotals',
+            constraint=models.UniqueConstraint(fields=('user', 'period'), name='unique_user_period_totals'),
+        ),
+        migrations.RunPython(populate_period_totals, migrations.RunPython.noop),
+    ]
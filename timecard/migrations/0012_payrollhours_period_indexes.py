@@ -0,0 +1,33 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timecard', '0011_periodtotals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payrollhours',
+            index=models.Index(fields=['user', 'period', 'date_worked', 'starting_time', 'ending_time'], name='hours_user_period_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payrollhours',
+            index=models.Index(condition=models.Q(('vacation_hours', True)), fields=['user', 'period', 'minutes'], name='hours_user_vacation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='period',
+            index=models.Index(fields=['starting_date'], name='period_starting_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='period',
+            index=models.Index(fields=['calendar_year', 'starting_date'], name='period_year_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='period',
+            index=models.Index(fields=['fiscal_year', 'period'], name='period_fiscal_year_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timecard', '0012_payrollhours_period_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activeuser',
+            index=models.Index(fields=['last_name', 'id'], name='activeuser_last_name_idx'),
+        ),
+    ]
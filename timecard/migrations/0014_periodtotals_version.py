@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timecard', '0013_activeuser_last_name_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='periodtotals',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, help_text='When the totals were last refreshed'),
+        ),
+        migrations.AddField(
+            model_name='periodtotals',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Incremented every time the totals are refreshed, used for the API ETags'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_vacation_ledger(apps, schema_editor):
+    """Build the VacationLedger rows from the PeriodTotals of each user's fiscal years"""
+    ActiveUser = apps.get_model('timecard', 'ActiveUser')
+    PeriodTotals = apps.get_model('timecard', 'PeriodTotals')
+    VacationLedger = apps.get_model('timecard', 'VacationLedger')
+    allotments = {pk: vacation_hours * 60 for pk, vacation_hours in ActiveUser.objects.values_list('pk', 'vacation_hours')}
+    rows = PeriodTotals.objects.order_by().values('user', 'period__fiscal_year').annotate(used=models.Sum('vacation_minutes'))
+    VacationLedger.objects.bulk_create([
+        VacationLedger(
+            user_id=row['user'],
+            fiscal_year=row['period__fiscal_year'],
+            allotment_minutes=allotments[row['user']],
+            used_minutes=row['used'] or 0,
+            remaining_minutes=allotments[row['user']] - (row['used'] or 0),
+        )
+        for row in rows
+    ])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timecard', '0014_periodtotals_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VacationLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fiscal_year', models.CharField(help_text='Fiscal Year in the format FYyy', max_length=4)),
+                ('allotment_minutes', models.IntegerField(default=0, help_text='Vacation minutes allotted for the fiscal year')),
+                ('used_minutes', models.IntegerField(default=0, help_text='Vacation minutes taken in the fiscal year')),
+                ('remaining_minutes', models.IntegerField(default=0, help_text='Allotment less the vacation minutes taken')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='vacationledger',
+            constraint=models.UniqueConstraint(fields=('user', 'fiscal_year'), name='unique_user_fiscal_year_ledger'),
+        ),
+        migrations.RunPython(populate_vacation_ledger, migrations.RunPython.noop),
+    ]
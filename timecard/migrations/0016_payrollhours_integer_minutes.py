@@ -0,0 +1,67 @@
+# Generated by Django 4.2.6 on 2026-10-18 14:02
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+def clock_minutes(value):
+    return value.hour * 60 + value.minute
+
+def minutes_from_times(apps, schema_editor):
+    """Fill the integer minutes from the starting and ending times, the same as PayrollHours.calc_minutes()"""
+    PayrollHours = apps.get_model('timecard', 'PayrollHours')
+    entries = []
+    for entry in PayrollHours.objects.only('starting_time', 'ending_time').iterator(chunk_size=BATCH_SIZE):
+        entry.integer_minutes = clock_minutes(entry.ending_time) - clock_minutes(entry.starting_time)
+        entries.append(entry)
+        if len(entries) == BATCH_SIZE:
+            PayrollHours.objects.bulk_update(entries, ['integer_minutes'])
+            entries = []
+    PayrollHours.objects.bulk_update(entries, ['integer_minutes'])
+
+def durations_from_minutes(apps, schema_editor):
+    """Fill the DurationField back in from the integer minutes"""
+    PayrollHours = apps.get_model('timecard', 'PayrollHours')
+    entries = []
+    for entry in PayrollHours.objects.only('integer_minutes').iterator(chunk_size=BATCH_SIZE):
+        entry.minutes = timedelta(minutes=entry.integer_minutes)
+        entries.append(entry)
+        if len(entries) == BATCH_SIZE:
+            PayrollHours.objects.bulk_update(entries, ['minutes'])
+            entries = []
+    PayrollHours.objects.bulk_update(entries, ['minutes'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timecard', '0015_vacationledger'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='payrollhours',
+            name='hours_user_vacation_idx',
+        ),
+        migrations.AddField(
+            model_name='payrollhours',
+            name='integer_minutes',
+            field=models.IntegerField(default=0, help_text='Minutes worked, ending_time - starting_time (set by save())'),
+        ),
+        migrations.RunPython(minutes_from_times, durations_from_minutes),
+        migrations.RemoveField(
+            model_name='payrollhours',
+            name='minutes',
+        ),
+        migrations.RenameField(
+            model_name='payrollhours',
+            old_name='integer_minutes',
+            new_name='minutes',
+        ),
+        migrations.AddIndex(
+            model_name='payrollhours',
+            index=models.Index(condition=models.Q(('vacation_hours', True)), fields=['user', 'period', 'minutes'], name='hours_user_vacation_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.6 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+def copy_periods(apps, schema_editor):
+    """Copy each Period's fiscal year and starting date onto its PayrollHours entries, one UPDATE per Period"""
+    Period = apps.get_model('timecard', 'Period')
+    PayrollHours = apps.get_model('timecard', 'PayrollHours')
+    for period in Period.objects.only('fiscal_year', 'starting_date'):
+        PayrollHours.objects.filter(period=period).update(fiscal_year=period.fiscal_year, period_start=period.starting_date)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timecard', '0016_payrollhours_integer_minutes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='payrollhours',
+            name='hours_user_vacation_idx',
+        ),
+        migrations.AddField(
+            model_name='payrollhours',
+            name='fiscal_year',
+            field=models.CharField(default='', editable=False, help_text='Fiscal Year of the period in the format FYyy', max_length=4),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='payrollhours',
+            name='period_start',
+            field=models.DateField(editable=False, help_text='Starting Date of the period', null=True),
+        ),
+        migrations.RunPython(copy_periods, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payrollhours',
+            name='period_start',
+            field=models.DateField(editable=False, help_text='Starting Date of the period'),
+        ),
+        migrations.AddIndex(
+            model_name='payrollhours',
+            index=models.Index(fields=['user', 'fiscal_year', 'vacation_hours', 'minutes'], name='hours_user_fy_vacation_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.6 on 2026-10-18 15:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timecard', '0017_payrollhours_fiscal_year'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='period',
+            name='archived',
+            field=models.BooleanField(default=False, help_text='The entries were moved to PayrollHoursArchive and no more can be added, see archive.py'),
+        ),
+        migrations.CreateModel(
+            name='PayrollHoursArchive',
+            fields=[
+                ('id', models.BigIntegerField(help_text='The id the entry had in PayrollHours', primary_key=True, serialize=False)),
+                ('date_worked', models.DateField()),
+                ('starting_time', models.TimeField()),
+                ('ending_time', models.TimeField()),
+                ('minutes', models.IntegerField(default=0)),
+                ('fiscal_year', models.CharField(max_length=4)),
+                ('period_start', models.DateField()),
+                ('vacation_hours', models.BooleanField(default=False)),
+                ('adjustment_mins', models.IntegerField(default=0)),
+                ('adjustment_approved', models.BooleanField(default=False)),
+                ('employee_submitted', models.BooleanField(default=False)),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, to='timecard.period')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'payroll hours archive',
+                'ordering': ['date_worked', 'starting_time'],
+                'indexes': [models.Index(fields=['user', 'period', 'date_worked', 'starting_time'], name='archive_user_period_date_idx')],
+            },
+        ),
+    ]
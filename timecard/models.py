@@ -1,11 +1,16 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q, Sum, Count
+from django.db.models.functions import Coalesce
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.urls import reverse
 from phone_field import PhoneField
 from django.utils import timezone
 from django.utils.timezone import localtime
+from django.utils.translation import gettext_lazy as _
+from . import versions
 from django.contrib.auth.models import AbstractUser, BaseUserManager, AbstractBaseUser
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 
 # Create your models here.
 class MyUserManager(BaseUserManager):
@@ -70,6 +75,13 @@ class ActiveUser(AbstractUser):
     
     REQUIRED_FIELDS = ['email', 'start_date', 'vacation_hours', 'phone_number']
     
+    # Metadata
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Keyset pagination of the user list, see views.ActiveuserListView
+            models.Index(fields=['last_name', 'id'], name='activeuser_last_name_idx'),
+        ]
+    
     def __str__(self):
         """String for representing the ActiveUser object."""
         return f'{self.first_name} {self.last_name}, Started:{self.start_date}, Phone:{self.phone_number}'
@@ -90,10 +102,19 @@ class Period(models.Model):
     submission_time = models.TimeField(default='13:00:00', help_text='Time when manager needs to submit for paycheck processing')
     pay_date = models.DateField(help_text='Date paycheck is to be received by Employee')
     pay_time = models.TimeField(default = datetime.strptime(f"09:00:00", "%H:%M:%S").time(), help_text = 'Time of day Paycheck is expected')
+    archived = models.BooleanField(default=False, help_text='The entries were moved to PayrollHoursArchive and no more can be added, see archive.py')
         
     # Metadata
     class Meta:
         ordering = ['starting_date']
+        indexes = [
+            # Period lookup by the 1st of the month (ActiveUser_home, PayrollHoursModelForm.clean)
+            models.Index(fields=['starting_date'], name='period_starting_date_idx'),
+            # Period_list for a year in starting_date order, and the distinct year list
+            models.Index(fields=['calendar_year', 'starting_date'], name='period_year_start_idx'),
+            # Fiscal year joins for the vacation totals
+            models.Index(fields=['fiscal_year', 'period'], name='period_fiscal_year_idx'),
+        ]
         
     def __str__(self):
         """String for representing the Period table"""
@@ -104,6 +125,13 @@ class Period(models.Model):
         """Returns the URL to access a detail record for this Period."""
         return reverse('period-list', args=[str(self.period)])    
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the calendar year loaded so the cached period list of a year the Period moved from is refreshed"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_calendar_year = instance.__dict__.get('calendar_year')
+        return instance
+
 class PayrollHours(models.Model):
     """Model represents a Payroll Hour entry"""
     period = models.ForeignKey(Period, default=None, on_delete=models.RESTRICT, null=False)
@@ -111,7 +139,10 @@ class PayrollHours(models.Model):
     date_worked = models.DateField(default=date.today().strftime('%m/%d/%Y'))
     starting_time = models.TimeField(help_text='Starting Time for date_worked')
     ending_time = models.TimeField(help_text='Ending Time + starting_time')  # Must be >starting time
-    minutes = models.DurationField(blank = True, null = True, help_text='Set to Timedelta (hours, minutes) ending_time - starting_time')
+    minutes = models.IntegerField(default=0, help_text='Minutes worked, ending_time - starting_time (set by save())')
+    # Copied from the period by save() so the fiscal year and date range filters don't join Period, see copy_period()
+    fiscal_year = models.CharField(max_length=4, editable=False, help_text='Fiscal Year of the period in the format FYyy')
+    period_start = models.DateField(editable=False, help_text='Starting Date of the period')
     vacation_hours = models.BooleanField(default=False, help_text='Are these vacation hours')
     adjustment_mins = models.IntegerField(default=0, help_text='Adjustment to minutes from previous month')
         # Starting_time and ending time are ignored if adjument_hours is non-zero
@@ -131,9 +162,71 @@ class PayrollHours(models.Model):
 # Moved the following code to forms.py
 #        self.starting_time = self.time_multiple_5mins(self.starting_time)
 #        self.ending_time = self.time_multiple_5mins(self.ending_time)
-        self.minutes = timedelta(hours=self.ending_time.hour, minutes=self.ending_time.minute) -\
-                                timedelta(hours=self.starting_time.hour, minutes=self.starting_time.minute)
-        super().save(*args, **kwargs)
+        self.calc_minutes()
+        self.copy_period()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Keep the period totals and vacation ledger in step with the entry, including the period it was moved from
+            keys = {(self.user_id, self.period_id)}
+            loaded_keys = getattr(self, '_loaded_keys', None)
+            if loaded_keys:
+                keys.add(loaded_keys)
+            for user_id, period_id in keys:
+                PeriodTotals.refresh(user_id, period_id)
+            if self.vacation_hours or getattr(self, '_loaded_vacation', False):
+                VacationLedger.refresh_keys(keys)
+            self._loaded_keys = (self.user_id, self.period_id)
+            self._loaded_vacation = self.vacation_hours
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            PeriodTotals.refresh(self.user_id, self.period_id)
+            if self.vacation_hours:
+                VacationLedger.refresh_keys({(self.user_id, self.period_id)})
+        return deleted
+
+    def calc_minutes(self):
+        """Set minutes to ending_time - starting_time"""
+        self.minutes = clock_minutes(self.ending_time) - clock_minutes(self.starting_time)
+
+    def copy_period(self, period=None):
+        """Set fiscal_year and period_start from the entry's period (signals.py updates them when a Period changes)"""
+        if period is None:
+            period = self.period
+        if period.archived:
+            raise ValidationError({'period': ValidationError(
+                _('Period %(period)s is archived, its hours can no longer be changed'),
+                code='archived period',
+                params={'period': period.starting_date.strftime('%Y-%m')},
+            )})
+        self.fiscal_year = period.fiscal_year
+        self.period_start = period.starting_date
+
+    @classmethod
+    def bulk_add(cls, entries, batch_size=None):
+        """
+        Insert new entries with bulk_create and refresh their period totals in one transaction.
+        bulk_create doesn't call save(), so minutes and the period fields are set here.
+        """
+        periods = Period.objects.in_bulk({entry.period_id for entry in entries})
+        for entry in entries:
+            entry.calc_minutes()
+            entry.copy_period(periods[entry.period_id])
+        with transaction.atomic():
+            created = cls.objects.bulk_create(entries, batch_size=batch_size)
+            for user_id, period_id in {(entry.user_id, entry.period_id) for entry in entries}:
+                PeriodTotals.refresh(user_id, period_id)
+            VacationLedger.refresh_keys({(entry.user_id, entry.period_id) for entry in entries if entry.vacation_hours})
+        return created
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the user, period and vacation flag loaded so save() can refresh the totals the entry moved from"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_keys = (instance.__dict__.get('user_id'), instance.__dict__.get('period_id'))
+        instance._loaded_vacation = instance.__dict__.get('vacation_hours', False)
+        return instance
         
     def __str__(self):
         """String representing the PayrollHours table"""
@@ -147,4 +240,229 @@ class PayrollHours(models.Model):
     # Metadata
     class Meta:
         ordering = ['date_worked','starting_time']
+        indexes = [
+            # A user's entries for a period in display order, the overlap check (date_worked + time range)
+            # and the PeriodTotals refresh all search on this index
+            models.Index(fields=['user', 'period', 'date_worked', 'starting_time', 'ending_time'], name='hours_user_period_date_idx'),
+            # Fiscal year vacation totals (VacationLedger.refresh), minutes makes the sum an index-only scan
+            models.Index(fields=['user', 'fiscal_year', 'vacation_hours', 'minutes'], name='hours_user_fy_vacation_idx'),
+        ]
     
+
+def clock_minutes(value):
+    """Returns a time of day as whole minutes after midnight"""
+    return value.hour * 60 + value.minute
+
+def minutes_sum(filter=None):
+    """Integer sum of the PayrollHours minutes (0 rather than None when no entries match), eg: minutes_sum(Q(vacation_hours=True))"""
+    return Coalesce(Sum('minutes', filter=filter), 0)
+
+class PayrollHoursArchive(models.Model):
+    """
+    Model holds the Payroll Hour entries of the closed fiscal years, moved out of PayrollHours by the archive_hours
+    command.  The fields are those of PayrollHours, declared in the same order (the order of the SELECT columns) and
+    with the same ids, so the two tables can be read together with a UNION (see queries.period_hours()).
+    """
+    id = models.BigIntegerField(primary_key=True, help_text='The id the entry had in PayrollHours')
+    period = models.ForeignKey(Period, on_delete=models.RESTRICT)
+    user = models.ForeignKey(ActiveUser, on_delete=models.RESTRICT)
+    date_worked = models.DateField()
+    starting_time = models.TimeField()
+    ending_time = models.TimeField()
+    minutes = models.IntegerField(default=0)
+    fiscal_year = models.CharField(max_length=4)
+    period_start = models.DateField()
+    vacation_hours = models.BooleanField(default=False)
+    adjustment_mins = models.IntegerField(default=0)
+    adjustment_approved = models.BooleanField(default=False)
+    employee_submitted = models.BooleanField(default=False)
+
+    # Metadata
+    class Meta:
+        ordering = ['date_worked','starting_time']
+        indexes = [
+            # A user's entries for an archived period (ActiveUser_home and the timecard API)
+            models.Index(fields=['user', 'period', 'date_worked', 'starting_time'], name='archive_user_period_date_idx'),
+        ]
+        verbose_name_plural = 'payroll hours archive'
+
+    def __str__(self):
+        """String representing the PayrollHoursArchive table"""
+        return f'Archived Payroll Hours for:{self.user_id} -- Date:{self.date_worked}  Time:{self.starting_time}--{self.ending_time}'
+
+class PeriodTotals(models.Model):
+    """Model holds the totals of a user's Payroll Hours entries for a period, kept up to date by PayrollHours.save()/delete()"""
+    user = models.ForeignKey(ActiveUser, on_delete=models.CASCADE)
+    period = models.ForeignKey(Period, on_delete=models.CASCADE)
+    worked_minutes = models.IntegerField(default=0, help_text='Minutes worked in the period')
+    vacation_minutes = models.IntegerField(default=0, help_text='Vacation minutes taken in the period')
+    adjustment_mins = models.IntegerField(default=0, help_text='Adjustment minutes in the period')
+    entries = models.IntegerField(default=0, help_text='Number of Payroll Hours entries in the period')
+    submitted = models.IntegerField(default=0, help_text='Number of entries the employee has submitted')
+    version = models.PositiveIntegerField(default=0, help_text='Incremented every time the totals are refreshed, used for the API ETags')
+    modified = models.DateTimeField(auto_now=True, help_text='When the totals were last refreshed')
+
+    # Metadata
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period'], name='unique_user_period_totals'),
+        ]
+        verbose_name_plural = 'period totals'
+
+    def __str__(self):
+        """String representing the PeriodTotals table"""
+        return f'Period Totals for:{self.user_id} -- Period:{self.period_id}  Entries:{self.entries}  Submitted:{self.submitted}'
+
+    @staticmethod
+    def aggregate_hours(queryset):
+        """Returns the PayrollHours queryset grouped by user and period with the totals annotated"""
+        # order_by() clears the PayrollHours Meta ordering so it doesn't end up in the GROUP BY
+        return queryset.order_by().values('user', 'period').annotate(
+            worked=minutes_sum(),
+            vacation=minutes_sum(Q(vacation_hours=True)),
+            adjustment=Sum('adjustment_mins'),
+            entry_count=Count('id'),
+            submitted_count=Count('id', filter=Q(employee_submitted=True)),
+        )
+
+    @staticmethod
+    def totals_from_row(row):
+        """Returns the PeriodTotals field values for a row from aggregate_hours()"""
+        return {
+            'worked_minutes': row['worked'],
+            'vacation_minutes': row['vacation'],
+            'adjustment_mins': row['adjustment'] or 0,
+            'entries': row['entry_count'],
+            'submitted': row['submitted_count'],
+        }
+
+    @classmethod
+    def refresh(cls, user_id, period_id):
+        """
+        Recalculates the totals for a user's period from PayrollHours and the archive (a period's entries are in both
+        tables while archive_hours is moving them).  Call inside the transaction that changed the entries.
+        """
+        defaults = {'worked_minutes': 0, 'vacation_minutes': 0, 'adjustment_mins': 0, 'entries': 0, 'submitted': 0}
+        for model in (PayrollHours, PayrollHoursArchive):
+            for row in cls.aggregate_hours(model.objects.filter(user=user_id, period=period_id)):
+                for field, value in cls.totals_from_row(row).items():
+                    defaults[field] += value
+        # Bump the version in the UPDATE itself so concurrent refreshes can't hand out the same version twice
+        updated = cls.objects.filter(user_id=user_id, period_id=period_id).update(
+            version=F('version') + 1, modified=timezone.now(), **defaults)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    cls.objects.create(user_id=user_id, period_id=period_id, version=1, **defaults)
+            except IntegrityError:
+                # Another transaction created the row first
+                cls.objects.filter(user_id=user_id, period_id=period_id).update(
+                    version=F('version') + 1, modified=timezone.now(), **defaults)
+        # Every write of the entries comes through here, so this is where the cached hours table is invalidated
+        versions.bump('hours', user_id, period_id)
+
+class VacationLedger(models.Model):
+    """Model holds a user's vacation balance for a fiscal year, kept up to date by PayrollHours.save()/delete()"""
+    user = models.ForeignKey(ActiveUser, on_delete=models.CASCADE)
+    fiscal_year = models.CharField(max_length=4, help_text='Fiscal Year in the format FYyy')
+    allotment_minutes = models.IntegerField(default=0, help_text='Vacation minutes allotted for the fiscal year')
+    used_minutes = models.IntegerField(default=0, help_text='Vacation minutes taken in the fiscal year')
+    remaining_minutes = models.IntegerField(default=0, help_text='Allotment less the vacation minutes taken')
+
+    # Metadata
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'fiscal_year'], name='unique_user_fiscal_year_ledger'),
+        ]
+
+    def __str__(self):
+        """String representing the VacationLedger table"""
+        return f'Vacation Ledger for:{self.user_id} -- {self.fiscal_year}  Used:{self.used_minutes}  Remaining:{self.remaining_minutes}'
+
+    @classmethod
+    def balance(cls, user, fiscal_year):
+        """Returns (allotment_minutes, used_minutes) for a user's fiscal year with one indexed row read"""
+        row = cls.objects.filter(user=user, fiscal_year=fiscal_year).values_list('allotment_minutes', 'used_minutes').first()
+        if row is None:
+            return user.vacation_hours * 60, 0
+        return row
+
+    @staticmethod
+    def add_minutes(allotment_minutes, used_minutes, minutes):
+        """
+        Returns the vacation minutes used once minutes (less than 0 when entries are taken out) are added to
+        used_minutes, or raises ValidationError if they increase past the allotment.  A change that doesn't add
+        vacation is always allowed, even past an allotment that was reduced.  The forms and refresh() all check this.
+        """
+        new_used = used_minutes + minutes
+        if minutes > 0 and new_used > allotment_minutes:
+            vac_hours_new, vac_minutes_new = divmod(new_used, 60)
+            raise ValidationError(
+                _('Total vacation hours (%(vac_hr)s:%(vac_min)s) exceed alotment of %(allotted_hr)s hours'),
+                code='invalid vacation',
+                params={"vac_hr": str(vac_hours_new), "vac_min": str(vac_minutes_new).zfill(2), "allotted_hr": str(allotment_minutes // 60)},
+            )
+        return new_used
+
+    @classmethod
+    def check_entry(cls, user, fiscal_year, minutes, entry=None, lock=False):
+        """
+        Returns the vacation minutes the user will have used in the fiscal year with a vacation entry of minutes, or
+        raises ValidationError (see add_minutes()).  entry is the saved PayrollHours entry being changed, its vacation
+        in the fiscal year is replaced.  lock reads the ledger with locked(), so it can't change before the entry is saved.
+        """
+        if lock:
+            ledger = cls.locked(user.pk, fiscal_year)
+            allotment_minutes, used_minutes = ledger.allotment_minutes, ledger.used_minutes
+        else:
+            allotment_minutes, used_minutes = cls.balance(user, fiscal_year)
+        if (entry is not None and entry.pk and entry.vacation_hours and entry.user_id == user.pk
+                and entry.fiscal_year == fiscal_year):
+            minutes -= entry.minutes
+        return cls.add_minutes(allotment_minutes, used_minutes, minutes)
+
+    @classmethod
+    def locked(cls, user_id, fiscal_year):
+        """Returns the user's ledger for the fiscal year locked by select_for_update, created if it's missing"""
+        ledger = cls.objects.select_for_update().filter(user_id=user_id, fiscal_year=fiscal_year).first()
+        if ledger is None:
+            allotment = ActiveUser.objects.filter(pk=user_id).values_list('vacation_hours', flat=True).get() * 60
+            try:
+                with transaction.atomic():
+                    ledger = cls.objects.create(user_id=user_id, fiscal_year=fiscal_year,
+                                                allotment_minutes=allotment, remaining_minutes=allotment)
+            except IntegrityError:
+                # Another transaction created the row first
+                ledger = cls.objects.select_for_update().get(user_id=user_id, fiscal_year=fiscal_year)
+        return ledger
+
+    @classmethod
+    def refresh_keys(cls, keys):
+        """Refresh the ledgers of the fiscal years of a set of (user_id, period_id)"""
+        periods = dict(Period.objects.filter(period__in={period_id for _, period_id in keys}).values_list('period', 'fiscal_year'))
+        # Lock the ledgers in the same order in every transaction, so two writers can't deadlock
+        for user_id, fiscal_year in sorted({(user_id, periods[period_id]) for user_id, period_id in keys}):
+            cls.refresh(user_id, fiscal_year)
+
+    @classmethod
+    def refresh(cls, user_id, fiscal_year, enforce_allotment=True):
+        """
+        Recalculates the vacation minutes used from the PayrollHours and archived entries with the ledger row locked by
+        select_for_update, so concurrent vacation entries are checked one after the other.  Raises ValidationError,
+        which rolls back the caller's transaction, if the change increases the minutes used past the allotment
+        (unless enforce_allotment is False, for a Period moved to another fiscal year by the manager).
+        Call inside the transaction that changed the entries.
+        """
+        ledger = cls.locked(user_id, fiscal_year)
+        used = sum(
+            model.objects.filter(user_id=user_id, fiscal_year=fiscal_year, vacation_hours=True).aggregate(used=minutes_sum())['used']
+            for model in (PayrollHours, PayrollHoursArchive)
+        )
+        if enforce_allotment:
+            try:
+                cls.add_minutes(ledger.allotment_minutes, ledger.used_minutes, used - ledger.used_minutes)
+            except ValidationError as error:
+                raise ValidationError({'vacation_hours': error})
+        ledger.used_minutes = used
+        ledger.remaining_minutes = ledger.allotment_minutes - used
+        ledger.save(update_fields=['used_minutes', 'remaining_minutes'])
@@ -0,0 +1,89 @@
+import threading
+import uuid
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Period
+
+#
+# Process-local calendar of the Period rows.
+# Periods change about a dozen times a year, but are looked up on every request, so each process keeps
+# all of them in memory.  The version key in the shared cache is changed whenever a Period is saved or
+# deleted (see signals.py) and a process reloads its calendar when its version no longer matches.
+# For the gunicorn workers to stay coherent, CACHES['default'] must be shared between them (file based,
+# memcached, redis, ...).  See: https://docs.djangoproject.com/en/4.2/topics/cache/
+#
+
+VERSION_KEY = 'timecard:period_calendar_version'
+
+class PeriodCalendar:
+    """All of the Periods, indexed by starting date, primary key and calendar year"""
+
+    def __init__(self, periods, version):
+        self.version = version
+        self.periods = sorted(periods, key=lambda period: period.starting_date)
+        self.starting_dates = [period.starting_date for period in self.periods]
+        self.by_start = {period.starting_date: period for period in self.periods}
+        self.by_pk = {period.pk: period for period in self.periods}
+        by_year = defaultdict(list)
+        for period in self.periods:
+            by_year[period.calendar_year].append(period)
+        self.by_year = dict(by_year)
+        self.years = sorted(self.by_year)
+
+    def period_for_start(self, starting_date):
+        """Returns the Period starting on starting_date or None"""
+        return self.by_start.get(starting_date)
+
+    def period_by_pk(self, pk):
+        """Returns the Period with primary key pk or None"""
+        return self.by_pk.get(int(pk))
+
+    def periods_for_year(self, year):
+        """Returns the list of Periods for a calendar year in starting date order"""
+        return self.by_year.get(year, [])
+
+    def period_for_date(self, day):
+        """Returns the Period containing day or None"""
+        index = bisect_right(self.starting_dates, day) - 1
+        if index < 0:
+            return None
+        period = self.periods[index]
+        # Periods are months, so day is in the period's month or, at the latest, on its reporting date
+        if (day.year, day.month) == (period.starting_date.year, period.starting_date.month) or day <= period.reporting_date:
+            return period
+        return None
+
+_calendar = None
+_lock = threading.Lock()
+
+def current_version():
+    """Returns the shared calendar version, setting one up if the cache doesn't have it"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+def get_calendar():
+    """Returns the PeriodCalendar, reloading it from the database if a Period has changed"""
+    global _calendar
+    version = current_version()     # Read before loading, so a change during the load triggers another reload
+    calendar = _calendar
+    if calendar is None or calendar.version != version:
+        with _lock:
+            calendar = _calendar
+            if calendar is None or calendar.version != version:
+                # From the primary: a replica behind the change would be cached under the new version
+                calendar = PeriodCalendar(Period.objects.using(DEFAULT_DB_ALIAS), version)
+                _calendar = calendar
+    return calendar
+
+def invalidate():
+    """Drop this process's calendar and change the shared version so every process reloads"""
+    global _calendar
+    _calendar = None
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
@@ -0,0 +1,122 @@
+import calendar
+from collections import namedtuple
+from datetime import date, time, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import period_calendar, versions
+from .models import Period
+
+#
+# Generate the 12 Periods of a calendar or fiscal year from a rule set, instead of entering them one at a time
+# through PeriodCreate.  The dates are business day offsets from the last day of the month (weekends and the
+# holidays are skipped), the periods are validated together in memory and inserted with one bulk_create.
+# Used by the generate_periods command and the Period admin action.
+#
+
+FISCAL_YEAR_START_MONTH = 9     # FY25 is September 2024 to August 2025
+
+PeriodRules = namedtuple('PeriodRules', ['reporting_offset', 'submission_offset', 'submission_time', 'pay_offset', 'pay_time'])
+PeriodRules.__doc__ = """Business days after the last day of the month for each date (0 = the last day of the month itself)"""
+
+# Matches the Periods entered so far: report on the last day, submit 2 and pay 5 business days later
+DEFAULT_RULES = PeriodRules(reporting_offset=0, submission_offset=2, submission_time=time(13), pay_offset=5, pay_time=time(9))
+
+def default_holidays():
+    """Returns the holidays from settings.TIMECARD_HOLIDAYS (dates or ISO date strings)"""
+    return {
+        holiday if isinstance(holiday, date) else date.fromisoformat(holiday)
+        for holiday in getattr(settings, 'TIMECARD_HOLIDAYS', ())
+    }
+
+def fiscal_year_for(year, month):
+    """Returns the fiscal year (FYyy) of a month"""
+    return 'FY' + str(year + 1 if month >= FISCAL_YEAR_START_MONTH else year)[-2:]
+
+def calendar_year_months(year):
+    """Returns the (year, month) list of a calendar year"""
+    return [(year, month) for month in range(1, 13)]
+
+def fiscal_year_months(fiscal_year):
+    """Returns the (year, month) list of a fiscal year given as FYyy"""
+    if len(fiscal_year) != 4 or not fiscal_year.startswith('FY') or not fiscal_year[2:].isdigit():
+        raise ValidationError(f'Fiscal year {fiscal_year!r} must be FYyy')
+    end_year = 2000 + int(fiscal_year[2:])
+    months = [(month - 1) % 12 + 1 for month in range(FISCAL_YEAR_START_MONTH, FISCAL_YEAR_START_MONTH + 12)]
+    return [(end_year - 1 if month >= FISCAL_YEAR_START_MONTH else end_year, month) for month in months]
+
+def add_business_days(day, offset, holidays):
+    """Returns the date offset business days after day (before for a negative offset, day itself for 0)"""
+    step = timedelta(days=1 if offset > 0 else -1)
+    remaining = abs(offset)
+    while remaining:
+        day += step
+        if day.weekday() < 5 and day not in holidays:
+            remaining -= 1
+    return day
+
+def build_period(year, month, rules=DEFAULT_RULES, holidays=frozenset()):
+    """Returns the unsaved Period for a month"""
+    last_day = date(year, month, calendar.monthrange(year, month)[1])
+    return Period(
+        period_no=month,
+        calendar_year=year,
+        fiscal_year=fiscal_year_for(year, month),
+        starting_date=date(year, month, 1),
+        reporting_date=add_business_days(last_day, rules.reporting_offset, holidays),
+        submission_date=add_business_days(last_day, rules.submission_offset, holidays),
+        submission_time=rules.submission_time,
+        pay_date=add_business_days(last_day, rules.pay_offset, holidays),
+        pay_time=rules.pay_time,
+    )
+
+def validate_periods(periods, existing_starts):
+    """Returns the list of errors for the new periods, checked against each other and the existing starting dates"""
+    errors = []
+    seen = set(existing_starts)
+    for period in periods:
+        name = period.starting_date.strftime('%Y-%m')
+        if period.starting_date in seen:
+            errors.append(f'{name}: a period already starts on {period.starting_date}')
+        seen.add(period.starting_date)
+        if period.period_no != period.starting_date.month or period.calendar_year != period.starting_date.year:
+            errors.append(f'{name}: period no and calendar year must match the starting date')
+        if period.fiscal_year != fiscal_year_for(period.calendar_year, period.period_no):
+            errors.append(f'{name}: fiscal year should be {fiscal_year_for(period.calendar_year, period.period_no)}')
+        if period.reporting_date.year != period.starting_date.year or period.reporting_date < period.starting_date:
+            errors.append(f'{name}: reporting date must be in the period\'s year, on or after the starting date')
+        if period.submission_date < period.reporting_date:
+            errors.append(f'{name}: submission date must not be before the reporting date')
+        if period.pay_date < period.submission_date:
+            errors.append(f'{name}: pay date must not be before the submission date')
+    return errors
+
+def generate_periods(months, rules=DEFAULT_RULES, holidays=None, skip_existing=True):
+    """
+    Create the Periods for the (year, month) list with one bulk_create and return them.
+    Months that already have a Period are skipped (or are an error with skip_existing=False).
+    Raises ValidationError listing every problem, and nothing is inserted, if any period is invalid.
+    """
+    if holidays is None:
+        holidays = default_holidays()
+    existing_starts = set(period_calendar.get_calendar().by_start)
+    if skip_existing:
+        months = [(year, month) for year, month in months if date(year, month, 1) not in existing_starts]
+    periods = [build_period(year, month, rules, holidays) for year, month in months]
+
+    errors = validate_periods(periods, existing_starts)
+    if errors:
+        raise ValidationError(errors)
+    if not periods:
+        return []
+
+    with transaction.atomic():
+        created = Period.objects.bulk_create(periods)
+        # bulk_create doesn't send post_save, so invalidate the calendar here (see signals.py)
+        period_calendar.invalidate()
+        transaction.on_commit(period_calendar.invalidate)
+        for year in {period.calendar_year for period in created}:
+            versions.bump('periods', year)
+    return created
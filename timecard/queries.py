@@ -0,0 +1,63 @@
+import asyncio
+
+from .models import PayrollHours, PayrollHoursArchive, PeriodTotals, VacationLedger
+from .intervals import TimeEntry
+
+#
+# Shared query layer for the per-period totals used by views.py and forms.py
+# The totals are read from PeriodTotals and VacationLedger, which PayrollHours.save()/delete() keep up to date.
+#
+
+TOTALS_FIELDS = ['worked_minutes', 'adjustment_mins', 'entries', 'submitted']
+
+def period_totals_row(user, period):
+    return PeriodTotals.objects.filter(user=user, period=period).values(*TOTALS_FIELDS)
+
+def vacation_used(user, period):
+    return VacationLedger.objects.filter(user=user, fiscal_year=period.fiscal_year).values_list('used_minutes', flat=True)
+
+def period_totals(user, period):
+    """
+    Returns the totals for a user's period from its PeriodTotals row and the fiscal year's VacationLedger row:
+        worked_minutes      - minutes worked in the period
+        vacation_minutes    - vacation minutes taken in the period's fiscal year
+        adjustment_mins     - adjustment minutes in the period
+        entries             - number of entries in the period
+        submitted           - number of entries in the period submitted by the employee
+    """
+    totals = period_totals_row(user, period).first() or dict.fromkeys(TOTALS_FIELDS, 0)
+    totals['vacation_minutes'] = vacation_used(user, period).first() or 0
+    return totals
+
+async def aperiod_totals(user, period):
+    """
+    Async period_totals() for the async views.  The two reads are gathered, but Django 4.2 runs a request's async ORM
+    calls in one thread (thread sensitive sync_to_async), so they still reach the database one after the other.
+    """
+    totals, vacation_minutes = await asyncio.gather(period_totals_row(user, period).afirst(), vacation_used(user, period).afirst())
+    totals = totals or dict.fromkeys(TOTALS_FIELDS, 0)
+    totals['vacation_minutes'] = vacation_minutes or 0
+    return totals
+
+def period_hours(user, period, *fields):
+    """
+    Returns a user's entries for a period, or their values() with fields, in display order.
+    An archived period reads PayrollHoursArchive together with PayrollHours, which only has entries of an archived
+    period while the archive_hours command is moving them (see archive.py); the fields then have to include
+    date_worked and starting_time for the ORDER BY of the UNION.
+    """
+    entries = PayrollHours.objects.filter(user=user, period=period)
+    if not period.archived:
+        return entries.values(*fields) if fields else entries
+    archived = PayrollHoursArchive.objects.filter(user=user, period=period)
+    if fields:
+        entries, archived = entries.values(*fields), archived.values(*fields)
+    # The Meta ordering isn't allowed inside a UNION, so the combined query is ordered instead
+    return archived.order_by().union(entries.order_by(), all=True).order_by('date_worked', 'starting_time')
+
+def period_time_entries(user, period):
+    """Returns the TimeEntry list (see intervals.py) for a user's saved entries in a period, with one query"""
+    rows = PayrollHours.objects.filter(user=user, period=period).order_by().values_list(
+        'user_id', 'date_worked', 'starting_time', 'ending_time', 'adjustment_mins', 'pk',
+    )
+    return [TimeEntry(*row) for row in rows]
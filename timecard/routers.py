@@ -0,0 +1,118 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+#
+# Read replicas for the read-only pages.  With DATABASE_REPLICA_URLS set (see DATABASE_REPLICAS in settings.py) the
+# queries of the views in REPLICA_VIEWS go to a random replica, every other query (the writes, the forms' checks,
+# the admin, the login) to the primary ('default').
+# Read your writes: a request that can write (POST, ...) sets a cookie for REPLICA_PIN_SECONDS, and the browser's
+# requests carrying it are served from the primary, so the redirect back to the timecard after saving an entry
+# shows the entry even if the replicas are behind.  The hours table fragment (see versions.py) is only cached from
+# a primary read, as a replica could store the table from before the change under the new version.
+# Try it locally with a copy of the SQLite database as the "replica" (it isn't updated, so the routing shows):
+#   cp db.sqlite3 replica.sqlite3
+#   DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3 python manage.py runserver
+# See: https://docs.djangoproject.com/en/4.2/topics/db/multi-db/
+#
+
+REPLICA_VIEWS = {
+    'activeuser-home', 'period-list', 'period-dashboard', 'payroll-export', 'payroll-export-fy',
+    'api-timecard', 'api-period-list', 'api-period-calendar',
+}
+PIN_COOKIE = 'timecard_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_use_replica = ContextVar('timecard_use_replica', default=False)
+
+def replica_aliases():
+    return settings.DATABASE_REPLICAS
+
+def reads_from_replica():
+    """Are the reads of the current request going to a replica"""
+    return _use_replica.get() and bool(replica_aliases())
+
+class ReplicaRouter:
+    """Send the reads of the replica views to a random replica and everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            replicas = replica_aliases()
+            if replicas:
+                return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True     # Every database holds the same rows
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS   # The replicas get the schema through replication
+
+def on_replica(chunks):
+    """Iterate a StreamingHttpResponse's content with the reads on a replica (it runs after the middleware returned)"""
+    chunks = iter(chunks)
+    while True:
+        token = _use_replica.set(True)
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            _use_replica.reset(token)
+        yield chunk
+
+class ReplicaRoutingMiddleware:
+    """Route the reads of the replica views to the replicas, unless the browser has written recently"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+            self.process_view = self.aprocess_view  # Otherwise Django calls process_view() through a thread
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request._replica_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            self.finish(request)
+        return self.update_response(request, response)
+
+    async def __acall__(self, request):
+        request._replica_token = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.finish(request)
+        return self.update_response(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if (replica_aliases() and match and match.view_name in REPLICA_VIEWS
+                and request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES):
+            request._replica_token = _use_replica.set(True)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        ReplicaRoutingMiddleware.process_view(self, request, view_func, view_args, view_kwargs)
+
+    def finish(self, request):
+        if request._replica_token is not None:
+            _use_replica.reset(request._replica_token)
+
+    def update_response(self, request, response):
+        """Pin the browser to the primary after a write, and keep a streamed response's reads on the replica"""
+        if request.method not in SAFE_METHODS and replica_aliases():
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        elif request._replica_token is not None and response.streaming:
+            response.streaming_content = on_replica(response.streaming_content)
+        return response
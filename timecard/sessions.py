@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+
+#
+# Session middleware that only writes a session when it changes.
+# Django's SESSION_SAVE_EVERY_REQUEST writes the session on every request, to slide its expiry forward.  Here the
+# session is written when its data changed, and otherwise once per SESSION_REFRESH_INTERVAL: the interval (time
+# bucket) of the last write is kept in the session, and a request in a later bucket writes it again.  A session
+# then expires between SESSION_COOKIE_AGE - SESSION_REFRESH_INTERVAL and SESSION_COOKIE_AGE after the last request.
+# Works with any SESSION_ENGINE; with signed_cookies (DJANGO_SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies)
+# a write is a new Set-Cookie header instead of a cache write.
+# See: https://docs.djangoproject.com/en/4.2/topics/http/sessions/#when-sessions-are-saved
+#
+
+REFRESHED_KEY = '_refreshed'    # Time bucket of the last write
+
+def refresh_interval():
+    """Seconds between the writes that extend the expiry of an unchanged session"""
+    return getattr(settings, 'SESSION_REFRESH_INTERVAL', 60 * 60)
+
+def current_bucket():
+    return int(time.time() // refresh_interval())
+
+class CoalescingSessionMiddleware(SessionMiddleware):
+    """SessionMiddleware that writes a session when its data changed or its time bucket ended"""
+
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        # No session cookie and nothing stored: there's no session to keep alive (and no Vary: Cookie to add)
+        if session is not None and (session.session_key or session.modified):
+            bucket = current_bucket()
+            # Loads the session if the view didn't, a read of the session store
+            if session.get(REFRESHED_KEY) != bucket and not session.is_empty():
+                session[REFRESHED_KEY] = bucket     # Marks the session modified, so it's written below
+        return super().process_response(request, response)
@@ -0,0 +1,63 @@
+from datetime import date
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import period_calendar, versions
+from .models import ActiveUser, PayrollHours, PayrollHoursArchive, Period, VacationLedger
+from .period_generator import fiscal_year_for
+
+#
+# Signal receivers, connected when the app is ready (see apps.py)
+# See: https://docs.djangoproject.com/en/4.2/topics/signals/
+#
+
+@receiver([post_save, post_delete], sender=Period, dispatch_uid='timecard_period_calendar_invalidate')
+def period_changed(sender, instance, using, **kwargs):
+    """Invalidate the Period calendar when a Period is written"""
+    # Invalidate again after the commit, so no process reloads the calendar before the change is visible
+    period_calendar.invalidate()
+    transaction.on_commit(period_calendar.invalidate, using=using)
+    # The cached period list of the year, and of the year the Period was moved from
+    for year in {instance.calendar_year, getattr(instance, '_loaded_calendar_year', None)} - {None}:
+        versions.bump('periods', year)
+    instance._loaded_calendar_year = instance.calendar_year
+
+@receiver(post_save, sender=Period, dispatch_uid='timecard_period_hours_copy')
+def period_dates_changed(sender, instance, using, **kwargs):
+    """Carry a change of the Period's fiscal year or starting date to the copies on its PayrollHours and archived entries"""
+    with transaction.atomic(using=using):
+        changed = set()
+        for model in (PayrollHours, PayrollHoursArchive):
+            entries = model.objects.using(using).filter(period=instance).exclude(
+                fiscal_year=instance.fiscal_year, period_start=instance.starting_date,
+            )
+            rows = set(entries.order_by().values_list('user', 'fiscal_year', 'vacation_hours').distinct())
+            if rows:
+                entries.update(fiscal_year=instance.fiscal_year, period_start=instance.starting_date)
+                changed |= rows
+        if not changed:
+            return
+        # update() skips PayrollHours.save(): the vacation moved from the old fiscal year's ledger to the new one's
+        ledger_keys = set()
+        for user_id, fiscal_year, vacation_hours in changed:
+            if vacation_hours and fiscal_year != instance.fiscal_year:
+                ledger_keys |= {(user_id, fiscal_year), (user_id, instance.fiscal_year)}
+        for user_id, fiscal_year in sorted(ledger_keys):
+            VacationLedger.refresh(user_id, fiscal_year, enforce_allotment=False)
+        for user_id in {user_id for user_id, _, _ in changed}:
+            versions.bump('hours', user_id, instance.pk)
+
+@receiver(post_save, sender=ActiveUser, dispatch_uid='timecard_vacation_allotment')
+def vacation_allotment_changed(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Carry a change of the user's vacation hours to the ledgers of the current and later fiscal years"""
+    # Skip the fixture loads and the partial saves that can't change the hours (last_login on every login)
+    if raw or (update_fields is not None and 'vacation_hours' not in update_fields):
+        return
+    today = date.today()
+    allotment = instance.vacation_hours * 60
+    VacationLedger.objects.filter(user=instance, fiscal_year__gte=fiscal_year_for(today.year, today.month)).exclude(
+        allotment_minutes=allotment,
+    ).update(allotment_minutes=allotment, remaining_minutes=allotment - F('used_minutes'))
@@ -0,0 +1,53 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+#
+# SQLite performance profile for the sites running on db.sqlite3.
+# The WAL journal lets the readers carry on while an entry is written.  It is stored in the database file, so it is
+# set once with set_journal_mode() (python manage.py sqlite_journal wal) rather than on every connection, which
+# would convert any database a manage.py command opens.
+# Every new SQLite connection gets settings.SQLITE_PRAGMAS (see settings.py), which only last for the connection:
+# synchronous=NORMAL only syncs the WAL at checkpoints, busy_timeout makes a writer wait for the lock instead of
+# failing, and mmap / cache_size / temp_store keep the reads in memory.
+# The write views run in immediate_atomic(): a deferred transaction that has read (the overlap and vacation checks)
+# and then writes has to upgrade its lock, and SQLite fails that with "database is locked" straight away when
+# another connection is writing, without waiting for busy_timeout.  BEGIN IMMEDIATE takes the write lock first.
+# Compare with: python manage.py bench_sqlite_writes
+# See: https://www.sqlite.org/wal.html
+#      https://www.sqlite.org/lang_transaction.html
+#
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Set the PRAGMAs of the profile on a new SQLite connection"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+def set_journal_mode(mode, using=DEFAULT_DB_ALIAS):
+    """Switch an SQLite database file to a journal mode (wal, delete, ...), returns the mode it is in"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'PRAGMA journal_mode = {mode}')
+        return cursor.fetchone()[0]
+
+@contextmanager
+def immediate_atomic(using=None):
+    """transaction.atomic() that starts with BEGIN IMMEDIATE on SQLite (timecard.backends.sqlite3)"""
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    if not hasattr(connection, 'begin_immediate') or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+    connection.begin_immediate = True
+    try:
+        with transaction.atomic(using=using):
+            connection.begin_immediate = False  # BEGIN IMMEDIATE was sent when the block was entered
+            yield
+    finally:
+        connection.begin_immediate = False
@@ -14,13 +14,11 @@ def timedelta_filter(value, arg):
     return timedelta(hours=value.hour,minutes=value.minute)-timedelta(hours=arg.hour,minutes=arg.minute)
 
 @register.filter
-def duration_filter(td):
+def duration_filter(total_minutes):
     """
-    Returns the file in hours and minute format
+    Returns whole minutes (PayrollHours.minutes) in hours and minute format
     """
-    total_seconds = int(td.total_seconds())
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
+    hours, minutes = divmod(total_minutes or 0, 60)
 
     return '{hours:02d}:{minutes:02d}'.format(hours=hours, minutes=minutes)
 
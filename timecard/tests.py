@@ -1,3 +1,1453 @@
-from django.test import TestCase
+import calendar
+import csv
+import json
+import os
+import re
+import tempfile
+from io import StringIO
+from datetime import date, time, timedelta
+from importlib import import_module
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Q, Sum
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import async_views, metrics, versions, views
+from .exports import HEADER
+from .archive import ARCHIVE_FIELDS, archive_fiscal_year, current_fiscal_year, set_archived
+from .intervals import ENDS_BEFORE_START, OVERLAP, TimeEntry, find_violations, overlapping_refs
+from .period_calendar import VERSION_KEY, current_version, get_calendar, invalidate
+from .models import ActiveUser, Period, PayrollHours, PayrollHoursArchive, PeriodTotals, VacationLedger
+from .queries import period_hours
+from .routers import PIN_COOKIE
+from .sqlite_tuning import immediate_atomic
+from .period_generator import (
+    DEFAULT_RULES, add_business_days, build_period, calendar_year_months, fiscal_year_for, fiscal_year_months, generate_periods,
+)
+from .views import ActiveuserListView, timecard_etag
+from .warmup import load_templates, open_connections, warm_up
 
 # Create your tests here.
+
+def make_periods(year):
+    """Create the 12 periods for a calendar year; the fiscal year starts in September"""
+    periods = []
+    for month in range(1, 13):
+        last_day = date(year, month, calendar.monthrange(year, month)[1])
+        periods.append(Period.objects.create(
+            period_no=month,
+            calendar_year=year,
+            fiscal_year='FY' + str(year + 1 if month >= 9 else year)[-2:],
+            starting_date=date(year, month, 1),
+            reporting_date=last_day,
+            submission_date=last_day,
+            pay_date=last_day,
+        ))
+    return periods
+
+def make_user(username, vacation_hours=40):
+    return ActiveUser.objects.create_user(
+        start_date=date(2020, 1, 1),
+        end_date=None,
+        phone_number=f'555-555-{ActiveUser.objects.count():04d}',
+        password='password',
+        username=username,
+        vacation_hours=vacation_hours,
+    )
+
+class QueryPlanTests(TestCase):
+    """The hot PayrollHours and Period queries must be index searches, not sequential scans"""
+
+    @classmethod
+    def setUpTestData(cls):
+        periods = make_periods(2024)
+        cls.period = periods[0]
+        users = [make_user(f'user{i}') for i in range(5)]
+        cls.user = users[0]
+        for user in users:
+            for period in periods:
+                for day in range(1, 6):
+                    PayrollHours.objects.create(
+                        period=period, user=user, date_worked=period.starting_date.replace(day=day),
+                        starting_time=time(9), ending_time=time(12), vacation_hours=(day == 5),
+                    )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertNoSequentialScan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # The planner prefers sequential scans on small test tables, so make them a last resort
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+            plan = queryset.explain()
+            self.assertNotIn('Seq Scan', plan, plan)
+        elif connection.vendor == 'sqlite':
+            plan = queryset.explain()
+            # "SCAN table" without "USING ... INDEX" is a full table scan
+            full_scans = re.findall(r'SCAN (timecard_\w+)(?! USING)\s*$', plan, re.MULTILINE)
+            self.assertEqual(full_scans, [], plan)
+        else:
+            self.skipTest(f'No query plan check for {connection.vendor}')
+
+    def test_period_entries(self):
+        self.assertNoSequentialScan(PayrollHours.objects.filter(user=self.user, period=self.period))
+
+    def test_overlap_check(self):
+        self.assertNoSequentialScan(PayrollHours.objects.filter(
+            ~Q(id=1),
+            user=self.user.pk,
+            period=self.period,
+            date_worked=date(2024, 1, 2),
+            ending_time__gte=time(10),
+            starting_time__lte=time(11),
+        ))
+
+    def test_fiscal_year_vacation(self):
+        self.assertNoSequentialScan(PayrollHours.objects.filter(
+            user=self.user, fiscal_year='FY24', vacation_hours=True,
+        ).values('user').annotate(Sum('minutes')))
+
+    def test_period_totals(self):
+        self.assertNoSequentialScan(PeriodTotals.objects.filter(user=self.user, period__fiscal_year='FY24'))
+
+    def test_period_by_starting_date(self):
+        self.assertNoSequentialScan(Period.objects.filter(starting_date=date(2024, 1, 1)))
+
+    def test_periods_for_year(self):
+        self.assertNoSequentialScan(Period.objects.filter(calendar_year=2024).order_by('starting_date'))
+
+
+# The templates use {% static %}, which needs the collectstatic manifest with the default storage
+@override_settings(STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+class FragmentCacheTests(TestCase):
+    """The cached period list and hours table fragments are refreshed exactly when their own data changes"""
+
+    def setUp(self):
+        cache.clear()   # The fragments and versions would otherwise carry over from the other tests' rows
+        self.periods = make_periods(2024)
+        self.user = make_user('employee')
+        self.other = make_user('other')
+        self.client.force_login(self.user)
+
+    def home(self, user, period):
+        return self.client.get(reverse('activeuser-home', args=[user.pk, period.calendar_year, period.period_no]))
+
+    def add_hours(self, user, period, day, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return PayrollHours.objects.create(
+                user=user, period=period, date_worked=period.starting_date.replace(day=day),
+                starting_time=time(9), ending_time=time(12), **kwargs,
+            )
+
+    def hours_versions(self):
+        return {
+            key: versions.get_version('hours', *key)
+            for key in [(self.user.pk, self.periods[0].pk), (self.user.pk, self.periods[1].pk), (self.other.pk, self.periods[0].pk)]
+        }
+
+    def test_hours_table_from_cache(self):
+        self.add_hours(self.user, self.periods[0], 2)
+        self.home(self.user, self.periods[0])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.home(self.user, self.periods[0])
+        self.assertContains(response, 'Jan. 2, 2024')
+        self.assertFalse([query for query in queries if 'FROM "timecard_payrollhours"' in query['sql']])
+
+    def test_new_entry_refreshes_only_its_table(self):
+        self.add_hours(self.user, self.periods[0], 2)
+        self.assertContains(self.home(self.user, self.periods[0]), 'Jan. 2, 2024')
+        before = self.hours_versions()
+
+        self.add_hours(self.user, self.periods[0], 3)
+        after = self.hours_versions()
+        self.assertNotEqual(before[(self.user.pk, self.periods[0].pk)], after[(self.user.pk, self.periods[0].pk)])
+        self.assertEqual(before[(self.user.pk, self.periods[1].pk)], after[(self.user.pk, self.periods[1].pk)])
+        self.assertEqual(before[(self.other.pk, self.periods[0].pk)], after[(self.other.pk, self.periods[0].pk)])
+        self.assertContains(self.home(self.user, self.periods[0]), 'Jan. 3, 2024')
+
+    def test_moved_entry_refreshes_both_tables(self):
+        entry = self.add_hours(self.user, self.periods[0], 2)
+        entry = PayrollHours.objects.get(pk=entry.pk)
+        before = self.hours_versions()
+        entry.period = self.periods[1]
+        entry.date_worked = date(2024, 2, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            entry.save()
+        after = self.hours_versions()
+        self.assertNotEqual(before[(self.user.pk, self.periods[0].pk)], after[(self.user.pk, self.periods[0].pk)])
+        self.assertNotEqual(before[(self.user.pk, self.periods[1].pk)], after[(self.user.pk, self.periods[1].pk)])
+        self.assertEqual(before[(self.other.pk, self.periods[0].pk)], after[(self.other.pk, self.periods[0].pk)])
+        self.assertNotContains(self.home(self.user, self.periods[0]), 'Feb. 2, 2024')
+        self.assertContains(self.home(self.user, self.periods[1]), 'Feb. 2, 2024')
+
+    def test_submit_and_delete_refresh_the_table(self):
+        entry = self.add_hours(self.user, self.periods[0], 2)
+        self.assertContains(self.home(self.user, self.periods[0]), "<td class='bg-warning'>False</td>", html=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('submit-hours', args=[self.user.pk, self.periods[0].pk]))
+        self.assertContains(self.home(self.user, self.periods[0]), "<td class='bg-default'>True</td>", html=False)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PayrollHours.objects.get(pk=entry.pk).delete()
+        self.assertNotContains(self.home(self.user, self.periods[0]), 'Jan. 2, 2024')
+
+    def test_unrelated_write_keeps_the_table(self):
+        self.add_hours(self.user, self.periods[0], 2)
+        self.home(self.user, self.periods[0])
+        before = self.hours_versions()
+        self.add_hours(self.other, self.periods[0], 2)
+        self.add_hours(self.user, self.periods[1], 2)
+        self.assertEqual(before[(self.user.pk, self.periods[0].pk)], self.hours_versions()[(self.user.pk, self.periods[0].pk)])
+
+    def test_period_change_refreshes_only_its_year(self):
+        make_periods(2025)
+        self.assertContains(self.client.get(reverse('period-list', args=[2024])), 'Jan. 31, 2024')
+        version_2025 = versions.get_version('periods', 2025)
+        version_2024 = versions.get_version('periods', 2024)
+
+        period = Period.objects.get(pk=self.periods[0].pk)
+        period.pay_date = date(2024, 2, 9)
+        with self.captureOnCommitCallbacks(execute=True):
+            period.save()
+        self.assertNotEqual(version_2024, versions.get_version('periods', 2024))
+        self.assertEqual(version_2025, versions.get_version('periods', 2025))
+        self.assertContains(self.client.get(reverse('period-list', args=[2024])), 'Feb. 9, 2024')
+
+    def test_generated_periods_refresh_the_year(self):
+        self.assertContains(self.client.get(reverse('period-list', args=[2026])), 'There are no Periods set up yet.')
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_periods(calendar_year_months(2026))
+        self.assertContains(self.client.get(reverse('period-list', args=[2026])), 'Jan. 1, 2026')
+
+class PeriodCopyTests(TestCase):
+    """A Period's fiscal year and starting date are copied onto its entries, with the ledgers and cached tables"""
+
+    def setUp(self):
+        cache.clear()
+        self.period = make_periods(2027)[0]    # FY27
+        self.user = make_user('employee')
+        for day, vacation_hours in [(4, True), (5, False)]:
+            PayrollHours.objects.create(
+                user=self.user, period=self.period, date_worked=date(2027, 1, day),
+                starting_time=time(9), ending_time=time(12), vacation_hours=vacation_hours,
+            )
+
+    def ledger_used(self, fiscal_year):
+        return VacationLedger.objects.filter(user=self.user, fiscal_year=fiscal_year).values_list('used_minutes', flat=True).first()
+
+    def test_entries_copy_the_period(self):
+        self.assertEqual(set(PayrollHours.objects.values_list('fiscal_year', 'period_start')), {('FY27', date(2027, 1, 1))})
+        self.assertEqual(self.ledger_used('FY27'), 180)
+
+    def test_fiscal_year_change_moves_the_vacation(self):
+        version = versions.get_version('hours', self.user.pk, self.period.pk)
+        self.period.fiscal_year = 'FY99'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.period.save()
+        self.assertEqual(set(PayrollHours.objects.values_list('fiscal_year', flat=True)), {'FY99'})
+        self.assertEqual(self.ledger_used('FY27'), 0)
+        self.assertEqual(self.ledger_used('FY99'), 180)
+        self.assertNotEqual(version, versions.get_version('hours', self.user.pk, self.period.pk))
+
+    def test_starting_date_change(self):
+        self.period.starting_date = date(2027, 1, 2)
+        self.period.save()
+        self.assertEqual(set(PayrollHours.objects.values_list('period_start', flat=True)), {date(2027, 1, 2)})
+        self.assertEqual(self.ledger_used('FY27'), 180)
+
+    def test_unrelated_change_writes_nothing(self):
+        self.period.pay_date = date(2027, 2, 5)
+        with CaptureQueriesContext(connection) as queries:
+            self.period.save()
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "timecard_payrollhours"')])
+
+class BulkCreateTests(TestCase):
+    """The JSON bulk entry of PayrollHoursBulkCreate"""
+
+    def setUp(self):
+        cache.clear()
+        today = date.today()
+        self.period = [period for period in make_periods(today.year) if period.period_no == today.month][0]
+        self.user = make_user('employee')
+        self.client.force_login(self.user)
+
+    def post(self, body):
+        return self.client.post(reverse('payrollhours-bulk', args=[self.period.pk]), body, content_type='application/json')
+
+    def entry(self, day, starting_time='08:00', ending_time='12:00', **kwargs):
+        return {'date_worked': self.period.starting_date.replace(day=day).isoformat(),
+                'starting_time': starting_time, 'ending_time': ending_time, 'adjustment_mins': 0, **kwargs}
+
+    def test_week_created(self):
+        response = self.post({'entries': [self.entry(day) for day in range(1, 6)]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['created']), 5)
+        self.assertEqual(PayrollHours.objects.filter(user=self.user, period=self.period).count(), 5)
+        self.assertEqual(PeriodTotals.objects.get(user=self.user, period=self.period).worked_minutes, 5 * 240)
+
+    def test_overlaps_in_the_batch(self):
+        response = self.post({'entries': [self.entry(1), self.entry(1, '11:00', '13:00'), self.entry(2)]})
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertIn('starting_time', errors[0])
+        self.assertIn('starting_time', errors[1])
+        self.assertEqual(errors[2], {})
+        self.assertFalse(PayrollHours.objects.exists())
+
+    def test_touching_entries(self):
+        response = self.post({'entries': [self.entry(1, '08:00', '12:00'), self.entry(1, '12:00', '16:00')]})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PayrollHours.objects.exists())
+
+    def test_malformed_json(self):
+        for body in ['{"entries": [', '{"entries": {"date_worked": "x"}}', '{"entries": ["x"]}',
+                     '{"entries": [{"starting_time": ["08:00"]}]}', '[{"ending_time": {"hour": 8}}]']:
+            with self.subTest(body=body):
+                response = self.post(body)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid JSON entries'})
+        self.assertFalse(PayrollHours.objects.exists())
+
+    def test_max_num(self):
+        entries = [self.entry(day % 28 + 1, f'{day // 28 + 6:02d}:00', f'{day // 28 + 6:02d}:30') for day in range(63)]
+        response = self.post({'entries': entries})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['non_form_errors'])
+        self.assertFalse(PayrollHours.objects.exists())
+
+@override_settings(STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+class VacationLedgerTests(TestCase):
+    """PayrollHours.save() and delete() keep the VacationLedger up to date and refuse to overspend the allotment"""
+
+    def setUp(self):
+        cache.clear()
+        periods = make_periods(date.today().year)
+        self.august, self.september = periods[7], periods[8]     # FY of the year, the next FY
+        self.current = periods[date.today().month - 1]
+        self.user = make_user('employee', vacation_hours=4)
+
+    def vacation(self, period, day, ending_time=time(12)):
+        return PayrollHours.objects.create(
+            user=self.user, period=period, date_worked=period.starting_date.replace(day=day),
+            starting_time=time(9), ending_time=ending_time, vacation_hours=True,
+        )
+
+    def ledger_used(self, period):
+        return VacationLedger.objects.filter(user=self.user, fiscal_year=period.fiscal_year).values_list('used_minutes', flat=True).first()
+
+    def test_overspend_rejected_and_rolled_back(self):
+        self.vacation(self.august, 3)
+        with self.assertRaises(ValidationError):
+            self.vacation(self.august, 4, ending_time=time(11))
+        self.assertEqual(PayrollHours.objects.count(), 1)
+        self.assertEqual(PeriodTotals.objects.get(user=self.user, period=self.august).worked_minutes, 180)
+        self.assertEqual(self.ledger_used(self.august), 180)
+
+    def test_ledger_follows_create_update_delete(self):
+        entry = self.vacation(self.august, 3)
+        self.assertEqual(self.ledger_used(self.august), 180)
+        entry.ending_time = time(10)
+        entry.save()
+        self.assertEqual(self.ledger_used(self.august), 60)
+        entry.vacation_hours = False
+        entry.save()
+        self.assertEqual(self.ledger_used(self.august), 0)
+        entry.vacation_hours = True
+        entry.save()
+        entry.delete()
+        self.assertEqual(self.ledger_used(self.august), 0)
+        self.assertEqual(VacationLedger.objects.get(user=self.user, fiscal_year=self.august.fiscal_year).remaining_minutes, 240)
+
+    def test_moved_between_fiscal_years(self):
+        self.assertNotEqual(self.august.fiscal_year, self.september.fiscal_year)
+        entry = PayrollHours.objects.get(pk=self.vacation(self.august, 3).pk)
+        entry.period = self.september
+        entry.date_worked = self.september.starting_date.replace(day=3)
+        entry.save()
+        self.assertEqual(self.ledger_used(self.august), 0)
+        self.assertEqual(self.ledger_used(self.september), 180)
+
+    def stale_balance(self):
+        # The form reads the balance before another request takes the vacation, so only save() sees the overspend
+        return mock.patch.object(VacationLedger, 'balance', return_value=(240, 0))
+
+    def test_overspend_in_the_view_is_a_form_error(self):
+        self.vacation(self.current, 3)
+        self.client.force_login(self.user)
+        with self.stale_balance():
+            response = self.client.post(reverse('payrollhours-create', args=[self.current.pk]), {
+                'period': self.current.pk, 'user': self.user.pk, 'date_worked': self.current.starting_date.replace(day=4).isoformat(),
+                'starting_time': '09:00', 'ending_time': '11:00', 'vacation_hours': 'on', 'adjustment_mins': 0,
+            })
+        self.assertContains(response, 'exceed alotment of 4 hours')
+        self.assertEqual(PayrollHours.objects.count(), 1)
+        self.assertEqual(self.ledger_used(self.current), 180)
+
+    def test_overspend_in_the_admin_is_a_form_error(self):
+        self.vacation(self.august, 3)
+        manager = make_user('manager')
+        manager.is_staff = manager.is_superuser = True
+        manager.save()
+        self.client.force_login(manager)
+        # The admin form checks the locked ledger rather than the balance
+        with self.stale_balance(), mock.patch.object(PayrollHours, 'save') as save:
+            response = self.client.post(reverse('admin:timecard_payrollhours_add'), {
+                'period': self.august.pk, 'user': self.user.pk, 'date_worked': self.august.starting_date.replace(day=4).isoformat(),
+                'starting_time': '09:00', 'ending_time': '11:00', 'vacation_hours': 'on', 'adjustment_mins': 0,
+            })
+        self.assertContains(response, 'exceed alotment of 4 hours')
+        save.assert_not_called()
+        self.assertEqual(self.ledger_used(self.august), 180)
+
+    def test_check_entry(self):
+        entry = self.vacation(self.august, 3)
+        fiscal_year = self.august.fiscal_year
+        self.assertEqual(VacationLedger.check_entry(self.user, fiscal_year, 60), 240)
+        self.assertEqual(VacationLedger.check_entry(self.user, fiscal_year, 240, entry=entry), 240)
+        with self.assertRaises(ValidationError):
+            VacationLedger.check_entry(self.user, fiscal_year, 120)
+        # Taking vacation out is allowed past an allotment that was reduced
+        VacationLedger.objects.filter(user=self.user).update(allotment_minutes=60)
+        self.assertEqual(VacationLedger.check_entry(self.user, fiscal_year, 120, entry=entry), 120)
+        with self.assertRaises(ValidationError):
+            VacationLedger.check_entry(self.user, fiscal_year, 240, entry=entry)
+
+class TimecardApiTests(TestCase):
+    """The JSON timecard carries an ETag that changes with every field of the payload"""
+
+    def setUp(self):
+        cache.clear()
+        today = date.today()
+        self.period = [period for period in make_periods(today.year) if period.period_no == today.month][0]
+        self.user = make_user('employee')
+        self.client.force_login(self.user)
+
+    def get(self, **headers):
+        return self.client.get(reverse('api-timecard', args=[self.user.pk, self.period.calendar_year, self.period.period_no]), **headers)
+
+    def test_etag_and_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'])
+        response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_edit_changes_the_etag(self):
+        etag = self.get()['ETag']
+        entry = PayrollHours.objects.create(
+            user=self.user, period=self.period, date_worked=self.period.starting_date,
+            starting_time=time(9), ending_time=time(12),
+        )
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['totals']['worked_minutes'], 180)
+        etag = response['ETag']
+
+        entry.ending_time = time(11)
+        entry.save()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_name_change_changes_the_etag(self):
+        etag = self.get()['ETag']
+        self.user.first_name = 'Pat'
+        self.user.save()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['first_name'], 'Pat')
+
+    def test_create_update_ok_is_in_the_etag(self):
+        marker = {'rows': 1, 'versions': 1}
+        self.assertNotEqual(
+            timecard_etag(self.user, self.period, True, marker, get_calendar()),
+            timecard_etag(self.user, self.period, False, marker, get_calendar()),
+        )
+
+class IntervalTests(SimpleTestCase):
+    """The sweep line overlap checks of intervals.py"""
+
+    def entry(self, starting_time, ending_time, ref, day=2, user_id=1, adjustment_mins=0):
+        return TimeEntry(user_id, date(2024, 1, day), time(*starting_time), time(*ending_time), adjustment_mins, ref)
+
+    def test_touching_entries_overlap(self):
+        entries = [self.entry((13,), (17,), 'b'), self.entry((9,), (12,), 'a'), self.entry((12,), (13,), 'c')]
+        violations = find_violations(entries)
+        self.assertEqual([(violation.code, violation.entry.ref, violation.other.ref) for violation in violations],
+                         [(OVERLAP, 'c', 'a'), (OVERLAP, 'b', 'c')])
+
+    def test_overlapping_entries(self):
+        violations = find_violations([self.entry((9,), (12,), 'a'), self.entry((11, 55), (13,), 'b')])
+        self.assertEqual([(violation.code, violation.entry.ref, violation.other.ref) for violation in violations], [(OVERLAP, 'b', 'a')])
+
+    def test_nested_entries(self):
+        entries = [self.entry((8,), (17,), 'outer'), self.entry((10,), (11,), 'first'), self.entry((13,), (14,), 'second')]
+        violations = find_violations(entries)
+        self.assertEqual({(violation.entry.ref, violation.other.ref) for violation in violations}, {('first', 'outer'), ('second', 'outer')})
+        self.assertEqual(overlapping_refs(violations), {'outer', 'first', 'second'})
+
+    def test_ends_before_start(self):
+        violations = find_violations([self.entry((12,), (9,), 'a'), self.entry((9,), (9,), 'b')])
+        self.assertEqual([(violation.code, violation.entry.ref) for violation in violations], [(ENDS_BEFORE_START, 'a'), (ENDS_BEFORE_START, 'b')])
+        self.assertEqual(overlapping_refs(violations), set())
+
+    def test_adjustment_only_entries(self):
+        # 0:00 to 0:00 isn't an error for an adjustment, but two of them on a day touch
+        self.assertEqual(find_violations([self.entry((0,), (0,), 'a', adjustment_mins=30)]), [])
+        entries = [self.entry((0,), (0,), 'a', adjustment_mins=30), self.entry((0,), (0,), 'b', adjustment_mins=-15)]
+        violations = find_violations(entries)
+        self.assertEqual([(violation.code, violation.entry.ref, violation.other.ref) for violation in violations], [(OVERLAP, 'b', 'a')])
+
+    def test_other_days_and_users(self):
+        entries = [self.entry((9,), (12,), 'a'), self.entry((9,), (12,), 'b', day=3), self.entry((9,), (12,), 'c', user_id=2)]
+        self.assertEqual(find_violations(entries), [])
+
+    def test_batch_against_saved_entries(self):
+        saved = [self.entry((9,), (12,), 101), self.entry((13,), (15,), 102)]
+        batch = [self.entry((11,), (13,), 'row 1'), self.entry((15,), (16,), 'row 2'), self.entry((15, 30), (17,), 'row 3')]
+        self.assertEqual(overlapping_refs(find_violations(saved + batch)), {101, 102, 'row 1', 'row 2', 'row 3'})
+        # 'row 1' ends as 102 starts and 'row 2' starts as it ends, both touch it
+        self.assertEqual(overlapping_refs(find_violations(saved + batch[:1])), {101, 102, 'row 1'})
+        self.assertEqual(overlapping_refs(find_violations(saved + batch[1:])), {102, 'row 2', 'row 3'})
+        self.assertEqual(overlapping_refs(find_violations(saved + batch[2:])), set())
+
+@override_settings(STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+class ArchiveTests(TestCase):
+    """archive_hours moves closed fiscal years to PayrollHoursArchive and back, the archived periods stay readable"""
+
+    def setUp(self):
+        cache.clear()
+        self.periods = make_periods(2024)     # FY24 to August, FY25 from September
+        self.user = make_user('employee')
+        self.client.force_login(self.user)
+        for period in self.periods[:2] + self.periods[8:9]:
+            for day, vacation_hours in [(3, False), (2, True), (4, False)]:
+                PayrollHours.objects.create(
+                    user=self.user, period=period, date_worked=period.starting_date.replace(day=day),
+                    starting_time=time(9), ending_time=time(12), vacation_hours=vacation_hours,
+                )
+        self.archived_ids = set(PayrollHours.objects.filter(fiscal_year='FY24').values_list('id', flat=True))
+
+    def totals(self):
+        return (list(PeriodTotals.objects.order_by('id').values_list('period', 'worked_minutes', 'entries')),
+                list(VacationLedger.objects.order_by('id').values_list('fiscal_year', 'used_minutes')))
+
+    def test_archive_and_restore(self):
+        totals = self.totals()
+        call_command('archive_hours', 'FY24', batch_size=2, stdout=StringIO())
+        self.assertFalse(PayrollHours.objects.filter(fiscal_year='FY24').exists())
+        self.assertEqual(set(PayrollHoursArchive.objects.values_list('id', flat=True)), self.archived_ids)
+        self.assertEqual(PayrollHours.objects.filter(fiscal_year='FY25').count(), 3)
+        self.assertEqual(set(Period.objects.filter(archived=True).values_list('fiscal_year', flat=True)), {'FY24'})
+        self.assertEqual(self.totals(), totals)
+
+        call_command('archive_hours', 'FY24', restore=True, batch_size=2, stdout=StringIO())
+        self.assertFalse(PayrollHoursArchive.objects.exists())
+        self.assertEqual(set(PayrollHours.objects.filter(fiscal_year='FY24').values_list('id', flat=True)), self.archived_ids)
+        self.assertFalse(Period.objects.filter(archived=True).exists())
+        self.assertEqual(self.totals(), totals)
+
+    def test_refresh_after_archive(self):
+        call_command('archive_hours', 'FY24', stdout=StringIO())
+        totals = self.totals()
+        PeriodTotals.refresh(self.user.pk, self.periods[0].pk)
+        VacationLedger.refresh(self.user.pk, 'FY24')
+        self.assertEqual(self.totals(), totals)
+
+        # Moving an archived period to the next fiscal year moves its archived entries and their vacation with it
+        period = Period.objects.get(pk=self.periods[1].pk)
+        period.fiscal_year = 'FY25'
+        period.save()
+        self.assertEqual(set(PayrollHoursArchive.objects.filter(period=period).values_list('fiscal_year', flat=True)), {'FY25'})
+        self.assertEqual(self.totals(), (totals[0], [('FY24', 180), ('FY25', 360)]))
+
+    def test_rerun_finishes_the_archive(self):
+        call_command('archive_hours', 'FY24', stdout=StringIO())
+        out = StringIO()
+        call_command('archive_hours', 'FY24', stdout=out)
+        self.assertIn('Archived 0 entries of FY24', out.getvalue())
+        self.assertEqual(PayrollHoursArchive.objects.count(), 6)
+
+    def test_open_fiscal_year_refused(self):
+        make_periods(date.today().year)
+        with self.assertRaises(ValidationError):
+            archive_fiscal_year(current_fiscal_year())
+        with self.assertRaises(CommandError):
+            call_command('archive_hours', 'FY99', stdout=StringIO())
+        self.assertFalse(PayrollHoursArchive.objects.exists())
+
+    def test_reads_through_the_union(self):
+        # Half way through a move: the flag is set and one entry of the period has been moved
+        set_archived('FY24', True)
+        period = Period.objects.get(pk=self.periods[0].pk)
+        moved = PayrollHours.objects.get(period=period, date_worked=date(2024, 1, 3))
+        PayrollHoursArchive.objects.bulk_create([PayrollHoursArchive(**PayrollHours.objects.filter(pk=moved.pk).values(*ARCHIVE_FIELDS).get())])
+        PayrollHours.objects.filter(pk=moved.pk).delete()
+
+        entries = list(period_hours(self.user, period, 'id', 'date_worked', 'starting_time'))
+        self.assertEqual([entry['date_worked'].day for entry in entries], [2, 3, 4])
+        self.assertIn(moved.pk, [entry['id'] for entry in entries])
+        response = self.client.get(reverse('api-timecard', args=[self.user.pk, 2024, 1]))
+        self.assertEqual([entry['id'] for entry in response.json()['entries']], [entry['id'] for entry in entries])
+
+    def test_archived_period_refuses_entries(self):
+        call_command('archive_hours', 'FY24', stdout=StringIO())
+        with self.assertRaises(ValidationError):
+            PayrollHours.objects.create(
+                user=self.user, period=Period.objects.get(pk=self.periods[0].pk), date_worked=date(2024, 1, 10),
+                starting_time=time(9), ending_time=time(12),
+            )
+        self.assertFalse(PayrollHours.objects.filter(fiscal_year='FY24').exists())
+
+    def test_archived_period_refuses_submit(self):
+        set_archived('FY24', True)    # The entries are still in PayrollHours until they are moved
+        self.client.post(reverse('submit-hours', args=[self.user.pk, self.periods[0].pk]))
+        self.assertFalse(PayrollHours.objects.filter(period=self.periods[0], employee_submitted=True).exists())
+        self.client.post(reverse('submit-hours', args=[self.user.pk, self.periods[8].pk]))
+        self.assertEqual(PayrollHours.objects.filter(period=self.periods[8], employee_submitted=True).count(), 3)
+
+@override_settings(DATABASE_REPLICAS=['replica'],
+                   STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+class ReplicaRoutingTests(TransactionTestCase):
+    """The read-only pages read from the replica, writes and the browser's next requests go to the primary"""
+    # The replica is a second connection to the test database, so it only sees committed rows
+
+    @classmethod
+    def setUpClass(cls):
+        # Added once the test runner has created the default database, as a mirror so the test case doesn't flush the
+        # database twice.  databases is set here so the runner doesn't look for a 'replica' in settings.DATABASES
+        default = connections['default'].settings_dict
+        connections.settings['replica'] = {**default, 'TEST': {**default['TEST'], 'MIRROR': 'default'}}
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+
+    def setUp(self):
+        cache.clear()
+        today = date.today()
+        self.period = [period for period in make_periods(today.year) if period.period_no == today.month][0]
+        self.user = make_user('employee')
+        PayrollHours.objects.create(
+            user=self.user, period=self.period, date_worked=self.period.starting_date,
+            starting_time=time(9), ending_time=time(12),
+        )
+        self.client.force_login(self.user)
+        get_calendar()    # The Period calendar is always loaded from the primary, see period_calendar.py
+
+    def home(self):
+        return self.client.get(reverse('activeuser-home', args=[self.user.pk, self.period.calendar_year, self.period.period_no]))
+
+    def timecard_queries(self, queries):
+        return [query['sql'] for query in queries if '"timecard_' in query['sql']]
+
+    def route(self, request):
+        with CaptureQueriesContext(connections['default']) as primary, CaptureQueriesContext(connections['replica']) as replica:
+            response = request()
+        return response, self.timecard_queries(primary), self.timecard_queries(replica)
+
+    def test_reads_go_to_the_replica(self):
+        response, primary, replica = self.route(self.home)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(primary, [])
+        self.assertTrue(replica)
+        response, primary, replica = self.route(
+            lambda: self.client.get(reverse('api-timecard', args=[self.user.pk, self.period.calendar_year, self.period.period_no])))
+        self.assertEqual(response.json()['totals']['worked_minutes'], 180)
+        self.assertEqual(primary, [])
+        self.assertTrue(replica)
+
+    def test_writes_go_to_the_primary(self):
+        response, primary, replica = self.route(lambda: self.client.post(reverse('submit-hours', args=[self.user.pk, self.period.pk])))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue([sql for sql in primary if sql.startswith('UPDATE')])
+        self.assertEqual(replica, [])
+        self.assertTrue(PayrollHours.objects.get(user=self.user).employee_submitted)
+
+    def test_request_after_a_write_is_pinned(self):
+        response = self.client.post(reverse('submit-hours', args=[self.user.pk, self.period.pk]))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        response, primary, replica = self.route(self.home)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(primary)
+        self.assertEqual(replica, [])
+
+        # Once the cookie has expired the reads go back to the replica
+        del self.client.cookies[PIN_COOKIE]
+        response, primary, replica = self.route(self.home)
+        self.assertEqual(primary, [])
+        self.assertTrue(replica)
+
+    def test_other_views_read_the_primary(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        response, primary, replica = self.route(lambda: self.client.get(reverse('activeuser')))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(primary)
+        self.assertEqual(replica, [])
+
+@override_settings(STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+class SessionWriteTests(TestCase):
+    """CoalescingSessionMiddleware writes an unchanged session once per SESSION_REFRESH_INTERVAL"""
+
+    def setUp(self):
+        cache.clear()
+        make_periods(2024)
+        self.user = make_user('employee')
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.now = 1_000_000 * settings.SESSION_REFRESH_INTERVAL
+
+    def requests(self, url, count=5):
+        """Returns the number of session writes for count GETs of url"""
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        with mock.patch('timecard.sessions.time', **{'time.return_value': self.now}), \
+             mock.patch.object(store, 'save', autospec=True, side_effect=store.save) as save:
+            for _ in range(count):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        return save.call_count
+
+    def test_unmodified_session_written_once_per_interval(self):
+        url = reverse('api-period-list', args=[2024])
+        self.assertEqual(self.requests(url), 1)     # force_login's session has no time bucket yet
+        self.assertEqual(self.requests(url), 0)
+        self.now += settings.SESSION_REFRESH_INTERVAL - 1
+        self.assertEqual(self.requests(url), 0)
+        self.now += 1
+        self.assertEqual(self.requests(url), 1)     # The next interval started
+        self.now += 3 * settings.SESSION_REFRESH_INTERVAL
+        self.assertEqual(self.requests(url), 1)
+
+    def test_modified_session_always_saved(self):
+        self.requests(reverse('api-period-list', args=[2024]))
+        self.assertEqual(self.requests(reverse('adminview')), 5)
+        self.assertEqual(self.client.session['num_visits'], 5)
+
+    def test_no_session_no_write(self):
+        self.client.logout()
+        self.assertEqual(self.requests(reverse('login')), 0)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+
+class ImportHoursTests(TestCase):
+    """import_hours validates each row like the entry form and resumes from its checkpoint"""
+
+    def setUp(self):
+        cache.clear()
+        make_periods(2024)
+        self.user = make_user('employee')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.csv_file = os.path.join(self.directory.name, 'hours.csv')
+
+    def write_csv(self, rows):
+        with open(self.csv_file, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['Username', 'Date Worked', 'Starting Time', 'Ending Time', 'Period', 'Adjustment Mins'])
+            writer.writerows(rows)
+
+    def run_import(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_hours', self.csv_file, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def week(self, day):
+        return [['employee', f'2024-01-{day:02d}', '08:00', '12:00', '', ''], ['employee', f'2024-01-{day:02d}', '13:00', '17:00', '', '']]
+
+    def test_rows_validated_like_the_form(self):
+        self.write_csv(self.week(2) + [
+            ['employee', '2024-01-31', '08:00', '12:00', '2024-02', ''],     # Not within the period
+            ['employee', '2024-01-03', '08:03', '12:00', '', ''],            # Not a multiple of 5 minutes
+            ['employee', '2024-01-03', '08:00', '08:00', '', '30'],          # Adjustment with times
+            ['employee', '2024-01-04', '00:00', '00:00', '', '30'],
+            ['employee', '2024-01-05', '12:00', '08:00', '', ''],
+            ['employee', '2024-01-02', '11:00', '14:00', '', ''],            # Overlaps both rows of the 2nd
+        ])
+        out, err = self.run_import()
+        self.assertIn('Imported 1 entries, rejected 7 rows', out)
+        self.assertIn('Line 2: Overlaps line 9', err)
+        self.assertIn('Line 4: Invalid date - date must be within the period', err)
+        self.assertIn('Line 5: Starting time not a multiple of 5 minutes', err)
+        self.assertIn('Line 6: Starting time must be 0 if Adjustment hours included', err)
+        self.assertIn('Line 8: Invalid time - ending time must be after the starting time\n', err)
+        self.assertIn('Line 9: Overlaps line 2', err)
+        self.assertEqual(PeriodTotals.objects.get(user=self.user, period__period_no=1).adjustment_mins, 30)
+
+    def test_resume_from_the_checkpoint(self):
+        self.write_csv(self.week(2) + self.week(3) + [['employee', '2024-01-04', '08:03', '12:00', '', '']] + self.week(5))
+        with self.assertRaises(CommandError):
+            self.run_import('--batch-size', '2', '--strict')
+        self.assertEqual(PayrollHours.objects.count(), 4)
+        with open(f'{self.csv_file}.checkpoint') as checkpoint:
+            self.assertEqual(json.load(checkpoint)['row'], 4)
+
+        # Fix the row and run the command again: it carries on after row 4
+        self.write_csv(self.week(2) + self.week(3) + [['employee', '2024-01-04', '08:00', '12:00', '', '']] + self.week(5))
+        out, err = self.run_import('--batch-size', '2', '--strict')
+        self.assertIn('Resuming after row 4', out)
+        self.assertIn('Imported 3 entries, rejected 0 rows', out)
+        self.assertEqual(PayrollHours.objects.count(), 7)
+        self.assertFalse(os.path.exists(f'{self.csv_file}.checkpoint'))
+
+    def test_rerun_imports_nothing_twice(self):
+        # As if the command died after committing the batches but before writing the checkpoint
+        self.write_csv(self.week(2) + self.week(3))
+        self.run_import('--batch-size', '2')
+        out, err = self.run_import('--batch-size', '2')
+        self.assertIn('Imported 0 entries, rejected 4 rows', out)
+        self.assertIn('Invalid time - time overlaps with other entries', err)
+        self.assertEqual(PayrollHours.objects.count(), 4)
+
+    def test_checkpoint_of_another_file(self):
+        self.write_csv(self.week(2))
+        with open(f'{self.csv_file}.checkpoint', 'w') as checkpoint:
+            json.dump({'csv_file': '/elsewhere/hours.csv', 'row': 1}, checkpoint)
+        with self.assertRaises(CommandError):
+            self.run_import()
+        out, err = self.run_import('--restart')
+        self.assertIn('Imported 2 entries', out)
+
+class PeriodGeneratorTests(TestCase):
+    """The business day rules, fiscal years and reruns of period_generator.py"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_business_days(self):
+        friday = date(2024, 5, 31)
+        self.assertEqual(add_business_days(friday, 0, set()), friday)
+        self.assertEqual(add_business_days(friday, 2, set()), date(2024, 6, 4))
+        self.assertEqual(add_business_days(friday, 2, {date(2024, 6, 3)}), date(2024, 6, 5))
+        self.assertEqual(add_business_days(date(2024, 6, 3), -1, set()), friday)
+
+    def test_dates_roll_over_weekends_and_holidays(self):
+        august = build_period(2024, 8)      # August 31 2024 is a Saturday
+        self.assertEqual(august.reporting_date, date(2024, 8, 31))
+        self.assertEqual(august.submission_date, date(2024, 9, 3))
+        self.assertEqual(august.pay_date, date(2024, 9, 6))
+        labor_day = build_period(2024, 8, holidays={date(2024, 9, 2)})
+        self.assertEqual(labor_day.submission_date, date(2024, 9, 4))
+        self.assertEqual(labor_day.pay_date, date(2024, 9, 9))
+        december = build_period(2024, 12, holidays={date(2025, 1, 1)})
+        self.assertEqual((december.submission_date, december.pay_date), (date(2025, 1, 3), date(2025, 1, 8)))
+        self.assertEqual((december.submission_time, december.pay_time), (DEFAULT_RULES.submission_time, DEFAULT_RULES.pay_time))
+
+    def test_fiscal_year_boundaries(self):
+        self.assertEqual(fiscal_year_for(2024, 8), 'FY24')
+        self.assertEqual(fiscal_year_for(2024, 9), 'FY25')
+        months = fiscal_year_months('FY25')
+        self.assertEqual((months[0], months[3], months[4], months[-1]), ((2024, 9), (2024, 12), (2025, 1), (2025, 8)))
+        for fiscal_year in ['FY2025', 'fy25', '2025']:
+            with self.assertRaises(ValidationError):
+                fiscal_year_months(fiscal_year)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            periods = generate_periods(months)
+        self.assertEqual(len(periods), 12)
+        self.assertEqual(set(Period.objects.values_list('fiscal_year', flat=True)), {'FY25'})
+        self.assertEqual(set(Period.objects.values_list('calendar_year', flat=True)), {2024, 2025})
+
+    def test_rerun_is_idempotent(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_periods(calendar_year_months(2025))
+        dates = list(Period.objects.order_by('starting_date').values_list('starting_date', 'pay_date'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(generate_periods(calendar_year_months(2025)), [])
+            # The fiscal year overlapping it only adds the months of 2024
+            self.assertEqual(len(generate_periods(fiscal_year_months('FY25'))), 4)
+        self.assertEqual(Period.objects.count(), 16)
+        self.assertEqual(list(Period.objects.filter(calendar_year=2025).order_by('starting_date').values_list('starting_date', 'pay_date')), dates)
+        with self.assertRaises(ValidationError):
+            generate_periods(calendar_year_months(2025), skip_existing=False)
+
+        call_command('generate_periods', '--year', '2025', stdout=StringIO())
+        self.assertEqual(Period.objects.count(), 16)
+
+    def test_invalid_rules_insert_nothing(self):
+        rules = DEFAULT_RULES._replace(pay_offset=1)
+        with self.assertRaises(ValidationError) as raised:
+            generate_periods(calendar_year_months(2025), rules)
+        self.assertEqual(len(raised.exception.messages), 12)
+        self.assertFalse(Period.objects.exists())
+
+@override_settings(STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+@mock.patch.object(ActiveuserListView, 'page_size', 3)
+class ActiveUserListTests(TestCase):
+    """The keyset pagination of ActiveuserListView"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = make_user('manager')
+        cls.manager.is_staff = cls.manager.is_superuser = True
+        cls.manager.end_date = date(2021, 1, 1)     # Not on the list of active users
+        cls.manager.save()
+        # Two users share each of the last names, so the pages split between them by id
+        for number, last_name in enumerate(['Adams', 'Adams', 'Baker', 'Baker', 'Clark', 'Clark', 'Davis']):
+            user = make_user(f'user{number}')
+            user.last_name = last_name
+            user.save()
+        cls.order = list(ActiveUser.objects.exclude(username='manager').order_by('last_name', 'id').values_list('username', flat=True))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.manager)
+
+    def page(self, query=''):
+        response = self.client.get(reverse('activeuser') + query)
+        self.assertEqual(response.status_code, 200)
+        usernames = [user.username for user in response.context['activeuser_list']]
+        return usernames, response.context.get('previous_query'), response.context.get('next_query')
+
+    def test_next_and_previous(self):
+        users, previous_query, next_query = self.page()
+        self.assertEqual(users, self.order[:3])
+        self.assertIsNone(previous_query)
+
+        users, previous_query, next_query = self.page('?' + next_query)
+        self.assertEqual(users, self.order[3:6])
+        self.assertIn('before_id', previous_query)
+
+        users, previous_query, last_next_query = self.page('?' + next_query)
+        self.assertEqual(users, self.order[6:])     # The last page
+        self.assertIsNone(last_next_query)
+
+        users, previous_query, next_query = self.page('?' + previous_query)
+        self.assertEqual(users, self.order[3:6])
+        users, previous_query, next_query = self.page('?' + previous_query)
+        self.assertEqual(users, self.order[:3])
+        self.assertIsNone(previous_query)
+        self.assertIsNotNone(next_query)
+
+    def test_status_filter(self):
+        self.assertEqual(self.page('?status=ended')[0], ['manager'])
+        self.assertEqual(len(self.page('?status=all')[0]), 3)
+        self.assertEqual(self.page('?status=bogus')[0], self.order[:3])
+
+    def test_tampered_cursor(self):
+        for query in ['?after_id=abc', '?after_name=Baker&after_id=', '?before_name=Baker&before_id=1.5']:
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(reverse('activeuser') + query).status_code, 404)
+        # A cursor that isn't on the list still seeks to the next user by name
+        self.assertEqual(self.page('?after_name=Bz&after_id=999999')[0], self.order[4:7])
+
+    def test_query_count_independent_of_the_page(self):
+        next_query = self.page()[2]
+        with CaptureQueriesContext(connection) as first:
+            self.page()
+        with CaptureQueriesContext(connection) as later:
+            self.page('?' + next_query)
+        self.assertEqual(len(first), len(later))
+
+class ExportTests(TestCase):
+    """The streamed payroll register CSV, from PayrollHours or the archive"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.periods = make_periods(2024)     # FY24 to August
+        cls.users = []
+        for username, last_name, vacation_day in [('zoe', 'Adams', 3), ('amy', 'Baker', None)]:
+            user = make_user(username)
+            user.last_name = last_name
+            user.save()
+            cls.users.append(user)
+            for period in cls.periods[:2]:
+                for day in [4, 2, 3]:
+                    PayrollHours.objects.create(
+                        user=user, period=period, date_worked=period.starting_date.replace(day=day),
+                        starting_time=time(9), ending_time=time(12, 30), vacation_hours=(day == vacation_day),
+                    )
+            PayrollHours.objects.create(
+                user=user, period=cls.periods[0], date_worked=date(2024, 1, 5),
+                starting_time=time(0), ending_time=time(0), adjustment_mins=45,
+            )
+        cls.manager = make_user('manager')
+        cls.manager.is_staff = cls.manager.is_superuser = True
+        cls.manager.save()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.manager)
+
+    def export(self, view_name, arg):
+        response = self.client.get(reverse(view_name, args=[arg]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_period_register(self):
+        rows = self.export('payroll-export', self.periods[0].pk)
+        self.assertEqual(rows[0], HEADER)
+        entries = [row for row in rows[1:] if row[5] != 'Total']
+        self.assertEqual(len(entries), PayrollHours.objects.filter(period=self.periods[0]).count())
+        self.assertEqual([(row[2], row[5]) for row in entries[:4]],
+                         [('zoe', '2024-01-02'), ('zoe', '2024-01-03'), ('zoe', '2024-01-04'), ('zoe', '2024-01-05')])
+        self.assertEqual(entries[0][5:13], ['2024-01-02', '09:00', '12:30', '210', 'False', '0', 'False', 'False'])
+
+        totals = [row for row in rows[1:] if row[5] == 'Total']
+        self.assertEqual([row[2] for row in totals], ['zoe', 'amy'])
+        for row, user in zip(totals, self.users):
+            sums = PayrollHours.objects.filter(user=user, period=self.periods[0]).aggregate(
+                worked=Sum('minutes'), vacation=Sum('minutes', filter=Q(vacation_hours=True)), adjustment=Sum('adjustment_mins'),
+            )
+            self.assertEqual(row[8:11], [str(sums['worked']), str(sums['vacation'] or 0), str(sums['adjustment'])])
+        self.assertEqual(rows[4 + 1][2], 'zoe')     # zoe's totals row follows her entries
+        self.assertEqual(rows[4 + 1][5], 'Total')
+
+    def test_fiscal_year_register(self):
+        rows = self.export('payroll-export-fy', 'FY24')
+        self.assertEqual(len(rows), 1 + PayrollHours.objects.count() + 4)
+        self.assertEqual([row[0] for row in rows[1:] if row[5] == 'Total'], ['2024-01', '2024-01', '2024-02', '2024-02'])
+
+    def test_archived_register(self):
+        period_rows = self.export('payroll-export', self.periods[0].pk)
+        fiscal_year_rows = self.export('payroll-export-fy', 'FY24')
+        call_command('archive_hours', 'FY24', stdout=StringIO())
+        self.assertFalse(PayrollHours.objects.exists())
+        self.assertEqual(self.export('payroll-export', self.periods[0].pk), period_rows)
+        self.assertEqual(self.export('payroll-export-fy', 'FY24'), fiscal_year_rows)
+
+    def test_command_matches_the_view(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_file = os.path.join(directory, 'payroll_FY24.csv')
+            call_command('export_hours', '--fiscal-year', 'FY24', '--output', csv_file, stdout=StringIO())
+            with open(csv_file, newline='') as output:
+                self.assertEqual(list(csv.reader(output)), self.export('payroll-export-fy', 'FY24'))
+
+    def test_staff_only(self):
+        self.client.force_login(self.users[0])
+        self.assertNotEqual(self.client.get(reverse('payroll-export', args=[self.periods[0].pk])).status_code, 200)
+
+@override_settings(STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+class PeriodDashboardTests(TestCase):
+    """The manager dashboard reads every employee's totals for a period with one query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.periods = make_periods(2024)
+        cls.period = cls.periods[1]
+        cls.manager = make_user('manager')
+        cls.manager.is_staff = cls.manager.is_superuser = True
+        cls.manager.last_name = 'Zimmer'
+        cls.manager.save()
+        for username, last_name, submitted in [('submitted', 'Adams', True), ('pending', 'Baker', False)]:
+            user = make_user(username)
+            user.last_name = last_name
+            user.save()
+            for day, vacation_hours in [(5, False), (6, True), (7, False)]:
+                PayrollHours.objects.create(
+                    user=user, period=cls.period, date_worked=date(2024, 2, day), starting_time=time(8), ending_time=time(12, 15),
+                    vacation_hours=vacation_hours, employee_submitted=(submitted or day == 5),
+                )
+            PayrollHours.objects.create(user=user, period=cls.periods[0], date_worked=date(2024, 1, 5), starting_time=time(8), ending_time=time(9))
+        ActiveUser.objects.filter(pk=make_user('no_entries').pk).update(last_name='Clark')
+        ActiveUser.objects.filter(pk=make_user('left').pk).update(end_date=date(2024, 1, 31))
+        ActiveUser.objects.filter(pk=make_user('later').pk).update(start_date=date(2024, 3, 1))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.manager)
+
+    def dashboard(self):
+        return self.client.get(reverse('period-dashboard', args=[self.period.pk]))
+
+    def test_totals(self):
+        employees = {employee['username']: employee for employee in self.dashboard().context['employee_list']}
+        self.assertEqual(list(employees), ['submitted', 'pending', 'no_entries', 'manager'])
+        for username in ['submitted', 'pending']:
+            sums = PayrollHours.objects.filter(user__username=username, period=self.period).aggregate(
+                worked=Sum('minutes'), vacation=Sum('minutes', filter=Q(vacation_hours=True)),
+            )
+            self.assertEqual((employees[username]['worked_minutes'], employees[username]['vacation_minutes'], employees[username]['entries']),
+                             (sums['worked'], sums['vacation'], 3))
+        self.assertEqual(employees['submitted']['worked_minutes'], 3 * 255)
+        self.assertEqual([employee['status'] for employee in employees.values()], ['Submitted', 'Pending', 'No entries', 'No entries'])
+        self.assertEqual(employees['no_entries']['worked_minutes'], 0)
+
+    def test_query_count(self):
+        self.dashboard()    # Loads the Period calendar
+        # The logged in user and the employees with their totals, however many employees there are
+        with self.assertNumQueries(2):
+            response = self.dashboard()
+        self.assertContains(response, 'Submitted: 1 of 4')
+        for number in range(5):
+            make_user(f'extra{number}')
+        with self.assertNumQueries(2):
+            response = self.dashboard()
+        self.assertContains(response, 'Submitted: 1 of 9')
+
+class MetricsTests(TestCase):
+    """/metrics serves the single process REGISTRY unless PROMETHEUS_MULTIPROC_DIR is a usable directory"""
+
+    def setUp(self):
+        cache.clear()
+        self.manager = make_user('manager')
+        self.manager.is_staff = True
+        self.manager.save()
+
+    def test_multiprocess_dir(self):
+        unset = {key: value for key, value in os.environ.items() if key != 'PROMETHEUS_MULTIPROC_DIR'}
+        with tempfile.TemporaryDirectory() as directory:
+            for value, expected in [(None, None), ('', None), (os.path.join(directory, 'missing'), None), (directory, directory)]:
+                environ = unset if value is None else {**unset, 'PROMETHEUS_MULTIPROC_DIR': value}
+                with self.subTest(value=value), mock.patch.dict(os.environ, environ, clear=True):
+                    self.assertEqual(metrics.multiprocess_dir(), expected)
+
+    def test_single_process_registry(self):
+        self.client.force_login(self.manager)
+        self.client.get(reverse('api-period-list', args=[2024]))
+        with mock.patch.object(metrics, 'MULTIPROCESS_DIR', None):
+            response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'timecard_request_duration_seconds_bucket{le="0.01",method="GET",url_name="api-period-list"}')
+
+    def test_multiprocess_registry(self):
+        self.client.force_login(self.manager)
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(metrics, 'MULTIPROCESS_DIR', directory):
+            response = self.client.get(reverse('metrics'))
+        # The directory is empty: no worker has written its values yet
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'timecard_request_duration_seconds_bucket')
+
+    @override_settings(METRICS_TOKEN='scraper-token')
+    def test_access(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scraper-token').status_code, 200)
+
+def server_timing_settings():
+    """The settings of DJANGO_SERVER_TIMING=True, see settings.py"""
+    middleware = list(settings.MIDDLEWARE)
+    middleware.insert(middleware.index('whitenoise.middleware.WhiteNoiseMiddleware') + 1, 'timecard.middleware.ServerTimingMiddleware')
+    templates = [{**settings.TEMPLATES[0], 'BACKEND': 'timecard.backends.django_templates.DjangoTemplates'}]
+    return override_settings(MIDDLEWARE=middleware, TEMPLATES=templates,
+                             STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+
+@server_timing_settings()
+class ServerTimingTests(TestCase):
+    """ServerTimingMiddleware sends the query count and times as a Server-Timing header and a JSON log line"""
+
+    def setUp(self):
+        cache.clear()
+        today = date.today()
+        self.period = [period for period in make_periods(today.year) if period.period_no == today.month][0]
+        self.user = make_user('employee')
+        self.client.force_login(self.user)
+
+    def test_header_and_log_line(self):
+        url = reverse('activeuser-home', args=[self.user.pk, self.period.calendar_year, self.period.period_no])
+        with self.assertLogs('timecard.timing', 'INFO') as logs, CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        timings = dict(re.fullmatch(r'(\w+);dur=([\d.]+)(?:;desc="(\d+) queries")?', part).group(1, 2)
+                       for part in response['Server-Timing'].split(', '))
+        self.assertEqual(list(timings), ['db', 'tpl', 'view', 'total'])
+        self.assertGreater(float(timings['tpl']), 0)
+        self.assertIn(f'desc="{len(queries)} queries"', response['Server-Timing'])
+
+        self.assertEqual(len(logs.records), 1)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['url_name'], line['method'], line['path'], line['status'], line['queries']),
+                         ('activeuser-home', 'GET', url, 200, len(queries)))
+        self.assertGreater(line['template_ms'], 0)
+        self.assertGreaterEqual(line['total_ms'], line['view_ms'])
+
+@override_settings(STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+class AsyncViewTests(TestCase):
+    """The async read views of async_views.py serve the same pages and JSON as the views.py ones"""
+
+    def setUp(self):
+        cache.clear()
+        today = date.today()
+        self.period = [period for period in make_periods(today.year) if period.period_no == today.month][0]
+        self.user = make_user('employee')
+        for day, vacation_hours in [(2, False), (3, True)]:
+            PayrollHours.objects.create(
+                user=self.user, period=self.period, date_worked=self.period.starting_date.replace(day=day),
+                starting_time=time(9), ending_time=time(12), vacation_hours=vacation_hours,
+            )
+        self.kwargs = {'pk': self.user.pk, 'year': self.period.calendar_year, 'month': self.period.period_no}
+
+    def request(self, name, kwargs, user=None, method='get', **headers):
+        request = getattr(RequestFactory(), method)(reverse(name, kwargs=kwargs), **headers)
+        request.user = user or self.user
+        return request
+
+    def both(self, name, kwargs, **headers):
+        """Returns the responses of the views.py and the async_views.py view"""
+        sync_view, async_view = getattr(views, name), getattr(async_views, name)
+        url_name = {'api_timecard': 'api-timecard', 'ActiveUser_home': 'activeuser-home', 'Period_list': 'period-list'}[name]
+        return (sync_view(self.request(url_name, kwargs, **headers), **kwargs),
+                async_to_sync(async_view)(self.request(url_name, kwargs, **headers), **kwargs))
+
+    def page(self, response):
+        return re.sub(r'name="csrfmiddlewaretoken" value="\w+"', '', response.content.decode())
+
+    def test_api_timecard(self):
+        sync_response, async_response = self.both('api_timecard', self.kwargs)
+        self.assertEqual(async_response.status_code, 200)
+        self.assertEqual(json.loads(async_response.content), json.loads(sync_response.content))
+        self.assertEqual(json.loads(async_response.content)['totals']['worked_minutes'], 360)
+        self.assertEqual(async_response['ETag'], sync_response['ETag'])
+        _, async_response = self.both('api_timecard', self.kwargs, HTTP_IF_NONE_MATCH=sync_response['ETag'])
+        self.assertEqual(async_response.status_code, 304)
+
+    def test_home_and_period_list(self):
+        sync_response, async_response = self.both('ActiveUser_home', self.kwargs)
+        self.assertEqual(async_response.status_code, 200)
+        self.assertEqual(self.page(async_response), self.page(sync_response))
+        sync_response, async_response = self.both('Period_list', {'year': self.period.calendar_year})
+        self.assertEqual(async_response.status_code, 200)
+        self.assertEqual(self.page(async_response), self.page(sync_response))
+
+    def test_access(self):
+        response = async_to_sync(async_views.api_timecard)(self.request('api-timecard', self.kwargs, user=AnonymousUser()), **self.kwargs)
+        self.assertEqual(response.status_code, 302)
+        response = async_to_sync(async_views.api_timecard)(self.request('api-timecard', self.kwargs, method='post'), **self.kwargs)
+        self.assertEqual(response.status_code, 405)
+        with self.assertRaises(PermissionDenied):
+            async_to_sync(async_views.api_timecard)(self.request('api-timecard', self.kwargs, user=make_user('other')), **self.kwargs)
+        with self.assertRaises(Http404):
+            async_to_sync(async_views.ActiveUser_home)(self.request('activeuser-home', {**self.kwargs, 'year': 2099}), **{**self.kwargs, 'year': 2099})
+
+class RebuildPeriodTotalsTests(TestCase):
+    """rebuild_period_totals recalculates the totals and ledgers from PayrollHours and the archive, --verify reports them"""
+
+    def setUp(self):
+        periods = make_periods(2024)
+        self.archived, self.current = periods[0], periods[8]     # FY24, archived below, and FY25
+        self.user = make_user('employee')
+        for period in (self.archived, self.current):
+            for day, vacation_hours in [(2, False), (3, True)]:
+                PayrollHours.objects.create(
+                    user=self.user, period=period, date_worked=period.starting_date.replace(day=day),
+                    starting_time=time(9), ending_time=time(12), vacation_hours=vacation_hours,
+                )
+        call_command('archive_hours', 'FY24', stdout=StringIO())
+
+    def totals(self):
+        return (list(PeriodTotals.objects.order_by('period').values_list('period', 'worked_minutes', 'vacation_minutes', 'entries')),
+                list(VacationLedger.objects.order_by('fiscal_year').values_list('fiscal_year', 'used_minutes', 'remaining_minutes')))
+
+    def verify(self):
+        out = StringIO()
+        call_command('rebuild_period_totals', verify=True, stdout=out)
+        return out.getvalue()
+
+    def test_verify(self):
+        self.assertIn('Verified 2 period totals and 2 vacation ledgers', self.verify())
+
+    def test_mismatch_fixed(self):
+        totals = self.totals()
+        PeriodTotals.objects.filter(period=self.current).update(worked_minutes=0)
+        VacationLedger.objects.filter(fiscal_year='FY25').update(used_minutes=0)
+        with self.assertRaisesMessage(CommandError, '2 period totals or vacation ledgers do not match'):
+            self.verify()
+
+        version = PeriodTotals.objects.get(period=self.current).version
+        out = StringIO()
+        call_command('rebuild_period_totals', stdout=out)
+        self.assertIn('Rebuilt 2 period totals and 2 vacation ledgers', out.getvalue())
+        self.assertEqual(self.totals(), totals)
+        self.assertGreater(PeriodTotals.objects.get(period=self.current).version, version)
+        self.verify()
+
+    def test_archived_period(self):
+        # The archived period's totals and the FY24 vacation come from PayrollHoursArchive
+        totals = self.totals()
+        PeriodTotals.objects.filter(period=self.archived).delete()
+        VacationLedger.objects.filter(fiscal_year='FY24').update(used_minutes=0, remaining_minutes=0)
+        with self.assertRaises(CommandError):
+            self.verify()
+        call_command('rebuild_period_totals', stdout=StringIO())
+        self.assertEqual(self.totals(), totals)
+        self.assertIn((self.archived.pk, 360, 180, 2), totals[0])
+        self.assertIn(('FY24', 180, 40 * 60 - 180), totals[1])
+
+class PeriodCalendarTests(TestCase):
+    """The process-local Period calendar of period_calendar.py finds the periods and reloads when the shared version changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.periods = make_periods(2024)
+
+    def test_period_for_date(self):
+        calendar = get_calendar()
+        for period in self.periods:
+            self.assertEqual(calendar.period_for_date(period.starting_date), period)
+            self.assertEqual(calendar.period_for_date(period.reporting_date), period)
+        self.assertEqual(calendar.period_for_date(date(2024, 2, 29)), self.periods[1])
+        self.assertIsNone(calendar.period_for_date(date(2023, 12, 31)))
+        self.assertIsNone(calendar.period_for_date(date(2025, 1, 1)))
+
+    def test_reporting_date_after_the_month(self):
+        Period.objects.filter(pk=self.periods[11].pk).update(reporting_date=date(2025, 1, 3))
+        invalidate()
+        calendar = get_calendar()
+        self.assertEqual(calendar.period_for_date(date(2025, 1, 3)), self.periods[11])
+        self.assertIsNone(calendar.period_for_date(date(2025, 1, 4)))
+        # Once the next period starts, its days are its own
+        january = Period.objects.create(
+            period_no=1, calendar_year=2025, fiscal_year='FY25', starting_date=date(2025, 1, 1),
+            reporting_date=date(2025, 1, 31), submission_date=date(2025, 1, 31), pay_date=date(2025, 1, 31),
+        )
+        self.assertEqual(get_calendar().period_for_date(date(2025, 1, 2)), january)
+
+    def test_reloaded_when_the_version_changes(self):
+        calendar = get_calendar()
+        with self.assertNumQueries(0):
+            self.assertIs(get_calendar(), calendar)
+        # Another process saved a Period: the change is only seen once the shared version changes
+        Period.objects.filter(pk=self.periods[0].pk).update(fiscal_year='FY99')
+        self.assertIs(get_calendar(), calendar)
+        cache.set(VERSION_KEY, 'changed', None)
+        reloaded = get_calendar()
+        self.assertIsNot(reloaded, calendar)
+        self.assertEqual(reloaded.version, 'changed')
+        self.assertEqual(reloaded.period_by_pk(self.periods[0].pk).fiscal_year, 'FY99')
+
+        # Saving a Period here changes the shared version for the other processes
+        with self.captureOnCommitCallbacks(execute=True):
+            self.periods[1].save()
+        self.assertNotEqual(current_version(), 'changed')
+        self.assertIsNot(get_calendar(), reloaded)
+
+class WarmupTests(TestCase):
+    """warm_up() loads the modules, URLconf, templates and Period calendar, even with no Periods yet"""
+
+    def setUp(self):
+        cache.clear()
+        invalidate()
+
+    def test_warm_up_on_an_empty_database(self):
+        with self.assertLogs('timecard.startup', 'INFO') as logs:
+            timings = warm_up()
+        self.assertEqual(list(timings), ['modules', 'urlconf', 'templates', 'period_calendar', 'connections'])
+        self.assertEqual([record.levelname for record in logs.records], ['INFO'])
+        self.assertGreater(load_templates(), 0)
+        self.assertIsNotNone(cache.get(VERSION_KEY))
+        # The calendar is loaded (empty) and served without a query until a Period changes
+        with self.assertNumQueries(0):
+            calendar = get_calendar()
+        self.assertEqual((calendar.periods, calendar.version), ([], cache.get(VERSION_KEY)))
+
+    def test_open_connections(self):
+        with self.assertLogs('timecard.startup', 'INFO'):
+            self.assertNotIn('connections', warm_up(connect=False))
+        self.assertEqual(open_connections(), len(connections.all()))
+        self.assertTrue(all(connection.connection is not None for connection in connections.all()))
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite profile')
+@override_settings(STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+class SqliteTuningTests(TransactionTestCase):
+    """The SQLite profile of sqlite_tuning.py: the PRAGMAs of every connection and BEGIN IMMEDIATE for the writes"""
+
+    def sql(self, queries):
+        return [query['sql'] for query in queries]
+
+    @override_settings(SQLITE_PRAGMAS={'synchronous': 'OFF', 'busy_timeout': 1234, 'cache_size': -1000})
+    def test_pragmas_on_connect(self):
+        new_connection = connection.copy()
+        try:
+            with new_connection.cursor() as cursor:
+                values = [cursor.execute(f'PRAGMA {name}').fetchone()[0] for name in ['synchronous', 'busy_timeout', 'cache_size']]
+        finally:
+            new_connection.close()
+        self.assertEqual(values, [0, 1234, -1000])
+
+    def test_immediate_atomic(self):
+        with CaptureQueriesContext(connection) as queries:
+            with immediate_atomic():
+                Period.objects.count()
+                # A nested block is a savepoint of the immediate transaction
+                with immediate_atomic():
+                    Period.objects.count()
+            with transaction.atomic():
+                Period.objects.count()
+        sql = self.sql(queries)
+        self.assertEqual(sql[0], 'BEGIN IMMEDIATE')
+        self.assertTrue(sql[2].startswith('SAVEPOINT'))
+        self.assertEqual(sql.count('BEGIN IMMEDIATE'), 1)
+        self.assertIn('BEGIN', sql[1:])
+        self.assertFalse(connection.begin_immediate)
+
+    def test_write_views_begin_immediate(self):
+        today = date.today()
+        period = [period for period in make_periods(today.year) if period.period_no == today.month][0]
+        user = make_user('employee')
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('payrollhours-create', args=[period.pk]), {
+                'period': period.pk, 'user': user.pk, 'date_worked': period.starting_date.isoformat(),
+                'starting_time': '09:00', 'ending_time': '11:00', 'adjustment_mins': 0,
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(PayrollHours.objects.filter(user=user).exists())
+        sql = self.sql(queries)
+        # The form's reads are in the transaction that took the write lock
+        self.assertIn('BEGIN IMMEDIATE', sql)
+        self.assertNotIn('BEGIN', sql)
+        self.assertFalse([query for query in sql[:sql.index('BEGIN IMMEDIATE')] if '"timecard_payrollhours"' in query])
+
+class MigrationTests(TransactionTestCase):
+    """The data migrations fill the new PayrollHours columns on the existing rows"""
+    migrate_from = ('timecard', '0015_vacationledger')
+
+    def migrate(self, target):
+        """Migrates the timecard app to target, returns the apps of that state"""
+        executor = MigrationExecutor(connection)
+        executor.migrate([target])
+        return executor.loader.project_state(target).apps
+
+    def setUp(self):
+        apps = self.migrate(self.migrate_from)
+        user = apps.get_model('timecard', 'ActiveUser').objects.create(
+            username='employee', password='', start_date=date(2020, 1, 1), phone_number='555-555-0000')
+        Period = apps.get_model('timecard', 'Period')
+        PayrollHours = apps.get_model('timecard', 'PayrollHours')
+        for month, fiscal_year in [(8, 'FY24'), (9, 'FY25')]:
+            period = Period.objects.create(
+                period_no=month, calendar_year=2024, fiscal_year=fiscal_year, starting_date=date(2024, month, 1),
+                reporting_date=date(2024, month, 28), submission_date=date(2024, month, 28), pay_date=date(2024, month, 28),
+            )
+            PayrollHours.objects.create(
+                user=user, period=period, date_worked=date(2024, month, 2), starting_time=time(8, 30),
+                ending_time=time(12, 15), minutes=timedelta(hours=3, minutes=45),
+            )
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_backfill(self):
+        apps = self.migrate(('timecard', '0016_payrollhours_integer_minutes'))
+        entries = apps.get_model('timecard', 'PayrollHours').objects.order_by('date_worked')
+        self.assertEqual(list(entries.values_list('minutes', flat=True)), [225, 225])
+
+        apps = self.migrate(('timecard', '0017_payrollhours_fiscal_year'))
+        entries = apps.get_model('timecard', 'PayrollHours').objects.order_by('date_worked')
+        self.assertEqual(list(entries.values_list('fiscal_year', 'period_start')),
+                         [('FY24', date(2024, 8, 1)), ('FY25', date(2024, 9, 1))])
+
+    def test_backfill_reversed(self):
+        self.migrate(('timecard', '0016_payrollhours_integer_minutes'))
+        apps = self.migrate(self.migrate_from)
+        entries = apps.get_model('timecard', 'PayrollHours').objects.all()
+        self.assertEqual(list(entries.values_list('minutes', flat=True)), [timedelta(hours=3, minutes=45)] * 2)
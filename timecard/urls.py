@@ -1,16 +1,21 @@
+from django.conf import settings
 from django.urls import path
-from timecard import views
+from timecard import async_views, views
 from .views import SignUpView
 
+# The read paths are served by the async views with the ASGI workers, see async_views.py
+read_views = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
 #    path("", views.home, name="home"),      # comment this guy out when ready to turn on the other page
     path('', views.login_success, name='login-success'),
     path('adminview/', views.adminview, name='adminview'),
+    path('dashboard/<int:pk_per>', views.period_dashboard, name='period-dashboard'),
     path('logout/', views.auth_logout, name='auth_logout'),
     path("signup/", SignUpView.as_view(), name="signup"),
 #    path('period/<int:pk>', views.PeriodDetailView.as_view(), name='period-detail'),
     path('activeuser/', views.ActiveuserListView.as_view(), name='activeuser'),
-    path('activeuser/<int:pk>/<int:year>/<int:month>', views.ActiveUser_home, name='activeuser-home'),
+    path('activeuser/<int:pk>/<int:year>/<int:month>', read_views.ActiveUser_home, name='activeuser-home'),
 #    path('activeuser/<int:pk>', views.ActiveuserDetailView.as_view(), name='activeuser-detail'), # not used
     path('submithours/<int:pk>/<int:pk_per>', views.submit_hours, name='submit-hours'),
     path('nextperiodmo/<int:pk>/<int:year>/<int:month>', views.next_period_mo, name='next-period-mo'),
@@ -19,9 +24,15 @@ urlpatterns = [
     path('prevperiodyr/<int:year>', views.prev_period_yr, name='prev-period-yr'),
     #path('mypayrollhours/', views.PayrollHoursByUserListView.as_view(), name='my-hours'),
     path('payrollhours/<int:pk>/create/', views.PayrollHoursCreate.as_view(), name='payrollhours-create'),
+    path('payrollhours/<int:pk>/bulk/', views.PayrollHoursBulkCreate.as_view(), name='payrollhours-bulk'),
     path('payrollhours/<int:pk><int:pk_per>/update/', views.PayrollHoursUpdate.as_view(), name='payrollhours-update'),
     path('payrollhours/<int:pk>/delete', views.PayrollHoursDelete.as_view(), name='payrollhours-delete'),
-    path('period/<int:year>', views.Period_list, name='period-list'),
+    path('export/period/<int:pk_per>', views.payroll_export, name='payroll-export'),
+    path('export/fiscalyear/<str:fiscal_year>', views.payroll_export, name='payroll-export-fy'),
+    path('period/<int:year>', read_views.Period_list, name='period-list'),
+    path('api/timecard/<int:pk>/<int:year>/<int:month>', read_views.api_timecard, name='api-timecard'),
+    path('api/period/<int:year>', views.api_period_list, name='api-period-list'),
+    path('api/calendar', views.api_period_calendar, name='api-period-calendar'),
     path('period/create', views.PeriodCreate.as_view(), name='period-create'),
     path('period/<int:pk>/update/', views.PeriodUpdate.as_view(), name='period-update'),
     path('period/<int:pk>/delete/', views.PeriodDelete.as_view(), name='period-delete'),
@@ -0,0 +1,43 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+#
+# Version tokens for the cached template fragments ({% cache %} in period_list.html and activeuser_detail.html).
+# The token is part of the fragment's cache key, so changing it makes every process render the fragment again,
+# while the fragments of the other years / users / periods stay cached.
+#   periods, <calendar year>            - changed when a Period of the year is written (see signals.py)
+#   hours, <user pk>, <period pk>       - changed when the user's PayrollHours of the period are written (see PeriodTotals.refresh())
+# The tokens are changed after the commit, so a fragment is never cached under a new token with the data before the
+# change.  A new random token (rather than a counter) means a token evicted from the cache can't come back with an
+# old value and find a stale fragment.
+#
+
+FRAGMENT_TIMEOUT = 60 * 60 * 24     # Seconds a fragment is kept, {% cache fragment_timeout ... %}
+
+def version_key(scope, *parts):
+    return ':'.join(['timecard:version', scope, *(str(part) for part in parts)])
+
+def get_version(scope, *parts):
+    """Returns the current version token, setting one up if the cache doesn't have it"""
+    key = version_key(scope, *parts)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+async def aget_version(scope, *parts):
+    """Async get_version() for the async views"""
+    key = version_key(scope, *parts)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, uuid.uuid4().hex, None)
+        version = await cache.aget(key)
+    return version
+
+def bump(scope, *parts):
+    """Change the version token once the current transaction commits (right away outside a transaction)"""
+    key = version_key(scope, *parts)
+    transaction.on_commit(lambda: cache.set(key, uuid.uuid4().hex, None))
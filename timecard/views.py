@@ -1,18 +1,31 @@
 import datetime
+import hashlib
+import json
 from datetime import date
+from urllib.parse import urlencode
 
 from django.shortcuts import render, get_object_or_404
 
 # Create your views here.
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, Http404, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.urls import reverse, reverse_lazy
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.views.generic.edit import CreateView
-from django.views.decorators.http import require_http_methods   # to enable updating field
-from django.db.models import F, ExpressionWrapper, BigIntegerField, IntegerField, Sum
+from django.views.decorators.http import require_http_methods, require_safe   # to enable updating field
+from django.db.models import F, Q, Count, Max, Sum, FilteredRelation
+from django.db.models.functions import Coalesce
 from .models import ActiveUser
-from .forms import ActiveUserCreationForm, PayrollHoursModelForm, PeriodModelForm, year_month
+from .forms import ActiveUserCreationForm, PayrollHoursModelForm, PayrollHoursFormSet, PeriodModelForm, year_month
+from .queries import period_hours, period_totals
+from .period_calendar import get_calendar
+from . import versions
+from .exports import stream_register
+from .routers import reads_from_replica
+from .sqlite_tuning import immediate_atomic
 
 from django.contrib.auth import logout
 from django.shortcuts import redirect
@@ -33,7 +46,7 @@ class SignUpView(PermissionRequiredMixin, CreateView):
 def home(request):
     return HttpResponse("Hello, Django!")
 
-from .models import ActiveUser, Period, PayrollHours
+from .models import ActiveUser, Period, PayrollHours, PeriodTotals
 
 @permission_required([ActiveUser.is_staff, ActiveUser.is_superuser])
 def adminview(request):
@@ -53,6 +66,56 @@ def adminview(request):
     
     return render(request, 'timecard/adminview.html', context=context)
 
+@permission_required([ActiveUser.is_staff, ActiveUser.is_superuser])
+def period_dashboard(request, pk_per=0):
+    """Manager dashboard with every employee's totals and submission status for a period"""
+    calendar = get_calendar()   # Periods are cached in the process, see period_calendar.py
+    if pk_per:
+        curr_period = calendar.period_by_pk(pk_per)
+    else:
+        curr_year, curr_month, create_update_ok = year_month(0, 0)
+        curr_period = calendar.period_for_start(date(curr_year, curr_month, 1))
+    if not curr_period:
+        raise Http404("Period doesn't exist, update the Period list")
+
+    # One query: the employees employed during the period, left joined to their PeriodTotals row for the period.
+    # PeriodTotals already holds the per (user, period) sums, so no GROUP BY over PayrollHours is needed.
+    # See: https://docs.djangoproject.com/en/4.2/ref/models/querysets/#filteredrelation-objects
+    employees = (
+        ActiveUser.objects
+        .filter(Q(end_date__isnull=True) | Q(end_date__gte=curr_period.starting_date),
+                is_active=True, start_date__lte=curr_period.reporting_date)
+        .annotate(totals=FilteredRelation('periodtotals', condition=Q(periodtotals__period=curr_period)))
+        .order_by('last_name', 'first_name', 'pk')
+        .values('pk', 'first_name', 'last_name', 'username',
+                worked_minutes=Coalesce(F('totals__worked_minutes'), 0),
+                vacation_minutes=Coalesce(F('totals__vacation_minutes'), 0),
+                adjustment_mins=Coalesce(F('totals__adjustment_mins'), 0),
+                entries=Coalesce(F('totals__entries'), 0),
+                submitted=Coalesce(F('totals__submitted'), 0))
+    )
+
+    employee_list = []
+    for employee in employees:
+        if not employee['entries']:
+            employee['status'] = 'No entries'
+        elif employee['submitted'] == employee['entries']:
+            employee['status'] = 'Submitted'
+        else:
+            employee['status'] = 'Pending'
+        employee_list.append(employee)
+
+    periods = calendar.periods
+    index = periods.index(curr_period)
+    context = {
+        'curr_period': curr_period,
+        'employee_list': employee_list,
+        'prev_period': (periods[index - 1] if index > 0 else None),
+        'next_period': (periods[index + 1] if index + 1 < len(periods) else None),
+        'num_submitted': sum(1 for employee in employee_list if employee['status'] == 'Submitted'),
+    }
+    return render(request, 'timecard/period_dashboard.html', context=context)
+
 @login_required()
 def login_success(request):
     """
@@ -64,31 +127,43 @@ def login_success(request):
         user = request.user
         return HttpResponseRedirect(reverse_lazy('activeuser-home', args=[user.pk, 0, 0]))
 
-@login_required()
-def Period_list(request, year=None):
-    """Period List for a given year"""
-    model = Period
-    
+def period_list_year(year):
+    """Returns the year Period_list shows for the year in the URL"""
     display_year = year if year >= 2024 else date.today().year
     if (display_year < 2024):
         display_year = 2024
+    return display_year
+
+def period_list_context(calendar, display_year, period_list_version):
+    """Template context of Period_list, shared with the async view (see async_views.py)"""
     prev_year = display_year-1
     next_year = display_year+1
 
-    queryset = Period.objects.filter(calendar_year=display_year).order_by('starting_date',)
-    year_list = sorted(set(Period.objects.values_list('calendar_year', flat=True)))[-5:]
+    queryset = calendar.periods_for_year(display_year)
+    year_list = calendar.years[-5:]
     prev_year_ok = (True if prev_year in year_list else False)
     next_year_ok = (True if next_year in year_list else False)
     
-    context = {
+    return {
         'display_year': display_year,
         'period_list': queryset,
+        'period_list_version': period_list_version,
+        'fragment_timeout': versions.FRAGMENT_TIMEOUT,
         'year_list': year_list,
         'prev_year_ok': prev_year_ok,
         'next_year_ok': next_year_ok,
         'prev_year': prev_year,
         'next_year': next_year,
     }
+
+@login_required()
+def Period_list(request, year=None):
+    """Period List for a given year"""
+    model = Period
+    
+    display_year = period_list_year(year)
+    calendar = get_calendar()   # Periods are cached in the process, see period_calendar.py
+    context = period_list_context(calendar, display_year, versions.get_version('periods', display_year))    # See versions.py
     return render(request, 'timecard/period_list.html', context=context)
       
 @login_required()
@@ -108,74 +183,112 @@ def prev_period_yr(request, pk=None, year=None, month=None):
 from django.views import generic
 
 class ActiveuserListView(PermissionRequiredMixin, generic.ListView):
+    """
+    List of the Active Users by last name, a page at a time.
+    Pages use keyset (seek) pagination on (last_name, id), so a page costs the same however deep it is:
+        ?after_name=<last_name>&after_id=<id>     - the page after that user
+        ?before_name=<last_name>&before_id=<id>   - the page before that user
+        ?status=active|ended|all                  - employment status filter (default active)
+    """
     permission_required = [ActiveUser.is_staff, ActiveUser.is_superuser]
 
     model = ActiveUser
     
     context_object_name = 'activeuser_list'
     
-    template_name = 'activeuser_list.html'
-    
-@login_required()
-def ActiveUser_home(request, pk=None, year=None, month=None):
-    """Active User Main Home Screen with Payroll Hours as well"""
-    model = ActiveUser
-    
-    if (pk):
-        activeuser = ActiveUser.objects.filter(pk=pk).get()
+    template_name = 'timecard/activeuser_list.html'
+
+    page_size = 50
+    STATUS_CHOICES = ('active', 'ended', 'all')
+
+    def get_queryset(self):
+        self.status = self.request.GET.get('status', 'active')
+        if self.status not in self.STATUS_CHOICES:
+            self.status = 'active'
+
+        # Only the displayed columns, not the password hash etc.
+        query = ActiveUser.objects.only('id', 'first_name', 'last_name', 'start_date', 'end_date', 'phone_number')
+        today = date.today()
+        if self.status == 'active':
+            query = query.filter(Q(end_date__isnull=True) | Q(end_date__gte=today))
+        elif self.status == 'ended':
+            query = query.filter(end_date__lt=today)
+
+        params = self.request.GET
+        backwards = ('before_id' in params)
+        try:
+            if backwards:
+                seek_name, seek_id = params.get('before_name', ''), int(params['before_id'])
+                query = query.filter(Q(last_name__lt=seek_name) | Q(last_name=seek_name, id__lt=seek_id)).order_by('-last_name', '-id')
+            elif 'after_id' in params:
+                seek_name, seek_id = params.get('after_name', ''), int(params['after_id'])
+                query = query.filter(Q(last_name__gt=seek_name) | Q(last_name=seek_name, id__gt=seek_id)).order_by('last_name', 'id')
+            else:
+                query = query.order_by('last_name', 'id')
+        except ValueError:
+            raise Http404('Invalid page')
+
+        # One extra row tells if there is another page in the direction of travel
+        users = list(query[:self.page_size + 1])
+        more = (len(users) > self.page_size)
+        users = users[:self.page_size]
+        if backwards:
+            users.reverse()
+            self.has_previous, self.has_next = more, True
+        else:
+            self.has_previous, self.has_next = ('after_id' in params), more
 
-    curr_year, curr_month, create_update_ok = year_month(year, month)
-        
-    curr_period = Period.objects.filter(starting_date = date(curr_year, curr_month, 1)).get()
-    value = curr_period.pk
-    period_list = Period.objects.filter(calendar_year = curr_year)
+        # Build the home URLs from one reverse() instead of get_absolute_url() per row
+        sentinel = 987654321
+        url_template = reverse('activeuser-home', args=[sentinel, 0, 0]).replace(str(sentinel), '{pk}')
+        for user in users:
+            user.home_url = url_template.format(pk=user.pk)
+        return users
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        users = context['activeuser_list']
+        context['status'] = self.status
+        context['status_choices'] = self.STATUS_CHOICES
+        if users and self.has_next:
+            context['next_query'] = urlencode({'status': self.status, 'after_name': users[-1].last_name, 'after_id': users[-1].pk})
+        if users and self.has_previous:
+            context['previous_query'] = urlencode({'status': self.status, 'before_name': users[0].last_name, 'before_id': users[0].pk})
+        return context
+    
+def activeuser_home_context(activeuser, calendar, curr_year, curr_month, curr_period, create_update_ok, totals, hours_version):
+    """Template context of ActiveUser_home, shared with the async view (see async_views.py)"""
+    period_list = calendar.periods_for_year(curr_year)
     total_hours = 0
     total_minutes= 0
     if curr_period:
-        # Get the Total Hours worked in the period.
-        # See: https://docs.djangoproject.com/en/4.2/topics/db/aggregation/
-        # and: https://stackoverflow.com/questions/33237819/aggregate-in-django-with-duration-field
-        # and: https://stackoverflow.com/questions/32305800/why-does-django-queryset-say-typeerror-complex-aggregates-require-an-alias
-        payrollhours_per_period = PayrollHours.objects.filter(user = activeuser, period__starting_date = date(curr_year, curr_month, 1))
-        dur_int = payrollhours_per_period.aggregate(dur=Sum(ExpressionWrapper(F('minutes'), output_field=BigIntegerField())))
-        dur_bigint = (dur_int.get('dur') if dur_int.get('dur') else 0)
-        total_hours = int(dur_bigint / (10e5*60*60))
-        total_minutes = int((dur_bigint / (10e5*60)) - (total_hours * 60))
-        
-        # Get the Total Vacation hours taken in the period.
-        vac_hours_query = PayrollHours.objects.filter(user = activeuser, period__fiscal_year = curr_period.fiscal_year, vacation_hours=True)
-        dur_int = vac_hours_query.aggregate(dur=Sum(ExpressionWrapper(F('minutes'), output_field=BigIntegerField())))
-        dur_bigint = (dur_int.get('dur') if dur_int.get('dur') else 0)
-        vac_hours_taken = int(dur_bigint / (10e5*60*60))
-        vac_minutes_taken = int((dur_bigint / (10e5*60)) - (vac_hours_taken * 60))
-        
-        # Get the Total Adjustment hours taken in the period.
-        payrollhours_per_period = PayrollHours.objects.filter(user = activeuser, period__starting_date = date(curr_year, curr_month, 1))
-        dur_int = payrollhours_per_period.aggregate(dur=Sum(ExpressionWrapper(F('adjustment_mins'), output_field=IntegerField())))
-        total_adjustment_mins = (dur_int.get('dur') if dur_int.get('dur') else 0)
+        # The period totals and the fiscal year vacation balance, see queries.period_totals()
+        payrollhours_per_period = period_hours(activeuser, curr_period)     # Lazy, so a cached table doesn't query
+        total_hours, total_minutes = divmod(totals['worked_minutes'], 60)
+        vac_hours_taken, vac_minutes_taken = divmod(totals['vacation_minutes'], 60)
+        total_adjustment_mins = totals['adjustment_mins']
         
         # Determine if all of the entries for the month are submitted
-        all_sub = payrollhours_per_period.aggregate(Sum("employee_submitted"))
-        if ('employee_submitted__sum' in all_sub and all_sub['employee_submitted__sum']):
-            sub_yes = int(all_sub.get('employee_submitted__sum'))
-            all_hours_submitted = (True if sub_yes == payrollhours_per_period.count() else False)
-        else:
-            all_hours_submitted = True  # No entries means don't enable the Submit All Hours button
+        # No entries means don't enable the Submit All Hours button
+        all_hours_submitted = (totals['submitted'] == totals['entries'])
 
     # See: https://stackoverflow.com/questions/4424435/how-to-convert-a-django-queryset-to-a-list
     #    ... and: https://docs.djangoproject.com/en/4.2/ref/models/querysets/
     # note user is in the filter due to the get_queryset overload below
     # sort the list and get the limit to last 5
-    year_list = sorted(set(Period.objects.values_list('calendar_year', flat=True)))[-5:]
+    year_list = calendar.years[-5:]
     prev_period_ok = (False if curr_year == year_list[0] and curr_month == 1 else True)
     next_period_ok = (False if curr_year == year_list[-1] and curr_month == 12 else True)
 
-    context = {
+    return {
         'activeuser': activeuser,
         'curr_year': curr_year,
         'curr_month': curr_month,
         'curr_period': curr_period,
         'payrollhours_per_period': payrollhours_per_period,
+        'hours_version': hours_version,
+        # A replica may not have the change the version is for yet, see routers.py
+        'fragment_timeout': 0 if reads_from_replica() else versions.FRAGMENT_TIMEOUT,
         'total_hours': total_hours,
         'total_minutes': total_minutes,
         'year_list': year_list,
@@ -190,7 +303,25 @@ def ActiveUser_home(request, pk=None, year=None, month=None):
         'vac_minutes_taken': vac_minutes_taken,
         'total_adjustment_mins': total_adjustment_mins,
     }
-# "minutes" bigint NULL
+
+@login_required()
+def ActiveUser_home(request, pk=None, year=None, month=None):
+    """Active User Main Home Screen with Payroll Hours as well"""
+    model = ActiveUser
+    
+    if (pk):
+        activeuser = ActiveUser.objects.filter(pk=pk).get()
+
+    curr_year, curr_month, create_update_ok = year_month(year, month)
+        
+    calendar = get_calendar()   # Periods are cached in the process, see period_calendar.py
+    curr_period = calendar.period_for_start(date(curr_year, curr_month, 1))
+    if not curr_period:
+        raise Http404("Period doesn't exist, have the manager update the Period list")
+    totals = period_totals(activeuser, curr_period)
+    hours_version = versions.get_version('hours', activeuser.pk, curr_period.pk)   # See versions.py
+
+    context = activeuser_home_context(activeuser, calendar, curr_year, curr_month, curr_period, create_update_ok, totals, hours_version)
     return render(request, 'timecard/activeuser_detail.html', context=context)
 
     # See https://docs.djangoproject.com/en/4.2/topics/class-based-views/generic-display/
@@ -201,6 +332,148 @@ def ActiveUser_home(request, pk=None, year=None, month=None):
 #            .order_by('date_worked', 'starting_time', 'ending_time')
 #        )
 
+# Payroll register CSV export for the managers, see exports.py
+@permission_required([ActiveUser.is_staff, ActiveUser.is_superuser])
+def payroll_export(request, pk_per=None, fiscal_year=None):
+    """Stream the payroll register for a period or a fiscal year as CSV"""
+    if pk_per is not None:
+        period = get_calendar().period_by_pk(pk_per)
+        if not period:
+            raise Http404("Period doesn't exist")
+        filename = f'payroll_{period.starting_date:%Y_%m}.csv'
+    else:
+        period = None
+        filename = f'payroll_{fiscal_year}.csv'
+
+    return StreamingHttpResponse(
+        stream_register(period=period, fiscal_year=fiscal_year),
+        content_type='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+# Read-only JSON API for the timecards and the Period calendar
+# Responses carry a strong ETag (and Last-Modified for the timecards) so polling clients get 304 Not Modified
+# from one small query instead of the totals being aggregated again.  The timecard ETag is built from the
+# PeriodTotals version counters (see PeriodTotals.refresh()) and every other field of the JSON, the Period ETags
+# from the calendar version.
+# See: https://docs.djangoproject.com/en/4.2/topics/conditional-view-processing/
+
+def period_json(period):
+    """Returns the JSON representation of a Period"""
+    return {
+        'id': period.pk,
+        'period_no': period.period_no,
+        'calendar_year': period.calendar_year,
+        'fiscal_year': period.fiscal_year,
+        'starting_date': period.starting_date,
+        'reporting_date': period.reporting_date,
+        'submission_date': period.submission_date,
+        'submission_time': period.submission_time,
+        'pay_date': period.pay_date,
+        'pay_time': period.pay_time,
+    }
+
+def timecard_json(activeuser, curr_period, create_update_ok, totals, entries):
+    """Returns the JSON representation of a timecard, entries are PayrollHours values()"""
+    return {
+        'user': {
+            'id': activeuser.pk,
+            'username': activeuser.username,
+            'first_name': activeuser.first_name,
+            'last_name': activeuser.last_name,
+            'vacation_hours': activeuser.vacation_hours,
+        },
+        'period': period_json(curr_period),
+        'create_update_ok': create_update_ok,
+        'totals': totals,
+        'all_hours_submitted': totals['submitted'] == totals['entries'],
+        'entries': list(entries),
+    }
+
+TIMECARD_ENTRY_FIELDS = [
+    'id', 'date_worked', 'starting_time', 'ending_time', 'minutes', 'vacation_hours',
+    'adjustment_mins', 'adjustment_approved', 'employee_submitted',
+]
+
+def timecard_etag(activeuser, curr_period, create_update_ok, marker, calendar):
+    """Returns the timecard ETag from the aggregate of the user's fiscal year PeriodTotals rows and the user's fields"""
+    # The names are free text, so they go in as a hash
+    names = hashlib.md5('\0'.join([activeuser.username, activeuser.first_name, activeuser.last_name]).encode(), usedforsecurity=False)
+    return (f"tc-{activeuser.pk}-{curr_period.pk}-{marker['rows']}-{marker['versions'] or 0}-{activeuser.vacation_hours}"
+            f"-{names.hexdigest()[:12]}-{int(create_update_ok)}-{calendar.version}")
+
+def conditional_validators(request, etag, last_modified=None):
+    """Returns (etag, timestamp, 304 Not Modified response or None if the client's validators don't match)"""
+    etag = f'"{etag}"'
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return etag, timestamp, get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+def set_validators(response, etag, timestamp):
+    """Adds the ETag, Last-Modified and Cache-Control headers to a response"""
+    response.headers['ETag'] = etag
+    if timestamp is not None:
+        response.headers['Last-Modified'] = http_date(timestamp)
+    # Clients must revalidate every time, the 304 is what makes polling cheap
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def conditional_json(request, etag, build_data, last_modified=None):
+    """Returns 304 Not Modified if the client's validators match, otherwise the JsonResponse of build_data()"""
+    etag, timestamp, response = conditional_validators(request, etag, last_modified)
+    if response is None:
+        response = JsonResponse(build_data())
+    return set_validators(response, etag, timestamp)
+
+@require_safe
+@login_required()
+def api_timecard(request, pk=None, year=None, month=None):
+    """JSON version of the ActiveUser_home timecard for a user's period"""
+    if request.user.pk == pk:
+        activeuser = request.user
+    elif request.user.is_staff or request.user.is_superuser:
+        activeuser = get_object_or_404(ActiveUser, pk=pk)
+    else:
+        raise PermissionDenied
+
+    curr_year, curr_month, create_update_ok = year_month(year, month)
+    calendar = get_calendar()
+    curr_period = calendar.period_for_start(date(curr_year, curr_month, 1))
+    if not curr_period:
+        raise Http404("Period doesn't exist")
+
+    # One query over the user's fiscal year rows: the vacation total makes the other periods part of the timecard
+    marker = PeriodTotals.objects.filter(user=activeuser, period__fiscal_year=curr_period.fiscal_year).aggregate(
+        rows=Count('id'), versions=Sum('version'), modified=Max('modified'),
+    )
+    etag = timecard_etag(activeuser, curr_period, create_update_ok, marker, calendar)
+
+    def build_data():
+        totals = period_totals(activeuser, curr_period)
+        entries = period_hours(activeuser, curr_period, *TIMECARD_ENTRY_FIELDS)
+        return timecard_json(activeuser, curr_period, create_update_ok, totals, entries)
+
+    return conditional_json(request, etag, build_data, last_modified=marker['modified'])
+
+@require_safe
+@login_required()
+def api_period_list(request, year=None):
+    """JSON list of the Periods for a calendar year"""
+    calendar = get_calendar()
+    return conditional_json(request, f'periods-{year}-{calendar.version}', lambda: {
+        'year': year,
+        'periods': [period_json(period) for period in calendar.periods_for_year(year)],
+    })
+
+@require_safe
+@login_required()
+def api_period_calendar(request):
+    """JSON calendar of every Period"""
+    calendar = get_calendar()
+    return conditional_json(request, f'calendar-{calendar.version}', lambda: {
+        'years': calendar.years,
+        'periods': [period_json(period) for period in calendar.periods],
+    })
+
 # See: https://stackoverflow.com/questions/65452345/how-to-change-status-by-a-link-or-a-button-in-django
 @require_http_methods(['POST'])
 @login_required()
@@ -211,9 +484,11 @@ def submit_hours(request, pk=None, pk_per=None, ):
     if (pk):
         activeuser = ActiveUser.objects.filter(pk=pk).get()
 
-    curr_period = Period.objects.filter(pk=pk_per).get()
-    if pk and curr_period:
-        PayrollHours.objects.filter(user = activeuser, period = curr_period.pk).update(employee_submitted=True)
+    curr_period = get_calendar().period_by_pk(pk_per)
+    if pk and curr_period and not curr_period.archived:
+        with immediate_atomic():
+            PayrollHours.objects.filter(user = activeuser, period = curr_period.pk).update(employee_submitted=True)
+            PeriodTotals.refresh(activeuser.pk, curr_period.pk)   # update() doesn't go through PayrollHours.save()
         
     return HttpResponseRedirect(reverse_lazy('activeuser-home', args=[pk, 0, 0]))
       
@@ -249,14 +524,21 @@ from django.forms import ModelForm, Form
 # Generic Form Views for Payroll Hours
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 
-class PayrollHoursCreate(LoginRequiredMixin, CreateView):
+class ImmediateWriteMixin:
+    """Validate and save a POST in one transaction that takes the SQLite write lock first, see sqlite_tuning.py"""
+
+    def post(self, request, *args, **kwargs):
+        with immediate_atomic():
+            return super().post(request, *args, **kwargs)
+
+class PayrollHoursCreate(LoginRequiredMixin, ImmediateWriteMixin, CreateView):
     """View to create a Payroll Hours entry"""
     model = PayrollHours
     form_class = PayrollHoursModelForm
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['curr_period'] = Period.objects.get(period=self.kwargs['pk'])
+        context['curr_period'] = get_calendar().period_by_pk(self.kwargs['pk'])
        
         return context
     
@@ -292,7 +574,12 @@ class PayrollHoursCreate(LoginRequiredMixin, CreateView):
         # See: https://stackoverflow.com/questions/48595913/how-to-access-form-data-in-formview-get-success-url
         self.form = form
         
-        return super(PayrollHoursCreate, self).form_valid(form)
+        try:
+            return super(PayrollHoursCreate, self).form_valid(form)
+        except ValidationError as e:
+            # Another entry used up the vacation allotment since the form was checked, see models.VacationLedger
+            form.add_error(None, e)
+            return self.form_invalid(form)
    
     def get_success_url(self):
         # See: https://stackoverflow.com/questions/48595913/how-to-access-form-data-in-formview-get-success-url
@@ -310,13 +597,13 @@ class PayrollHoursCreate(LoginRequiredMixin, CreateView):
 #        kwargs = super(PayrollHoursCreate, self).get_form_kwargs()
 #%%%        self.initial['period'] = kwargs['pk']   # len = 0
       
-class PayrollHoursUpdate(LoginRequiredMixin, UpdateView):
+class PayrollHoursUpdate(LoginRequiredMixin, ImmediateWriteMixin, UpdateView):
     model = PayrollHours
     form_class = PayrollHoursModelForm
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['curr_period'] = Period.objects.get(period=self.kwargs['pk_per'])
+        context['curr_period'] = get_calendar().period_by_pk(self.kwargs['pk_per'])
        
         return context
 
@@ -330,7 +617,11 @@ class PayrollHoursUpdate(LoginRequiredMixin, UpdateView):
         # See: PayrollHoursCreate above for why
         self.form = form
         
-        return super(PayrollHoursUpdate, self).form_valid(form)
+        try:
+            return super(PayrollHoursUpdate, self).form_valid(form)
+        except ValidationError as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
     
     def get_success_url(self):
         # See: PayrollHoursCreate above for why
@@ -342,7 +633,7 @@ class PayrollHoursUpdate(LoginRequiredMixin, UpdateView):
 #        user = self.request.user
 #        return reverse_lazy('activeuser-home', args=[user.pk, 0, 0])
     
-class PayrollHoursDelete(LoginRequiredMixin, DeleteView):
+class PayrollHoursDelete(LoginRequiredMixin, ImmediateWriteMixin, DeleteView):
     model = PayrollHours
     fields = ['user', 'period', 'date_worked', 'starting_time', 'ending_time', 'vacation_hours', 'adjustment_mins', 'employee_submitted']
     
@@ -359,6 +650,79 @@ class PayrollHoursDelete(LoginRequiredMixin, DeleteView):
             )
     
 
+# Bulk entry of Payroll Hours: a week or period of entries in one request
+# See: https://docs.djangoproject.com/en/4.2/topics/forms/formsets/
+class PayrollHoursBulkCreate(LoginRequiredMixin, generic.View):
+    """
+    Create several Payroll Hours entries at once.
+    Accepts the HTML formset or a JSON body {"entries": [{"date_worked": ..., "starting_time": ..., ...}, ...]}.
+    The entries are validated together and inserted with one bulk_create; JSON errors are returned per row.
+    """
+    template_name = 'timecard/payrollhours_bulk_form.html'
+
+    def get_formset(self, data=None):
+        return PayrollHoursFormSet(data, queryset=PayrollHours.objects.none(), form_kwargs={'user': self.request.user})
+
+    def json_formset_data(self):
+        """Convert the JSON entries to the formset's POST data, raises ValueError unless they are objects of scalars"""
+        body = json.loads(self.request.body)
+        entries = body.get('entries', []) if isinstance(body, dict) else body
+        if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+            raise ValueError('entries must be a list of objects')
+        # The form fields only take strings, numbers, booleans and null; a list or object would reach the field's
+        # to_python() and fail there
+        if any(isinstance(value, (list, dict)) for entry in entries for value in entry.values()):
+            raise ValueError('entry values must be strings, numbers, booleans or null')
+        prefix = PayrollHoursFormSet.get_default_prefix()
+        data = {
+            f'{prefix}-TOTAL_FORMS': len(entries),
+            f'{prefix}-INITIAL_FORMS': 0,
+        }
+        for index, entry in enumerate(entries):
+            for field_name, value in entry.items():
+                data[f'{prefix}-{index}-{field_name}'] = value
+        return data
+
+    def get(self, request, pk=None):
+        context = {'formset': self.get_formset(), 'curr_period': get_calendar().period_by_pk(pk)}
+        return render(request, self.template_name, context=context)
+
+    @immediate_atomic()     # See ImmediateWriteMixin
+    def post(self, request, pk=None):
+        is_json = (request.content_type == 'application/json')
+        if is_json:
+            try:
+                formset = self.get_formset(self.json_formset_data())
+            except ValueError:      # Includes json.JSONDecodeError
+                return JsonResponse({'error': 'Invalid JSON entries'}, status=400)
+        else:
+            formset = self.get_formset(request.POST)
+
+        if not formset.is_valid():
+            if is_json:
+                return JsonResponse({
+                    'errors': [form.errors.get_json_data() for form in formset.forms],
+                    'non_form_errors': formset.non_form_errors().get_json_data(),
+                }, status=400)
+            context = {'formset': formset, 'curr_period': get_calendar().period_by_pk(pk)}
+            return render(request, self.template_name, context=context)
+
+        entries = [form.save(commit=False) for form in formset.forms if form.has_changed()]
+        try:
+            created = PayrollHours.bulk_add(entries)
+        except ValidationError as e:
+            # Another entry used up the vacation allotment since the formset was checked, see models.VacationLedger
+            if is_json:
+                return JsonResponse({'errors': [], 'non_form_errors': e.messages}, status=400)
+            formset._non_form_errors = formset.error_class(e.messages, renderer=formset.renderer)
+            context = {'formset': formset, 'curr_period': get_calendar().period_by_pk(pk)}
+            return render(request, self.template_name, context=context)
+
+        if is_json:
+            return JsonResponse({'created': [entry.pk for entry in created]}, status=201)
+        user = created[0].user if created else request.user
+        return HttpResponseRedirect(reverse_lazy('activeuser-home', args=[user.pk, 0, 0]))
+
 # Generic Views for creating / deleting a period    
 class PeriodCreate(PermissionRequiredMixin, CreateView):
     """View to create a Period entry"""
@@ -0,0 +1,68 @@
+import logging
+import time
+from importlib import import_module
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateSyntaxError, engines
+from django.urls import get_resolver
+
+from .period_calendar import get_calendar
+
+#
+# Warm up a process before it takes traffic, so the first request after a deploy isn't the slow one.
+# gunicorn.conf.py calls warm_up() in the master once the application is preloaded: the URLconf, the compiled
+# templates and the Period calendar are then shared by the forked workers, and open_connections() is called in
+# each worker (database connections can't be shared across a fork).
+#
+
+logger = logging.getLogger('timecard.startup')
+
+# Imported by the views and the admin on their first use
+WARM_MODULES = ['timecard.views', 'timecard.async_views', 'timecard.forms', 'timecard.admin', 'phone_field.forms']
+
+def project_templates():
+    """Returns (engine, template name) for the templates under BASE_DIR, the admin's are loaded as they're used"""
+    for engine in engines.all():
+        for template_dir in engine.template_dirs:
+            template_dir = Path(template_dir)
+            if not template_dir.is_relative_to(settings.BASE_DIR):
+                continue
+            for path in sorted(template_dir.rglob('*.html')):
+                yield engine, path.relative_to(template_dir).as_posix()
+
+def load_templates():
+    """Compile the project's templates into the cached template loader, returns the number loaded"""
+    loaded = 0
+    for engine, name in project_templates():
+        try:
+            engine.get_template(name)
+            loaded += 1
+        except TemplateSyntaxError as e:
+            logger.warning('Template %s does not compile: %s', name, e)
+    return loaded
+
+def open_connections():
+    """Connect to every database, returns the number of connections"""
+    for connection in connections.all():
+        connection.ensure_connection()
+    return len(connections.all())
+
+def warm_up(connect=True):
+    """Load everything a request would load on first use, returns {step: milliseconds} and logs it"""
+    timings = {}
+
+    def step(name, function):
+        started = time.perf_counter()
+        function()
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    step('modules', lambda: [import_module(module) for module in WARM_MODULES])
+    step('urlconf', lambda: get_resolver().reverse_dict)    # Builds the reverse lookup of every URL pattern
+    step('templates', load_templates)
+    step('period_calendar', get_calendar)
+    if connect:
+        step('connections', open_connections)
+    logger.info('Warmed up in %.1f ms: %s', sum(timings.values()), timings)
+    return timings